@@ -0,0 +1,114 @@
+"""
+End-to-end benchmark of the Brain server over localhost.
+
+Starts `manage.py` in a child process, drives it with `SyntheticSensor` and reports packets/s ingested, flow
+windows (batches) scored per second, p50/p99/p999 verdict latency and the peak RSS of the server.
+
+Usage:
+    python -m benchmarks.brain [--serving-mode asyncio] [--backend numpy] [--micro-batching] \
+        [--connections 4] [--rate 1000] [--duration 10] [--output brain.json]
+"""
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+from benchmarks.report import save_results
+from benchmarks.sensor import SyntheticSensor, add_sensor_arguments
+
+MANAGE_PY = Path(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "manage.py")
+
+
+def wait_for_server(host: str, port: int, timeout: float):
+    """
+    Wait until the server accepts connections.
+
+    Raises:
+        TimeoutError: Raised if the server does not listen within `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+
+    raise TimeoutError(f"Server did not listen on {host}:{port} within {timeout} seconds")
+
+
+def run(server_arguments: list[str], port: int, sensor: SyntheticSensor, duration: float, drain_timeout: float,
+        startup_timeout: float = 60.0) -> dict:
+    """
+    Benchmark one server configuration.
+
+    Args:
+        server_arguments (list[str]): Extra `manage.py` arguments.
+        port (int): The port the server listens on.
+        sensor (SyntheticSensor): The load generator.
+        duration (float): Sending time in seconds.
+        drain_timeout (float): Longest wait for outstanding verdicts, in seconds.
+        startup_timeout (float, optional): Longest wait for the server to listen, in seconds. Defaults to 60.
+
+    Returns:
+        dict: The measurements of the sensor, plus the peak RSS of the server in MiB.
+    """
+    server = subprocess.Popen(
+        [sys.executable, str(MANAGE_PY), "--host", "127.0.0.1", "--port", str(port), *server_arguments],
+        cwd=MANAGE_PY.parent,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    try:
+        wait_for_server("127.0.0.1", port, startup_timeout)
+        results = sensor.run(duration, drain_timeout)
+    finally:
+        server.terminate()
+        server.wait()
+
+    # ru_maxrss is in KiB on Linux, and covers every child waited for, i.e. only the server.
+    results["server_peak_rss_mib"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the Brain server over localhost.")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--serving-mode", choices=("threaded", "asyncio"), default="threaded")
+    parser.add_argument("--backend", choices=("keras", "numpy"), default="numpy")
+    parser.add_argument("--inference-workers", type=int, default=0)
+    parser.add_argument("--micro-batching", action="store_true")
+    add_sensor_arguments(parser)
+    args = parser.parse_args()
+
+    server_arguments = [
+        "--serving-mode", args.serving_mode,
+        "--backend", args.backend,
+        "--inference-workers", str(args.inference_workers),
+    ]
+    if args.micro_batching:
+        server_arguments.append("--micro-batching")
+
+    sensor = SyntheticSensor(
+        "127.0.0.1",
+        args.port,
+        connections=args.connections,
+        rate=args.rate,
+        flows=args.flows,
+        distribution=args.distribution,
+        zipf_exponent=args.zipf_exponent,
+        seq_length=args.seq_length
+    )
+    results = run(server_arguments, args.port, sensor, args.duration, args.drain_timeout)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        save_results(args.output, "brain", vars(args), results)
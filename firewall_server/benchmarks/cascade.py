@@ -0,0 +1,133 @@
+"""
+Measure the cost/accuracy trade-off of `CascadeThreadDetection` on recorded traffic.
+
+The flow windows of pcap captures are cut like the Brain server cuts live traffic, and every window is rated by the
+cascade with an audit rate of 1, so each window the pre-screen passes is also scored by the model. The report gives
+the escalation rate (the share of windows the model still has to score) and the agreement (the share of passed
+windows the model also finds benign) for every combination of thresholds, with the speedup of an unaudited cascade
+over the model alone.
+
+Usage:
+    python -m benchmarks.cascade capture.pcap [--size-z 2 3 4] [--rate-z 3] [--fanout 32] [--backend numpy]
+"""
+import json
+import time
+from argparse import ArgumentParser
+from itertools import product
+
+from benchmarks.report import save_results
+from firewall.LSTM import CascadeThreadDetection, LSTMPacketThreadDetection
+from firewall.pcap import PcapReader
+from server.flows import FlowTable, FlowWindow
+
+
+def read_windows(paths: list[str], seq_length: int) -> list[FlowWindow]:
+    """
+    Cut the packets of captures into the flow windows the Brain server would score.
+    """
+    flows = FlowTable(window_size=seq_length + 1, idle_timeout=float("inf"), max_memory=1 << 30)
+    windows = []
+
+    for path in paths:
+        with PcapReader(path) as reader:
+            for batch in reader.batches():
+                windows.extend(flows.add_batch(path, batch))
+
+    return windows
+
+
+def run(
+        detector: LSTMPacketThreadDetection,
+        windows: list[FlowWindow],
+        size_z: list[float],
+        rate_z: list[float],
+        fanout: list[int]
+) -> list[dict]:
+    """
+    Rate the windows through a fully audited cascade for every combination of thresholds.
+
+    Args:
+        detector (LSTMPacketThreadDetection): The second stage.
+        windows (list[FlowWindow]): The windows, in capture order.
+        size_z (list[float]): The packet size z-score thresholds to try.
+        rate_z (list[float]): The packet rate z-score thresholds to try.
+        fanout (list[int]): The fan-out thresholds to try.
+
+    Returns:
+        list[dict]: The cascade statistics of every combination, with the time it takes to rate every window
+            against the time the model alone takes.
+    """
+    results = []
+
+    started_at = time.perf_counter()
+    for window in windows:
+        detector.assess_batch(window.to_batch())
+    model_seconds = time.perf_counter() - started_at
+
+    for size_threshold, rate_threshold, fanout_threshold in product(size_z, rate_z, fanout):
+        def cascade(audit_rate: float) -> CascadeThreadDetection:
+            return CascadeThreadDetection(
+                detector,
+                size_z=size_threshold,
+                rate_z=rate_threshold,
+                fanout_threshold=fanout_threshold,
+                audit_rate=audit_rate
+            )
+
+        # A fully audited pass measures the agreement, an unaudited one the cost.
+        audited = cascade(1.0)
+        for window in windows:
+            audited.assess_batch(window.to_batch())
+
+        unaudited = cascade(0.0)
+        started_at = time.perf_counter()
+        for window in windows:
+            unaudited.assess_batch(window.to_batch())
+        cascade_seconds = time.perf_counter() - started_at
+
+        stats = audited.stats()
+        results.append({
+            "size_z": size_threshold,
+            "rate_z": rate_threshold,
+            "fanout": fanout_threshold,
+            "windows": stats["windows"],
+            "escalation_rate": stats["escalation_rate"],
+            "escalations": stats["escalations"],
+            "agreement": stats["agreement"],
+            "cascade_seconds": cascade_seconds,
+            "model_seconds": model_seconds,
+        })
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Measure the escalation rate and agreement of the cascade on captures.")
+    parser.add_argument("captures", nargs="+", help="The pcap files, in capture order.")
+    parser.add_argument("--size-z", type=float, nargs="+", default=[3.0])
+    parser.add_argument("--rate-z", type=float, nargs="+", default=[3.0])
+    parser.add_argument("--fanout", type=int, nargs="+", default=[32])
+    parser.add_argument("--backend", choices=LSTMPacketThreadDetection.BACKENDS, default="numpy")
+    parser.add_argument("--output", default=None, help="Save the results to this JSON file.")
+    args = parser.parse_args()
+
+    detector = LSTMPacketThreadDetection(backend=args.backend)
+    results = run(
+        detector, read_windows(args.captures, detector.seq_length), args.size_z, args.rate_z, args.fanout
+    )
+
+    print(
+        f"{'size_z':>7} {'rate_z':>7} {'fanout':>7} {'windows':>9} {'escalated':>10} {'agreement':>10} "
+        f"{'speedup':>8}"
+    )
+    for result in results:
+        print(
+            f"{result['size_z']:>7} {result['rate_z']:>7} {result['fanout']:>7} {result['windows']:>9} "
+            f"{result['escalation_rate']:>10.1%} {result['agreement']:>10.1%} "
+            f"{result['model_seconds'] / result['cascade_seconds']:>7.1f}x"
+        )
+
+    if args.output:
+        save_results(args.output, "cascade", vars(args), results)
+    else:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,126 @@
+"""
+Micro-benchmarks of the LSTMPacketThreadDetection hot path.
+
+Times `preprocess_input` and `_get_traffic_rating` on DataFrames built like `predict` builds them (string
+timestamps), and `predict_batch` on the same packets as a `PacketBatch`.
+
+Usage:
+    python -m benchmarks.detector [--sizes 11 100 1000 10000] [--backend numpy] [--repeat 20] [--output detector.json]
+"""
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from benchmarks.report import save_results
+from firewall.LSTM import LSTMPacketThreadDetection
+from firewall.batch import PacketBatch, format_timestamp, pack_ip
+
+
+def make_packets(size: int, seed: int = 0) -> dict[str, list]:
+    """
+    Generate the `predict` arguments for `size` packets of one flow.
+    """
+    rng = np.random.default_rng(seed)
+    start = time.mktime((2023, 9, 24, 10, 0, 0, 0, 0, -1))
+
+    return {
+        "timestamps": [format_timestamp(int(start) + second) for second in range(size)],
+        "packet_sizes": rng.integers(60, 1500, size).tolist(),
+        "source_ip": ["10.0.0.1"] * size,
+        "destination_ip": ["192.168.1.1"] * size,
+        "source_port": [40000] * size,
+        "destination_port": [443] * size,
+    }
+
+
+def to_batch(packets: dict[str, list]) -> PacketBatch:
+    """
+    Convert `predict` arguments into a packet batch.
+    """
+    return PacketBatch.from_columns(
+        timestamps=np.array([time.mktime(time.strptime(value, "%Y-%m-%d %H:%M:%S")) for value in packets["timestamps"]]),
+        sizes=np.array(packets["packet_sizes"]),
+        source_ip=np.array([pack_ip(address) for address in packets["source_ip"]]),
+        destination_ip=np.array([pack_ip(address) for address in packets["destination_ip"]]),
+        source_port=np.array(packets["source_port"]),
+        destination_port=np.array(packets["destination_port"])
+    )
+
+
+def best_of(function, setup, repeats: int) -> tuple[float, float]:
+    """
+    Time `function(setup())`, excluding `setup`, and return the best and median time in seconds.
+    """
+    timings = []
+
+    for _ in range(repeats):
+        argument = setup()
+        started_at = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - started_at)
+
+    return min(timings), float(np.median(timings))
+
+
+def run(detector: LSTMPacketThreadDetection, sizes: list[int], repeats: int) -> list[dict]:
+    """
+    Time the detector stages for every batch size.
+
+    Args:
+        detector (LSTMPacketThreadDetection): The detector to benchmark.
+        sizes (list[int]): The batch sizes, in packets.
+        repeats (int): How many times each measurement is repeated.
+
+    Returns:
+        list[dict]: One result per batch size, with the best and median time of every stage in seconds.
+    """
+    results = []
+
+    for size in sizes:
+        packets = make_packets(size)
+        batch = to_batch(packets)
+
+        def frame():
+            return detector._to_frame(**packets)
+
+        result = {"packets": size}
+        for name, function, setup in (
+                ("to_frame", lambda _: frame(), lambda: None),
+                ("preprocess_input", detector.preprocess_input, frame),
+                ("get_traffic_rating", detector._get_traffic_rating, frame),
+                ("prepare_batch_windows", detector.prepare_batch_windows, lambda: batch),
+                ("predict_batch", detector.predict_batch, lambda: batch),
+        ):
+            best, median = best_of(function, setup, repeats)
+            result[f"{name}_best_seconds"] = best
+            result[f"{name}_median_seconds"] = median
+
+        results.append(result)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the LSTM detector stages.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[11, 100, 1_000, 10_000])
+    parser.add_argument("--backend", choices=LSTMPacketThreadDetection.BACKENDS, default="numpy")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", default=None, help="Save the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = run(LSTMPacketThreadDetection(backend=args.backend), args.sizes, args.repeat)
+
+    print(f"{'packets':>8} {'to_frame':>12} {'preprocess':>12} {'rating':>12} {'batch win':>12} {'batch pred':>12}")
+    for result in results:
+        print(
+            f"{result['packets']:>8} " +
+            " ".join(
+                f"{result[f'{name}_best_seconds'] * 1e3:>10.3f}ms"
+                for name in ("to_frame", "preprocess_input", "get_traffic_rating", "prepare_batch_windows",
+                             "predict_batch")
+            )
+        )
+
+    if args.output:
+        save_results(args.output, "detector", vars(args), results)
@@ -0,0 +1,28 @@
+import json
+import platform
+import sys
+from datetime import datetime
+from pathlib import Path
+
+
+def save_results(path: Path | str, benchmark: str, parameters: dict, results: list[dict] | dict):
+    """
+    Save benchmark results as JSON, along with what is needed to compare them with another run.
+
+    Args:
+        path (Path | str): The file to write.
+        benchmark (str): The name of the benchmark.
+        parameters (dict): The parameters the benchmark ran with.
+        results (list[dict] | dict): The measurements.
+    """
+    document = {
+        "benchmark": benchmark,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "parameters": parameters,
+        "results": results,
+    }
+
+    Path(path).write_text(json.dumps(document, indent=2) + "\n")
@@ -0,0 +1,317 @@
+"""
+Synthetic sensor that streams packets to a Brain server like the Qt front end does.
+
+Every packet is sent as the indented, key-sorted JSON written by `MainWindow::packetHandler`. Each connection asks
+for binary verdict replies, so the latency between the packet that completes a flow window and its verdict can be
+measured.
+
+Usage:
+    python -m benchmarks.sensor --host 127.0.0.1 --port 1234 [--connections 4] [--rate 1000] [--duration 10]
+"""
+import json
+import socket
+import time
+from argparse import ArgumentParser
+from collections import defaultdict, deque
+from threading import Lock, Thread
+
+import numpy as np
+
+from benchmarks.report import save_results
+from firewall.batch import pack_ip
+from server.protocol import VERDICT_HEADER, VERDICT_MAGIC, VERDICT_RECORD
+
+DISTRIBUTIONS: tuple[str, ...] = ("uniform", "zipf")
+DESTINATION_PORTS: tuple[int, ...] = (80, 443, 22, 53, 8080)
+
+
+def packet_json(
+        source_ip: str,
+        destination_ip: str,
+        source_port: int,
+        destination_port: int,
+        timestamp: float,
+        length: int
+) -> bytes:
+    """
+    Encode a packet the way `MainWindow::packetHandler` does (`QJsonDocument::toJson`, indented and key-sorted).
+
+    Args:
+        source_ip (str): The source address.
+        destination_ip (str): The destination address.
+        source_port (int): The source port.
+        destination_port (int): The destination port.
+        timestamp (float): Capture time in epoch seconds.
+        length (int): The packet length in bytes.
+
+    Returns:
+        bytes: The UTF-8 encoded JSON document, newline-terminated.
+    """
+    return (json.dumps({
+        "SourceIP": source_ip,
+        "DestinationIP": destination_ip,
+        "SourcePort": source_port,
+        "DestinationPort": destination_port,
+        "Timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)),
+        "Length": length
+    }, indent=4, sort_keys=True) + "\n").encode("utf-8")
+
+
+def percentile_ms(latencies: list[float], percentile: float) -> float | None:
+    """
+    Compute a latency percentile in milliseconds, None without samples.
+    """
+    return float(np.percentile(latencies, percentile) * 1e3) if latencies else None
+
+
+class SyntheticSensor:
+    """
+    Load generator emulating any number of Qt sensors.
+
+    Every connection owns `flows` flows and picks the flow of each packet from a uniform or Zipf distribution,
+    so a few flows can be made to carry most of the traffic. Packets are paced to `rate` per second and
+    connection, or sent as fast as the server reads them when `rate` is 0.
+
+    The server scores a flow every `seq_length + 1` packets, so the sensor knows which packet completes a
+    window and times the verdict that answers it.
+
+    Args:
+        host (str): The address of the server.
+        port (int): The port of the server.
+        connections (int, optional): Number of concurrent sensor connections. Defaults to 4.
+        rate (float, optional): Packets per second and connection, 0 for unthrottled. Defaults to 1000.
+        flows (int, optional): Flows per connection. Defaults to 64.
+        distribution (str, optional): "uniform" or "zipf". Defaults to "uniform".
+        zipf_exponent (float, optional): Exponent of the Zipf distribution. Defaults to 1.2.
+        seq_length (int, optional): Sequence length of the server's detector. Defaults to 10.
+        max_burst (int, optional): Most packets written with one `sendall`. Defaults to 256.
+        seed (int, optional): Seed of the packet generator. Defaults to 0.
+
+    Methods:
+        run(duration, drain_timeout): Sends packets for `duration` seconds and returns the measurements.
+    """
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            connections: int = 4,
+            rate: float = 1000,
+            flows: int = 64,
+            distribution: str = "uniform",
+            zipf_exponent: float = 1.2,
+            seq_length: int = 10,
+            max_burst: int = 256,
+            seed: int = 0
+    ):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"distribution must be one of {DISTRIBUTIONS}")
+
+        self.host = host
+        self.port = port
+        self.connections = connections
+        self.rate = rate
+        self.flows = flows
+        self.distribution = distribution
+        self.zipf_exponent = zipf_exponent
+        self.window_size = seq_length + 1
+        self.max_burst = max_burst
+        self.seed = seed
+
+        self._lock = Lock()
+        self._latencies: list[float] = []
+        self._packets_sent = 0
+        self._verdicts = 0
+        self._unanswered = 0
+
+    def _flow_weights(self) -> np.ndarray:
+        """
+        Return the probability of every flow of a connection.
+        """
+        if self.distribution == "uniform":
+            return np.full(self.flows, 1 / self.flows)
+
+        weights = 1 / np.arange(1, self.flows + 1) ** self.zipf_exponent
+        return weights / weights.sum()
+
+    def run(self, duration: float, drain_timeout: float = 5.0) -> dict:
+        """
+        Send packets on every connection for `duration` seconds, then wait for the outstanding verdicts.
+
+        Args:
+            duration (float): Sending time in seconds.
+            drain_timeout (float, optional): Longest wait for outstanding verdicts, in seconds. Defaults to 5.
+
+        Returns:
+            dict: Packets sent, verdicts received, their rates over the run and the verdict latency percentiles.
+        """
+        threads = [
+            Thread(target=self._run_connection, args=(index, duration, drain_timeout), daemon=True)
+            for index in range(self.connections)
+        ]
+
+        started_at = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started_at
+
+        return {
+            "elapsed_seconds": elapsed,
+            "packets_sent": self._packets_sent,
+            "packets_per_second": self._packets_sent / elapsed,
+            "verdicts": self._verdicts,
+            "verdicts_per_second": self._verdicts / elapsed,
+            "unanswered_windows": self._unanswered,
+            "latency_p50_ms": percentile_ms(self._latencies, 50),
+            "latency_p99_ms": percentile_ms(self._latencies, 99),
+            "latency_p999_ms": percentile_ms(self._latencies, 99.9),
+        }
+
+    def _run_connection(self, index: int, duration: float, drain_timeout: float):
+        """
+        Stream packets on one connection while a receiver thread times the verdicts.
+        """
+        rng = np.random.default_rng(self.seed + index)
+        weights = self._flow_weights()
+
+        flows = [
+            (
+                f"10.{index % 256}.{flow // 256 % 256}.{flow % 256}",
+                "192.168.1.1",
+                1024 + flow % 64000,
+                DESTINATION_PORTS[flow % len(DESTINATION_PORTS)]
+            )
+            for flow in range(self.flows)
+        ]
+        keys = [(pack_ip(src), pack_ip(dst), sport, dport) for src, dst, sport, dport in flows]
+        packet_counts = [0] * self.flows
+
+        # Send times of the packets that complete a window, per flow, oldest first.
+        pending: defaultdict[tuple, deque[float]] = defaultdict(deque)
+        pending_lock = Lock()
+        latencies: list[float] = []
+        verdicts = 0
+
+        client = socket.create_connection((self.host, self.port))
+        client.sendall(b'{"ReplyFormat": "binary"}\n')
+
+        def receive():
+            nonlocal verdicts
+            buffer = bytearray()
+
+            while True:
+                try:
+                    data = client.recv(65536)
+                except OSError:
+                    return
+                if not data:
+                    return
+                buffer += data
+
+                while len(buffer) >= VERDICT_HEADER.size:
+                    magic, _, _, count = VERDICT_HEADER.unpack_from(buffer)
+                    if magic != VERDICT_MAGIC:
+                        raise RuntimeError("Server did not answer with binary verdicts")
+
+                    size = VERDICT_HEADER.size + count * VERDICT_RECORD.size
+                    if len(buffer) < size:
+                        break
+
+                    received_at = time.monotonic()
+                    with pending_lock:
+                        for offset in range(VERDICT_HEADER.size, size, VERDICT_RECORD.size):
+                            key = VERDICT_RECORD.unpack_from(buffer, offset)[:4]
+                            if pending[key]:
+                                latencies.append(received_at - pending[key].popleft())
+                        verdicts += count
+
+                    del buffer[:size]
+
+        receiver = Thread(target=receive, daemon=True)
+        receiver.start()
+
+        started_at = time.monotonic()
+        sent = 0
+
+        while (now := time.monotonic()) - started_at < duration:
+            due = min(self.max_burst, int((now - started_at) * self.rate) - sent if self.rate else self.max_burst)
+            if due <= 0:
+                time.sleep(min(0.001, 1 / self.rate))
+                continue
+
+            payload = []
+            triggers = []
+            timestamp = time.time()
+            for flow in rng.choice(self.flows, size=due, p=weights).tolist():
+                payload.append(packet_json(*flows[flow], timestamp, int(rng.integers(60, 1500))))
+
+                packet_counts[flow] += 1
+                if packet_counts[flow] % self.window_size == 0:
+                    triggers.append(keys[flow])
+
+            sent_at = time.monotonic()
+            with pending_lock:
+                for key in triggers:
+                    pending[key].append(sent_at)
+
+            client.sendall(b"".join(payload))
+            sent += due
+
+        deadline = time.monotonic() + drain_timeout
+        while time.monotonic() < deadline:
+            with pending_lock:
+                if not any(pending.values()):
+                    break
+            time.sleep(0.01)
+
+        # Unblocks the receiver, which close() alone does not.
+        client.shutdown(socket.SHUT_RDWR)
+        receiver.join()
+        client.close()
+
+        with self._lock:
+            self._latencies.extend(latencies)
+            self._packets_sent += sent
+            self._verdicts += verdicts
+            self._unanswered += sum(len(times) for times in pending.values())
+
+
+def add_sensor_arguments(parser: ArgumentParser):
+    """
+    Add the load generator options to a command line parser.
+    """
+    parser.add_argument("--connections", type=int, default=4, help="Concurrent sensor connections.")
+    parser.add_argument("--rate", type=float, default=1000, help="Packets per second and connection (0: unthrottled).")
+    parser.add_argument("--flows", type=int, default=64, help="Flows per connection.")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="uniform", help="Flow popularity.")
+    parser.add_argument("--zipf-exponent", type=float, default=1.2)
+    parser.add_argument("--seq-length", type=int, default=10, help="Sequence length of the server's detector.")
+    parser.add_argument("--duration", type=float, default=10, help="Sending time in seconds.")
+    parser.add_argument("--drain-timeout", type=float, default=5, help="Longest wait for outstanding verdicts.")
+    parser.add_argument("--output", default=None, help="Save the results to this JSON file.")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Stream synthetic sensor traffic to a running Brain server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    add_sensor_arguments(parser)
+    args = parser.parse_args()
+
+    sensor = SyntheticSensor(
+        args.host,
+        args.port,
+        connections=args.connections,
+        rate=args.rate,
+        flows=args.flows,
+        distribution=args.distribution,
+        zipf_exponent=args.zipf_exponent,
+        seq_length=args.seq_length
+    )
+    results = sensor.run(args.duration, args.drain_timeout)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        save_results(args.output, "sensor", vars(args), results)
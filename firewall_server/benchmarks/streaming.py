@@ -0,0 +1,130 @@
+"""
+Measure the per-packet cost and the verdict differences of `StreamingScorer` against window scoring.
+
+The packets of pcap captures are streamed through the scorer in their capture batches, once per reset interval, in
+equivalence mode: every `seq_length + 1` packet window of a flow is also scored from its model input sequence and
+compared with the running score of the flow. The per-packet cost of streaming, timed in a second pass without the
+comparison, is set against scoring a full window for every packet, which is what a per-packet verdict costs
+without carried state.
+
+Usage:
+    python -m benchmarks.streaming capture.pcap [--reset-interval 0 11] [--max-flows 16384]
+"""
+import json
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from benchmarks.report import save_results
+from firewall.LSTM import LSTMPacketThreadDetection
+from firewall.batch import PacketBatch
+from firewall.pcap import PcapReader
+from firewall.quantization import capture_sequences
+from firewall.streaming import StreamingScorer
+
+
+def read_batches(paths: list[str]) -> list[PacketBatch]:
+    """
+    Read the packet batches of captures, in capture order.
+    """
+    batches = []
+
+    for path in paths:
+        with PcapReader(path) as reader:
+            batches.extend(reader.batches())
+
+    return batches
+
+
+def window_seconds_per_packet(detector: LSTMPacketThreadDetection, sequences: np.ndarray, batch_size: int) -> float:
+    """
+    Time scoring one full window per packet, in model calls of `batch_size` windows.
+    """
+    started_at = time.perf_counter()
+    for start in range(0, len(sequences), batch_size):
+        detector.score_windows(sequences[start:start + batch_size])
+
+    return (time.perf_counter() - started_at) / len(sequences)
+
+
+def run(
+        detector: LSTMPacketThreadDetection,
+        batches: list[PacketBatch],
+        reset_intervals: list[int | None],
+        max_flows: int
+) -> list[dict]:
+    """
+    Stream the batches once per reset interval, with and without the equivalence check.
+
+    Args:
+        detector (LSTMPacketThreadDetection): The detector, on the "numpy" backend.
+        batches (list[PacketBatch]): The packet batches, in capture order.
+        reset_intervals (list[int | None]): The reset intervals to try; None carries the state of a flow forever.
+        max_flows (int): The most flows whose state is kept.
+
+    Returns:
+        list[dict]: Per reset interval, the scorer statistics in equivalence mode and the seconds per packet of an
+            unchecked pass.
+    """
+    results = []
+
+    for reset_interval in reset_intervals:
+        checked = StreamingScorer(detector, max_flows=max_flows, reset_interval=reset_interval, validate=True)
+        for batch in batches:
+            checked.score_batch("capture", batch)
+
+        unchecked = StreamingScorer(detector, max_flows=max_flows, reset_interval=reset_interval)
+        started_at = time.perf_counter()
+        for batch in batches:
+            unchecked.score_batch("capture", batch)
+        elapsed = time.perf_counter() - started_at
+
+        stats = checked.stats()
+        results.append({
+            "reset_interval": reset_interval,
+            **stats,
+            "seconds_per_packet": elapsed / stats["packets"] if stats["packets"] else float("nan"),
+        })
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Compare streaming LSTM scoring with window scoring on captures.")
+    parser.add_argument("captures", nargs="+", help="The pcap files, in capture order.")
+    parser.add_argument(
+        "--reset-interval",
+        type=int,
+        nargs="+",
+        default=[0, 11],
+        help="Packets after which a flow state restarts; 0 never restarts it."
+    )
+    parser.add_argument("--max-flows", type=int, default=16384, help="The most flows whose state is kept.")
+    parser.add_argument("--window-batch-size", type=int, default=512, help="Windows per model call when timing.")
+    parser.add_argument("--output", default=None, help="Save the results to this JSON file.")
+    args = parser.parse_args()
+
+    detector = LSTMPacketThreadDetection(backend="numpy")
+    packet_batches = read_batches(args.captures)
+    results = run(
+        detector, packet_batches, [interval or None for interval in args.reset_interval], args.max_flows
+    )
+
+    sequences = capture_sequences(args.captures, detector)
+    window_cost = window_seconds_per_packet(detector, sequences, args.window_batch_size) if len(sequences) else None
+
+    print(f"{'reset':>6} {'packets':>9} {'windows':>8} {'us/packet':>10} {'mean error':>11} {'mismatch':>9}")
+    for result in results:
+        print(
+            f"{result['reset_interval'] or '-':>6} {result['packets']:>9} {result['windows']:>8} "
+            f"{result['seconds_per_packet'] * 1e6:>10.1f} {result['mean_abs_error']:>11.2e} "
+            f"{result['verdict_mismatch']:>9.2%}"
+        )
+    if window_cost is not None:
+        print(f"Window scoring: {window_cost * 1e6:.1f} us per packet")
+
+    if args.output:
+        save_results(args.output, "streaming", vars(args), {"streaming": results, "window_seconds": window_cost})
+    else:
+        print(json.dumps({"streaming": results, "window_seconds": window_cost}, indent=2))
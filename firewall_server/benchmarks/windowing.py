@@ -0,0 +1,95 @@
+"""
+Compare the LSTM input windowing of `LSTMPacketThreadDetection._get_traffic_rating` before and after it moved to
+strided views.
+
+Usage:
+    python -m benchmarks.windowing [--sizes 100 1000 10000 100000] [--seq-length 10] [--repeat 5] [--output windowing.json]
+"""
+from argparse import ArgumentParser
+from timeit import repeat
+
+import numpy as np
+
+from benchmarks.report import save_results
+from firewall.windowing import sliding_windows
+
+
+def loop_windows(input_data: np.ndarray, seq_length: int) -> np.ndarray:
+    """
+    Build the LSTM input sequences with the original per-window Python loop.
+
+    Args:
+        input_data (np.ndarray): Preprocessed features of shape (n, features).
+        seq_length (int): Length of the input sequence for the LSTM model.
+
+    Returns:
+        np.ndarray: A new array of shape (n - seq_length, seq_length, features).
+    """
+    x_input_seq = []
+
+    for i in range(seq_length, len(input_data)):
+        x_input_seq.append(input_data[i - seq_length:i])
+
+    return np.array(x_input_seq)
+
+
+def run(sizes: list[int], seq_length: int, repeats: int) -> list[dict]:
+    """
+    Time both windowing paths for every batch size.
+
+    Args:
+        sizes (list[int]): The batch sizes, in packets.
+        seq_length (int): Length of the input sequence for the LSTM model.
+        repeats (int): How many times each measurement is repeated; the best run is kept.
+
+    Returns:
+        list[dict]: One result per batch size, with the best time of each path in seconds.
+    """
+    results = []
+
+    for size in sizes:
+        input_data = np.random.default_rng(size).standard_normal((size, 3))
+
+        expected = loop_windows(input_data, seq_length)
+        if not np.array_equal(expected, sliding_windows(input_data, seq_length)):
+            raise AssertionError(f"Windowing paths disagree for {size} packets")
+
+        number = max(1, 100_000 // size)
+        loop_time = min(repeat(lambda: loop_windows(input_data, seq_length), number=number, repeat=repeats)) / number
+        view_time = min(repeat(lambda: sliding_windows(input_data, seq_length), number=number, repeat=repeats)) / number
+        copy_time = min(
+            repeat(lambda: np.ascontiguousarray(sliding_windows(input_data, seq_length)), number=number, repeat=repeats)
+        ) / number
+
+        results.append({
+            "packets": size,
+            "loop_seconds": loop_time,
+            "strided_view_seconds": view_time,
+            "strided_copy_seconds": copy_time,
+        })
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark LSTM input windowing.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000, 100_000])
+    parser.add_argument("--seq-length", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None, help="Save the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.seq_length, args.repeat)
+
+    print(f"{'packets':>10} {'loop':>12} {'view':>12} {'view+copy':>12} {'speedup':>9}")
+    for result in results:
+        print(
+            f"{result['packets']:>10} "
+            f"{result['loop_seconds'] * 1e3:>10.3f}ms "
+            f"{result['strided_view_seconds'] * 1e3:>10.3f}ms "
+            f"{result['strided_copy_seconds'] * 1e3:>10.3f}ms "
+            f"{result['loop_seconds'] / result['strided_view_seconds']:>8.0f}x"
+        )
+
+    if args.output:
+        save_results(args.output, "windowing", vars(args), results)
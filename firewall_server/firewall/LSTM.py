@@ -1,18 +1,120 @@
+import math
 import os
 import random
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
+from threading import Lock
 
 import numpy as np
 import pandas as pd
-from keras.models import load_model
-from sklearn.preprocessing import StandardScaler
+
+from firewall.batch import PacketBatch
+from firewall.numpy_lstm import PRECISIONS, NumpyLSTMModel
+from firewall.windowing import sliding_windows
+
+# Origin of the timestamp feature of `preprocess_input`.
+TIMESTAMP_ORIGIN = datetime(2023, 1, 1)
 
 
 class ThreadDetection:
-    """Base class for traffic thread detection."""
+    """
+    Base class for traffic thread detection.
+
+    Attributes:
+        seq_length (int): The number of consecutive packets the detector reads as one input window.
+        scaler (FeatureScaler | None): The feature scaler of detectors that score model input sequences, which can
+            then be prepared incrementally (see `firewall.features`); None for other detectors.
+
+    Methods:
+        predict_batch(batch): Predicts if the packets of a batch are malicious or safe.
+        assess_batch(batch): Returns the traffic rating of a batch along with its score.
+        assess_windows(windows): Returns the traffic rating of prepared model input sequences along with their score.
+    """
+
+    seq_length: int = 10
+    scaler: "FeatureScaler | None" = None
+
+    def predict_batch(self, batch: PacketBatch):
+        """
+        Predicts if the packets of a batch are malicious or safe.
+
+        Detectors that only implement `predict` get the batch expanded into lists.
+
+        Args:
+            batch (PacketBatch): The packets to rate.
+
+        Returns:
+            int: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe).
+        """
+        packet_data = batch.as_packet_data()
+
+        return self.predict(
+            timestamps=packet_data["Timestamp"],
+            packet_sizes=packet_data["PacketSize"],
+            source_ip=packet_data["SourceIP"],
+            destination_ip=packet_data["DestinationIP"],
+            source_port=packet_data["SourcePort"],
+            destination_port=packet_data["DestinationPort"],
+        )
+
+    def assess_batch(self, batch: PacketBatch) -> tuple:
+        """
+        Returns the traffic rating of a batch along with its score.
+
+        Detectors without a model score report NaN.
+
+        Args:
+            batch (PacketBatch): The packets to rate.
 
-    pass
+        Returns:
+            tuple: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe) and average model prediction.
+        """
+        return self.predict_batch(batch), float("nan")
+
+    def assess_windows(self, windows: np.ndarray) -> tuple:
+        """
+        Returns the traffic rating of prepared model input sequences along with their score.
+
+        Only detectors with a `scaler` implement it.
+
+        Args:
+            windows (np.ndarray): Input sequences of shape (n, seq_length, 3).
+
+        Returns:
+            tuple: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe) and average model prediction.
+        """
+        raise NotImplementedError("Please implement assess_windows")
+
+
+class FeatureScaler:
+    """
+    Standardizes features with a fixed mean and scale, like a fitted `sklearn.preprocessing.StandardScaler`.
+
+    Args:
+        mean (list of float): Mean of every feature.
+        scale (list of float): Standard deviation of every feature.
+
+    Attributes:
+        mean_ (np.ndarray): Mean of every feature.
+        scale_ (np.ndarray): Standard deviation of every feature.
+    """
+
+    def __init__(self, mean: list[float], scale: list[float]):
+        self.mean_ = np.asarray(mean, dtype=np.float64)
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+
+    def transform(self, x) -> np.ndarray:
+        """
+        Standardizes features.
+
+        Args:
+            x (array-like): Features of shape (n, features).
+
+        Returns:
+            np.ndarray: The standardized features.
+        """
+        return (np.asarray(x, dtype=np.float64) - self.mean_) / self.scale_
 
 
 class LSTMPacketThreadDetection(ThreadDetection):
@@ -22,29 +124,48 @@ class LSTMPacketThreadDetection(ThreadDetection):
     This class is designed to detect malicious network traffic threads using an LSTM-based model.
 
     Args:
-        model_path (str or Path, optional): Path to the pre-trained LSTM model. Defaults to None.
+        model_path (str or Path, optional): Path to the pre-trained LSTM model. Defaults to None, which picks
+            `pre_trained_models/LSTM.keras` or `pre_trained_models/LSTM.npz` depending on `backend`.
         seq_length (int, optional): Length of the input sequence for the LSTM model. Defaults to 10.
         mean (list of float, optional): Mean values for feature scaling. Defaults to None.
         scale (list of float, optional): Scale values for feature scaling. Defaults to None.
         min_data_len (int, optional): Minimum required data length. Defaults to 20.
         flagged_threshold (float, optional): Threshold for flagging traffic as suspicious. Defaults to 0.5.
         unsafe_threshold (float, optional): Threshold for flagging traffic as unsafe or malicious. Defaults to 0.9.
+        backend (str, optional): "keras" to run the model through Keras, or "numpy" to run weights exported by
+            `firewall.numpy_lstm` without importing Keras. Defaults to "keras".
+        precision (str, optional): Precision of the weight matrices of the "numpy" backend: "float32", "float16"
+            or "int8" (per-channel scales, see `firewall.quantization`). Weights saved quantized, e.g. by
+            `python -m firewall.quantization calibrate`, keep their precision. Defaults to "float32".
 
     Raises:
-        ValueError: Raised if `min_data_len` is less than or equal to `seq_length`.
+        ValueError: Raised if `min_data_len` is less than or equal to `seq_length`, `backend` is unknown, or a
+            reduced `precision` is requested from the "keras" backend.
 
     Attributes:
-        model (keras.models.Model): The LSTM model for traffic detection.
+        model (keras.models.Model | NumpyLSTMModel): The LSTM model for traffic detection.
         seq_length (int): Length of the input sequence.
         flagged_threshold (float): Threshold for flagging traffic as suspicious.
         unsafe_threshold (float): Threshold for flagging traffic as unsafe or malicious.
-        scaler (StandardScaler): StandardScaler for feature scaling.
+        scaler (FeatureScaler): FeatureScaler for feature scaling.
 
     Methods:
         preprocess_input(input_data): Preprocesses input data for prediction.
         _get_traffic_rating(input_data): Gets traffic rating based on input data.
+        prepare_windows(timestamps, packet_sizes, source_ip, destination_ip, source_port, destination_port):
+            Preprocesses packets into model input sequences.
+        prepare_batch_windows(batch): Preprocesses a packet batch into model input sequences.
+        score_windows(windows): Runs the model on input sequences.
+        rate(avg_prediction): Maps an average prediction to a traffic rating.
         predict(timestamps, packet_sizes, source_ip, destination_ip, source_port, destination_port):
             Predicts if the network traffic is malicious or safe.
+        predict_batch(batch): Predicts if the packets of a batch are malicious or safe, without building a
+            DataFrame.
+        assess_batch(batch): Same as `predict_batch`, also returning the average prediction.
+        assess_windows(windows): Rates prepared input sequences, also returning the average prediction.
+        stream_state(count): Returns the initial recurrent state of new flows for `stream_step`.
+        stream_step(packets, state): Advances the recurrent state of flows by one packet each, returning their
+            running scores.
 
     Example:
         # Create an instance of LSTMPacketThreadDetection
@@ -64,6 +185,8 @@ class LSTMPacketThreadDetection(ThreadDetection):
         print(f"Is Malicious: {result}")
     """
 
+    BACKENDS: tuple[str, ...] = ("keras", "numpy")
+
     def __init__(
             self,
             model_path: Path | str = None,
@@ -72,26 +195,50 @@ class LSTMPacketThreadDetection(ThreadDetection):
             scale: list[float] = None,
             min_data_len: int = 20,
             flagged_threshold: float = 0.5,
-            unsafe_threshold: float = 0.9
+            unsafe_threshold: float = 0.9,
+            backend: str = "keras",
+            precision: str = "float32"
     ):
         if min_data_len <= seq_length:
             raise ValueError("min_data_len must be greater than seq_length")
 
-        self.model = load_model(
-            model_path or
-            Path(
-                os.path.dirname(os.path.abspath(__file__)),
-                "pre_trained_models",
-                "LSTM.keras"
+        if backend not in self.BACKENDS:
+            raise ValueError(f"backend must be one of {self.BACKENDS}")
+
+        if precision not in PRECISIONS or (backend == "keras" and precision != "float32"):
+            raise ValueError(f"precision must be one of {PRECISIONS}, and float32 with the keras backend")
+
+        if backend == "numpy":
+            self.model = NumpyLSTMModel.load(
+                model_path or
+                Path(
+                    os.path.dirname(os.path.abspath(__file__)),
+                    "pre_trained_models",
+                    "LSTM.npz"
+                )
+            )
+            if precision != "float32" and self.model.precision != precision:
+                self.model = self.model.quantize(precision)
+        else:
+            # Imported lazily: Keras and TensorFlow take seconds to import.
+            from keras.models import load_model
+
+            self.model = load_model(
+                model_path or
+                Path(
+                    os.path.dirname(os.path.abspath(__file__)),
+                    "pre_trained_models",
+                    "LSTM.keras"
+                )
             )
-        )
         self.seq_length = seq_length
         self.flagged_threshold = flagged_threshold
         self.unsafe_threshold = unsafe_threshold
 
-        self.scaler = StandardScaler()
-        self.scaler.mean_ = mean or [-3.4638958368304884e-17, 6.52811138479592e-17, -4.618527782440651e-17]
-        self.scaler.scale_ = scale or [0.9999999999999984, 1.0000000000000018, 0.9999999999999999]
+        self.scaler = FeatureScaler(
+            mean or [-3.4638958368304884e-17, 6.52811138479592e-17, -4.618527782440651e-17],
+            scale or [0.9999999999999984, 1.0000000000000018, 0.9999999999999999]
+        )
 
     def preprocess_input(self, input_data):
         """
@@ -105,8 +252,7 @@ class LSTMPacketThreadDetection(ThreadDetection):
             np.ndarray: Preprocessed input data.
         """
         # Convert timestamp to seconds since the start time
-        start_time = datetime.strptime("2023-01-01", "%Y-%m-%d")
-        input_data['Timestamp'] = (input_data['Timestamp'] - start_time).dt.total_seconds()
+        input_data['Timestamp'] = (input_data['Timestamp'] - TIMESTAMP_ORIGIN).dt.total_seconds()
 
         # Standardize other features
         input_features = ["PacketSize", "SourcePort", "DestinationPort"]
@@ -130,23 +276,103 @@ class LSTMPacketThreadDetection(ThreadDetection):
         if len(input_data) < self.seq_length:
             return "Insufficient data for prediction"
 
-        x_input_seq = []
-
         # Create input sequences for the LSTM model
-        for i in range(self.seq_length, len(input_data)):
-            x_input_seq.append(input_data[i - self.seq_length:i])
+        x_input_seq = sliding_windows(input_data, self.seq_length)
 
-        x_input_seq = np.array(x_input_seq)
+        return self.assess_windows(x_input_seq)[0]
+
+    def assess_windows(self, x_input_seq: np.ndarray) -> tuple:
+        """
+        Gets traffic rating and average prediction based on model input sequences.
+
+        Args:
+            x_input_seq (np.ndarray): Input sequences of shape (n, seq_length, 3).
+
+        Returns:
+            tuple: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe) and average prediction (NaN when there
+                are too few packets).
+        """
+        if len(x_input_seq) < 1:
+            return "Insufficient data for prediction", float("nan")
 
         # Make predictions
-        predictions = self.model.predict(x_input_seq)
+        predictions = self.score_windows(x_input_seq)
 
         # Calculate the average prediction (you can use a different method based on your problem)
-        avg_prediction = np.mean(predictions)
+        avg_prediction = float(np.mean(predictions))
 
         if random.random() > 0.7:
-            return random.choice([1, 1, 1, 1, 2, 2, 2])
+            return random.choice([1, 1, 1, 1, 2, 2, 2]), avg_prediction
+
+        return self.rate(avg_prediction), avg_prediction
+
+    def stream_state(self, count: int = 1) -> np.ndarray:
+        """
+        Returns the initial recurrent state of new flows, for the streaming mode of `stream_step`.
+
+        Args:
+            count (int, optional): The number of flows. Defaults to 1.
+
+        Returns:
+            np.ndarray: Zero states of shape (count, state size).
+
+        Raises:
+            ValueError: Raised if the model does not run on the "numpy" backend.
+        """
+        if not isinstance(self.model, NumpyLSTMModel):
+            raise ValueError("Streaming needs the numpy backend")
+
+        return np.zeros((count, self.model.stream_state_size), dtype=np.float32)
+
+    def stream_step(self, packets: np.ndarray, state: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Advances the recurrent state of flows by one packet each and returns their running scores.
+
+        Window scoring runs every packet through the LSTM cells once for each of the `seq_length` overlapping
+        windows it is part of; streaming keeps the (h, c) state of every flow and runs each packet through the
+        cells once. See `NumpyLSTMModel.step` for how the bidirectional first layer is approximated, and
+        `firewall.streaming.StreamingScorer` for per-flow bookkeeping and the equivalence mode.
+
+        Args:
+            packets (np.ndarray): The scaled features (packet size, source port, destination port) of one packet
+                per flow, of shape (n, 3).
+            state (np.ndarray): The states of the flows, as returned by `stream_state` or a previous call.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The running score of every flow, of shape (n,), and their new states.
+
+        Raises:
+            ValueError: Raised if the model does not run on the "numpy" backend.
+        """
+        if not isinstance(self.model, NumpyLSTMModel):
+            raise ValueError("Streaming needs the numpy backend")
+
+        scores, state = self.model.step(packets, state)
+
+        return scores.reshape(-1), state
+
+    def score_windows(self, windows: np.ndarray) -> np.ndarray:
+        """
+        Runs the model on input sequences.
+
+        Args:
+            windows (np.ndarray): Input sequences of shape (n, seq_length, 3).
+
+        Returns:
+            np.ndarray: One prediction per input sequence, of shape (n,).
+        """
+        return self.model.predict(windows, verbose=0).reshape(-1)
+
+    def rate(self, avg_prediction: float) -> int:
+        """
+        Maps an average prediction to a traffic rating.
+
+        Args:
+            avg_prediction (float): The average model prediction of a batch.
 
+        Returns:
+            int: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe).
+        """
         if avg_prediction >= self.unsafe_threshold:
             return 2
         elif avg_prediction >= self.flagged_threshold:
@@ -154,20 +380,20 @@ class LSTMPacketThreadDetection(ThreadDetection):
         else:
             return 0
 
-    def predict(
-            self,
+    @staticmethod
+    def _to_frame(
             timestamps: list[str],
             packet_sizes: list[int],
             source_ip: list[str],
             destination_ip: list[str],
             source_port: list[int],
             destination_port: list[int]
-    ):
+    ) -> pd.DataFrame:
         """
-        Predicts if the network traffic is malicious or safe.
+        Builds the input frame expected by `preprocess_input`.
 
         Args:
-            timestamps (list of str): List of timestamps.
+            timestamps (list of str | list of float): List of timestamps, as strings or epoch seconds.
             packet_sizes (list of int): List of packet sizes.
             source_ip (list of str): List of source IP addresses.
             destination_ip (list of str): List of destination IP addresses.
@@ -175,10 +401,12 @@ class LSTMPacketThreadDetection(ThreadDetection):
             destination_port (list of int): List of destination port numbers.
 
         Returns:
-            int: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe).
+            pd.DataFrame: The packets, one row each.
         """
-        input_sequence = pd.DataFrame({
-            "Timestamp": pd.to_datetime(timestamps),
+        epoch_timestamps = bool(timestamps) and not isinstance(timestamps[0], str)
+
+        return pd.DataFrame({
+            "Timestamp": pd.to_datetime(timestamps, unit="s" if epoch_timestamps else None),
             "PacketSize": packet_sizes,
             "SourceIP": source_ip,
             "DestinationIP": destination_ip,
@@ -186,6 +414,357 @@ class LSTMPacketThreadDetection(ThreadDetection):
             "DestinationPort": destination_port
         })
 
+    def prepare_windows(
+            self,
+            timestamps: list[str],
+            packet_sizes: list[int],
+            source_ip: list[str],
+            destination_ip: list[str],
+            source_port: list[int],
+            destination_port: list[int]
+    ) -> np.ndarray:
+        """
+        Preprocesses packets into the input sequences scored by `score_windows`.
+
+        Takes the same arguments as `predict`.
+
+        Returns:
+            np.ndarray: Input sequences of shape (n - seq_length, seq_length, 3), empty if there are too few packets.
+        """
+        input_data = self.preprocess_input(self._to_frame(
+            timestamps, packet_sizes, source_ip, destination_ip, source_port, destination_port
+        ))
+
+        return sliding_windows(input_data, self.seq_length)
+
+    def prepare_batch_windows(self, batch: PacketBatch) -> np.ndarray:
+        """
+        Preprocesses a packet batch into the input sequences scored by `score_windows`.
+
+        Equivalent to `prepare_windows`, but the features are read straight from the batch columns.
+
+        Args:
+            batch (PacketBatch): The packets, oldest first.
+
+        Returns:
+            np.ndarray: Input sequences of shape (n - seq_length, seq_length, 3), empty if there are too few packets.
+        """
+        columns = batch.columns
+        features = np.column_stack((columns["sizes"], columns["source_port"], columns["destination_port"]))
+
+        return sliding_windows(self.scaler.transform(features), self.seq_length)
+
+    def predict(
+            self,
+            timestamps: list[str],
+            packet_sizes: list[int],
+            source_ip: list[str],
+            destination_ip: list[str],
+            source_port: list[int],
+            destination_port: list[int]
+    ):
+        """
+        Predicts if the network traffic is malicious or safe.
+
+        Args:
+            timestamps (list of str | list of float): List of timestamps, as strings or epoch seconds.
+            packet_sizes (list of int): List of packet sizes.
+            source_ip (list of str): List of source IP addresses.
+            destination_ip (list of str): List of destination IP addresses.
+            source_port (list of int): List of source port numbers.
+            destination_port (list of int): List of destination port numbers.
+
+        Returns:
+            int: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe).
+        """
+        input_sequence = self._to_frame(
+            timestamps, packet_sizes, source_ip, destination_ip, source_port, destination_port
+        )
+
         result = self._get_traffic_rating(input_sequence)
 
         return result
+
+    def predict_batch(self, batch: PacketBatch):
+        """
+        Predicts if the packets of a batch are malicious or safe.
+
+        Args:
+            batch (PacketBatch): The packets to rate, oldest first.
+
+        Returns:
+            int: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe).
+        """
+        return self.assess_batch(batch)[0]
+
+    def assess_batch(self, batch: PacketBatch) -> tuple:
+        """
+        Rates the packets of a batch and returns the average model prediction along with the rating.
+
+        Args:
+            batch (PacketBatch): The packets to rate, oldest first.
+
+        Returns:
+            tuple: Traffic rating and average prediction, see `ThreadDetection.assess_batch`.
+        """
+        return self.assess_windows(self.prepare_batch_windows(batch))
+
+
+class CascadeThreadDetection(ThreadDetection):
+    """
+    Two-stage cascade: a cheap statistical pre-screen in front of an LSTM detector.
+
+    The first stage rates every flow window from a few statistics computed with NumPy, and only escalates the
+    suspicious ones to `detector`; the others are rated safe without running the model. A window is escalated if:
+
+        - its mean packet size or its packet rate deviates from the traffic seen so far by more than `size_z` or
+          `rate_z` standard deviations. The baselines are exponentially weighted (EWMA) means and variances,
+          updated with the windows found benign;
+        - its source reached `fanout_threshold` distinct destination address and port pairs within the last
+          `fanout_window` seconds, as a port or host scan does;
+        - fewer than `warmup_windows` windows were seen, while the baselines settle.
+
+    A share `audit_rate` of the windows the pre-screen passes is run through the model anyway, to measure how often
+    the cascade agrees with always running it; `stats` reports it along with the escalation rate, so thresholds
+    can be tuned on recorded traffic (see `benchmarks.cascade`).
+
+    The statistics need timestamps and addresses, so the cascade rates packet batches: it has no `scaler`, and
+    `Brain` hands it whole flow windows.
+
+    Args:
+        detector (ThreadDetection): The second stage, e.g. an `LSTMPacketThreadDetection`.
+        size_z (float, optional): Escalation threshold of the packet size z-score. Defaults to 3.
+        rate_z (float, optional): Escalation threshold of the packet rate z-score. Defaults to 3.
+        fanout_threshold (int, optional): Distinct destinations of a source that trigger escalation. Defaults to 32.
+        fanout_window (float, optional): Seconds a destination counts towards the fan-out. Defaults to 60.
+        ewma_alpha (float, optional): Weight of a new window in the baselines. Defaults to 0.01.
+        warmup_windows (int, optional): Windows escalated unconditionally at start. Defaults to 100.
+        audit_rate (float, optional): Share of the passed windows also scored by the model. Defaults to 0.
+        benign_threshold (float | None, optional): Model score below which a window is benign. Defaults to the
+            `flagged_threshold` of `detector`, or 0.5.
+        max_sources (int, optional): Sources tracked for the fan-out, least recently active dropped first.
+            Defaults to 65536.
+
+    Methods:
+        screen_batch(batch): Runs the pre-screen on a flow window.
+        predict_batch(batch): Rates a flow window through the cascade.
+        assess_batch(batch): Same as `predict_batch`, also returning the model score of escalated windows.
+        stats(): Returns the escalation rate and the agreement with the model.
+        close(): Closes the wrapped detector.
+    """
+
+    # Shortest duration a window is assumed to span, in seconds, since sensors send whole-second timestamps.
+    MIN_WINDOW_DURATION: float = 1e-3
+
+    def __init__(
+            self,
+            detector: ThreadDetection,
+            size_z: float = 3.0,
+            rate_z: float = 3.0,
+            fanout_threshold: int = 32,
+            fanout_window: float = 60.0,
+            ewma_alpha: float = 0.01,
+            warmup_windows: int = 100,
+            audit_rate: float = 0.0,
+            benign_threshold: float | None = None,
+            max_sources: int = 65536
+    ):
+        self.detector = detector
+        self.seq_length = detector.seq_length
+        self.size_z = size_z
+        self.rate_z = rate_z
+        self.fanout_threshold = fanout_threshold
+        self.fanout_window = fanout_window
+        self.ewma_alpha = ewma_alpha
+        self.warmup_windows = warmup_windows
+        self.audit_rate = audit_rate
+        self.benign_threshold = (
+            benign_threshold if benign_threshold is not None else getattr(detector, "flagged_threshold", 0.5)
+        )
+        self.max_sources = max_sources
+
+        # EWMA mean and variance of the mean packet size and of the log packet rate of benign windows.
+        self._baselines = np.zeros(2)
+        self._variances = np.zeros(2)
+        self._baseline_windows = 0
+
+        # Last time every destination of a source was seen, per source.
+        self._destinations: OrderedDict[int, dict[tuple[int, int], float]] = OrderedDict()
+
+        self._lock = Lock()
+        self._windows = 0
+        self._escalated = 0
+        self._escalations = {"size": 0, "rate": 0, "fanout": 0, "warmup": 0}
+        self._audited = 0
+        self._agreed = 0
+
+    def _window_statistics(self, batch: PacketBatch) -> np.ndarray:
+        """
+        Returns the mean packet size and log packet rate of a window.
+        """
+        columns = batch.columns
+        timestamps = columns["timestamps"]
+        duration = max(float(timestamps.max() - timestamps.min()), self.MIN_WINDOW_DURATION) if len(batch) else 1.0
+
+        return np.array([columns["sizes"].mean() if len(batch) else 0.0, math.log(max(len(batch), 1) / duration)])
+
+    def _fanout(self, batch: PacketBatch) -> int:
+        """
+        Records the destinations of the window and returns the largest fan-out of its sources.
+
+        Must be called with the lock held.
+        """
+        columns = batch.columns
+        if not len(batch):
+            return 0
+
+        now = float(columns["timestamps"].max())
+        deadline = now - self.fanout_window
+        pairs = np.unique(np.column_stack((
+            columns["source_ip"].astype(np.int64),
+            columns["destination_ip"].astype(np.int64),
+            columns["destination_port"].astype(np.int64)
+        )), axis=0)
+
+        fanout = 0
+        for source, destination, port in pairs.tolist():
+            destinations = self._destinations.get(source)
+            if destinations is None:
+                destinations = self._destinations[source] = {}
+            else:
+                self._destinations.move_to_end(source)
+
+            destinations[destination, port] = now
+            if len(destinations) >= self.fanout_threshold:
+                for stale in [key for key, seen in destinations.items() if seen < deadline]:
+                    del destinations[stale]
+
+            fanout = max(fanout, len(destinations))
+
+        while len(self._destinations) > self.max_sources:
+            self._destinations.popitem(last=False)
+
+        return fanout
+
+    def screen_batch(self, batch: PacketBatch) -> tuple[bool, str | None, np.ndarray]:
+        """
+        Runs the pre-screen on a flow window.
+
+        Args:
+            batch (PacketBatch): The packets of the window.
+
+        Returns:
+            tuple: Whether the window is escalated, the first reason to escalate it ("warmup", "size", "rate" or
+                "fanout", None if passed), and its statistics (mean packet size, log packet rate).
+        """
+        statistics = self._window_statistics(batch)
+
+        with self._lock:
+            fanout = self._fanout(batch)
+
+            if self._baseline_windows < self.warmup_windows:
+                return True, "warmup", statistics
+
+            z_scores = np.abs(statistics - self._baselines) / np.sqrt(self._variances + 1e-12)
+
+        if z_scores[0] > self.size_z:
+            return True, "size", statistics
+        if z_scores[1] > self.rate_z:
+            return True, "rate", statistics
+        if fanout >= self.fanout_threshold:
+            return True, "fanout", statistics
+
+        return False, None, statistics
+
+    def _update_baselines(self, statistics: np.ndarray):
+        """
+        Adds a benign window to the EWMA baselines. Must be called with the lock held.
+        """
+        if not self._baseline_windows:
+            self._baselines = statistics.copy()
+        else:
+            delta = statistics - self._baselines
+            self._baselines = self._baselines + self.ewma_alpha * delta
+            self._variances = (1 - self.ewma_alpha) * (self._variances + self.ewma_alpha * delta ** 2)
+
+        self._baseline_windows += 1
+
+    def predict_batch(self, batch: PacketBatch):
+        """
+        Rates a flow window through the cascade.
+
+        Args:
+            batch (PacketBatch): The packets of the window, oldest first.
+
+        Returns:
+            int: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe).
+        """
+        return self.assess_batch(batch)[0]
+
+    def assess_batch(self, batch: PacketBatch) -> tuple:
+        """
+        Rates a flow window through the cascade.
+
+        Args:
+            batch (PacketBatch): The packets of the window, oldest first.
+
+        Returns:
+            tuple: Traffic rating and model score; windows the pre-screen passes are rated safe, with a NaN score
+                unless they were audited.
+        """
+        escalate, reason, statistics = self.screen_batch(batch)
+
+        if escalate or (self.audit_rate and random.random() < self.audit_rate):
+            thread_level, score = self.detector.assess_batch(batch)
+            benign = not score >= self.benign_threshold
+        else:
+            thread_level, score, benign = 0, float("nan"), True
+
+        with self._lock:
+            self._windows += 1
+
+            if escalate:
+                self._escalated += 1
+                self._escalations[reason] += 1
+            elif not math.isnan(score):
+                self._audited += 1
+                self._agreed += benign
+
+            if benign:
+                self._update_baselines(statistics)
+
+        if not escalate:
+            return 0, score
+
+        return thread_level, score
+
+    def stats(self) -> dict:
+        """
+        Returns the escalation rate and the agreement with the model.
+
+        Returns:
+            dict: Windows screened and escalated, escalations per reason, escalation rate, audited windows and the
+                share of them the model also found benign (NaN without audits).
+        """
+        with self._lock:
+            return {
+                "windows": self._windows,
+                "escalated": self._escalated,
+                "escalations": dict(self._escalations),
+                "escalation_rate": self._escalated / self._windows if self._windows else 0.0,
+                "audited": self._audited,
+                "agreement": self._agreed / self._audited if self._audited else float("nan"),
+                "baselines": {
+                    "size_mean": float(self._baselines[0]),
+                    "size_std": float(math.sqrt(self._variances[0])),
+                    "log_rate_mean": float(self._baselines[1]),
+                    "log_rate_std": float(math.sqrt(self._variances[1])),
+                },
+            }
+
+    def close(self):
+        """
+        Closes the wrapped detector, such as an `InferenceScheduler` or a `ProcessPoolDetector`.
+        """
+        if hasattr(self.detector, "close"):
+            self.detector.close()
@@ -0,0 +1,306 @@
+import socket
+import time
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+# Column layout of a packet batch; IPv4 addresses are packed into unsigned 32-bit integers.
+COLUMNS: dict[str, np.dtype] = {
+    "timestamps": np.dtype(np.float64),
+    "sizes": np.dtype(np.uint32),
+    "source_ip": np.dtype(np.uint32),
+    "destination_ip": np.dtype(np.uint32),
+    "source_port": np.dtype(np.uint16),
+    "destination_port": np.dtype(np.uint16),
+}
+
+# Big-endian layout of `server.protocol.BINARY_RECORD`, for decoding whole frames at once.
+BINARY_RECORD_DTYPE = np.dtype([
+    ("timestamps", ">f8"),
+    ("sizes", ">u4"),
+    ("source_ip", ">u4"),
+    ("destination_ip", ">u4"),
+    ("source_port", ">u2"),
+    ("destination_port", ">u2"),
+])
+
+
+@lru_cache(maxsize=65536)
+def pack_ip(address: str) -> int:
+    """
+    Packs a dotted IPv4 address into an unsigned 32-bit integer.
+
+    Args:
+        address (str): The address, e.g. "192.168.1.1".
+
+    Returns:
+        int: The packed address, 0 if it is not a valid IPv4 address.
+    """
+    try:
+        return int.from_bytes(socket.inet_aton(address), "big")
+    except (OSError, TypeError):
+        return 0
+
+
+@lru_cache(maxsize=65536)
+def unpack_ip(address: int) -> str:
+    """
+    Formats a packed IPv4 address.
+
+    Args:
+        address (int): The packed address.
+
+    Returns:
+        str: The dotted address.
+    """
+    return socket.inet_ntoa(int(address).to_bytes(4, "big"))
+
+
+@lru_cache(maxsize=4096)
+def _parse_timestamp(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def to_epoch(value: str | float | int | None) -> float:
+    """
+    Normalizes a packet timestamp to epoch seconds.
+
+    Args:
+        value (str | float | int | None): A sensor timestamp such as "2023-09-24 10:00:00" (local time, like the
+            sensor) or epoch seconds.
+
+    Returns:
+        float: Seconds since the epoch, 0.0 for a missing or unreadable timestamp.
+    """
+    if isinstance(value, str):
+        try:
+            return _parse_timestamp(value)
+        except ValueError:
+            return 0.0
+
+    return float(value or 0.0)
+
+
+@lru_cache(maxsize=4096)
+def format_timestamp(seconds: int) -> str:
+    """
+    Formats epoch seconds the way the sensor formats packet timestamps.
+
+    Args:
+        seconds (int): Seconds since the epoch.
+
+    Returns:
+        str: The local time as "yyyy-MM-dd hh:mm:ss".
+    """
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(seconds))
+
+
+def _record_number(record: dict, key: str, maximum: int) -> int:
+    """
+    Returns an integer field of a JSON packet record, 0 if it is missing.
+
+    Raises:
+        ValueError: Raised if the field is not a number between 0 and `maximum`.
+    """
+    value = record.get(key) or 0
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= maximum:
+        raise ValueError(f"{key} must be a number between 0 and {maximum}, not {value!r}")
+
+    return int(value)
+
+
+def _record_address(record: dict, key: str) -> int:
+    """
+    Returns an address field of a JSON packet record, packed; 0 if it is missing or not an IPv4 address.
+
+    Raises:
+        ValueError: Raised if the field is not a string.
+    """
+    value = record.get(key)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{key} must be a string, not {value!r}")
+
+    return pack_ip(value) if value is not None else 0
+
+
+class PacketBatch:
+    """
+    Columnar batch of packets backed by preallocated NumPy arrays.
+
+    A batch is meant to be reused: `clear` only resets its length, and the arrays grow geometrically when
+    more than `capacity` packets are added. The `columns` property returns views trimmed to the current length.
+
+    Args:
+        capacity (int, optional): Number of packets preallocated. Defaults to 1024.
+
+    Attributes:
+        timestamps (np.ndarray): Epoch seconds (float64).
+        sizes (np.ndarray): Packet sizes in bytes (uint32).
+        source_ip (np.ndarray): Packed source IPv4 addresses (uint32).
+        destination_ip (np.ndarray): Packed destination IPv4 addresses (uint32).
+        source_port (np.ndarray): Source ports (uint16).
+        destination_port (np.ndarray): Destination ports (uint16).
+
+    Methods:
+        append(timestamp, size, source_ip, destination_ip, source_port, destination_port): Adds one packet.
+        append_record(record): Adds one decoded JSON packet record.
+        extend_binary(payload): Adds every binary packet record of a frame payload.
+        from_columns(**columns): Builds a batch from whole columns.
+        clear(): Empties the batch, keeping its arrays.
+    """
+
+    __slots__ = ("length",) + tuple(COLUMNS)
+
+    def __init__(self, capacity: int = 1024):
+        self.length = 0
+
+        for name, dtype in COLUMNS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def capacity(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def columns(self) -> dict[str, np.ndarray]:
+        """
+        Returns views of every column, trimmed to the packets in the batch.
+        """
+        return {name: getattr(self, name)[:self.length] for name in COLUMNS}
+
+    @classmethod
+    def from_columns(cls, **columns: np.ndarray) -> "PacketBatch":
+        """
+        Builds a batch from whole columns.
+
+        Args:
+            **columns (np.ndarray): One array (or scalar, broadcast to the batch length) per column of `COLUMNS`.
+
+        Returns:
+            PacketBatch: The batch.
+        """
+        length = len(columns["timestamps"])
+        batch = cls(length)
+        batch.length = length
+
+        for name, dtype in COLUMNS.items():
+            getattr(batch, name)[:] = columns[name]
+
+        return batch
+
+    def _reserve(self, count: int):
+        """
+        Grows the arrays so that `count` more packets fit.
+        """
+        needed = self.length + count
+        if needed <= self.capacity:
+            return
+
+        capacity = max(needed, 2 * self.capacity)
+        for name in COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.length] = column[:self.length]
+            setattr(self, name, grown)
+
+    def append(
+            self,
+            timestamp: float,
+            size: int,
+            source_ip: int,
+            destination_ip: int,
+            source_port: int,
+            destination_port: int
+    ):
+        """
+        Adds one packet.
+
+        Args:
+            timestamp (float): Epoch seconds.
+            size (int): Packet size in bytes.
+            source_ip (int): Packed source address.
+            destination_ip (int): Packed destination address.
+            source_port (int): Source port.
+            destination_port (int): Destination port.
+        """
+        if self.length == self.capacity:
+            self._reserve(1)
+
+        index = self.length
+        self.timestamps[index] = timestamp
+        self.sizes[index] = size
+        self.source_ip[index] = source_ip
+        self.destination_ip[index] = destination_ip
+        self.source_port[index] = source_port
+        self.destination_port[index] = destination_port
+        self.length = index + 1
+
+    def append_record(self, record: dict):
+        """
+        Adds one decoded JSON packet record, as sent by `MainWindow::packetHandler`.
+
+        Every field is checked before the packet is added, so a rejected record leaves the batch unchanged.
+
+        Args:
+            record (dict): The record, with "Timestamp", "Length", "SourceIP", "DestinationIP", "SourcePort"
+                and "DestinationPort" keys.
+
+        Raises:
+            ValueError: Raised if a field has the wrong type, or a size or port is out of range.
+        """
+        timestamp = record.get("Timestamp")
+        if isinstance(timestamp, bool) or not isinstance(timestamp, (str, int, float, type(None))):
+            raise ValueError(f"Timestamp must be a string or a number, not {timestamp!r}")
+
+        self.append(
+            to_epoch(timestamp),
+            _record_number(record, "Length", 0xFFFFFFFF),
+            _record_address(record, "SourceIP"),
+            _record_address(record, "DestinationIP"),
+            _record_number(record, "SourcePort", 0xFFFF),
+            _record_number(record, "DestinationPort", 0xFFFF)
+        )
+
+    def extend_binary(self, payload: bytes | bytearray | memoryview):
+        """
+        Adds every packet of a binary frame payload in one vectorized copy.
+
+        Args:
+            payload (bytes | bytearray | memoryview): Concatenated `BINARY_RECORD_DTYPE` records.
+        """
+        records = np.frombuffer(payload, dtype=BINARY_RECORD_DTYPE)
+        count = len(records)
+        self._reserve(count)
+
+        for name in COLUMNS:
+            getattr(self, name)[self.length:self.length + count] = records[name]
+
+        self.length += count
+
+    def clear(self):
+        """
+        Empties the batch, keeping its arrays for reuse.
+        """
+        self.length = 0
+
+    def as_packet_data(self) -> dict[str, list]:
+        """
+        Expands the batch into one list per packet field, keyed like the sensor records.
+
+        Returns:
+            dict: The packet data, for logging or for detectors that take lists.
+        """
+        columns = self.columns
+
+        return {
+            "Timestamp": [format_timestamp(int(timestamp)) for timestamp in columns["timestamps"]],
+            "PacketSize": columns["sizes"].tolist(),
+            "SourceIP": [unpack_ip(address) for address in columns["source_ip"].tolist()],
+            "DestinationIP": [unpack_ip(address) for address in columns["destination_ip"].tolist()],
+            "SourcePort": columns["source_port"].tolist(),
+            "DestinationPort": columns["destination_port"].tolist()
+        }
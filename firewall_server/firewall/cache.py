@@ -0,0 +1,187 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Hashable, NamedTuple
+
+import numpy as np
+
+
+class CachedVerdict(NamedTuple):
+    """
+    A verdict kept by the `VerdictCache`.
+
+    Attributes:
+        thread_level (int): The traffic rating.
+        score (float): The model score.
+        expires_at (float): Monotonic time after which the verdict is stale.
+        generation (int): The cache generation the verdict was stored in.
+    """
+
+    thread_level: int
+    score: float
+    expires_at: float
+    generation: int
+
+
+class VerdictCache:
+    """
+    TTL and LRU bounded cache of detector verdicts, keyed by flow and by a fingerprint of its recent packets.
+
+    Long-lived flows with a steady packet pattern, such as backups or video streams, produce windows the detector
+    has already rated. The fingerprint quantizes the packet sizes of a window into `size_quantum` byte buckets, so
+    a window of such a flow finds the verdict of an earlier, similar window and skips inference; any change in the
+    pattern yields a new fingerprint, which is scored afresh.
+
+    Verdicts expire after `ttl` seconds, so every flow is still re-scored periodically, and the least recently used
+    verdicts are evicted beyond `max_entries`. `invalidate` drops every verdict at once, and must be called when
+    the model or its thresholds change.
+
+    Args:
+        max_entries (int, optional): The most verdicts kept. Defaults to 65536.
+        ttl (float, optional): Seconds a verdict stays valid. Defaults to 30.
+        size_quantum (int, optional): Width of the packet size buckets of the fingerprint, in bytes. Defaults to 64.
+
+    Attributes:
+        generation (int): Incremented by every `invalidate`.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that found no valid verdict.
+        expirations (int): Verdicts dropped after their TTL.
+        evictions (int): Verdicts dropped to stay within `max_entries`.
+
+    Raises:
+        ValueError: Raised if a limit is not positive.
+
+    Methods:
+        fingerprint(sizes): Returns the fingerprint of the packet sizes of a window.
+        get(flow, fingerprint): Returns the cached verdict of a window, or None.
+        put(flow, fingerprint, thread_level, score, generation): Stores the verdict of a window.
+        invalidate(): Drops every verdict.
+        stats(): Returns the hit and miss statistics.
+    """
+
+    def __init__(self, max_entries: int = 65536, ttl: float = 30.0, size_quantum: int = 64):
+        if max_entries < 1 or ttl <= 0 or size_quantum < 1:
+            raise ValueError("max_entries, ttl and size_quantum must be positive")
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.size_quantum = size_quantum
+
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+        self._entries: OrderedDict[tuple, CachedVerdict] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def fingerprint(self, sizes: np.ndarray) -> bytes:
+        """
+        Returns the fingerprint of the packet sizes of a window.
+
+        Args:
+            sizes (np.ndarray): The packet sizes in bytes, oldest first.
+
+        Returns:
+            bytes: The size bucket of every packet.
+        """
+        return (np.asarray(sizes) // self.size_quantum).astype(np.uint16).tobytes()
+
+    def get(self, flow: Hashable, fingerprint: bytes) -> CachedVerdict | None:
+        """
+        Returns the cached verdict of a window.
+
+        Args:
+            flow (Hashable): The flow key.
+            fingerprint (bytes): The fingerprint of the window.
+
+        Returns:
+            CachedVerdict | None: The verdict, None if there is none or it expired.
+        """
+        key = (flow, fingerprint)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry.expires_at < time.monotonic() or entry.generation != self.generation:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry
+
+    def put(
+            self,
+            flow: Hashable,
+            fingerprint: bytes,
+            thread_level: int,
+            score: float,
+            generation: int | None = None
+    ):
+        """
+        Stores the verdict of a window, evicting the least recently used verdicts beyond `max_entries`.
+
+        Args:
+            flow (Hashable): The flow key.
+            fingerprint (bytes): The fingerprint of the window.
+            thread_level (int): The traffic rating.
+            score (float): The model score.
+            generation (int | None, optional): The `generation` read before the window was scored; the verdict is
+                discarded if the cache was invalidated since. Defaults to None (the current generation).
+        """
+        key = (flow, fingerprint)
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            self._entries[key] = CachedVerdict(
+                thread_level, score, time.monotonic() + self.ttl, self.generation
+            )
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        """
+        Drops every verdict, e.g. after the model or its thresholds changed.
+
+        Verdicts of windows being scored while this is called are discarded when they are `put` with the generation
+        read before scoring.
+        """
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the hit and miss statistics.
+
+        Returns:
+            dict: Entries, hits, misses, hit ratio, expirations, evictions and the current generation.
+        """
+        lookups = self.hits + self.misses
+
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "generation": self.generation,
+        }
@@ -0,0 +1,163 @@
+import sys
+from array import array
+
+import numpy as np
+
+from firewall.LSTM import FeatureScaler
+
+
+class FlowFeatures:
+    """
+    Features of one flow, updated in constant time as each packet arrives.
+
+    The model features of a packet (scaled size, source and destination port) are standardized once, when the
+    packet is added, and kept in a ring of the last `window_size` packets; the ports are constant within a flow,
+    so they are only scaled when the flow is created. The model input sequences of the flow are therefore ready
+    without rescaling any packet.
+
+    Args:
+        size_mean (float): Mean of the packet size feature, from the scaler.
+        size_scale (float): Scale of the packet size feature, from the scaler.
+        scaled_ports (tuple[float, float]): The scaled source and destination port of the flow.
+        window_size (int): The number of packets kept for the model input.
+        seq_length (int): Length of the model input sequences.
+
+    Attributes:
+        packets (int): Packets seen.
+
+    Methods:
+        update(size): Adds a packet.
+        sequences(): Returns the model input sequences of the packets kept.
+    """
+
+    __slots__ = (
+        "window_size", "seq_length", "scaled_sizes", "scaled_ports", "head", "count", "packets", "_size_mean",
+        "_size_scale"
+    )
+
+    def __init__(
+            self,
+            size_mean: float,
+            size_scale: float,
+            scaled_ports: tuple[float, float],
+            window_size: int,
+            seq_length: int
+    ):
+        self.window_size = window_size
+        self.seq_length = seq_length
+        self.scaled_sizes = array("d", bytes(8 * window_size))
+        self.scaled_ports = scaled_ports
+        self.head = 0
+        self.count = 0
+        self.packets = 0
+
+        self._size_mean = size_mean
+        self._size_scale = size_scale
+
+    def update(self, size: int):
+        """
+        Adds a packet.
+
+        Args:
+            size (int): The packet size in bytes.
+        """
+        head = self.head
+        self.scaled_sizes[head] = (size - self._size_mean) / self._size_scale
+        self.head = (head + 1) % self.window_size
+        self.count = min(self.count + 1, self.window_size)
+        self.packets += 1
+
+    def sequences(self) -> np.ndarray:
+        """
+        Returns the model input sequences of the packets kept, as `prepare_batch_windows` builds them.
+
+        Returns:
+            np.ndarray: Input sequences of shape (count - seq_length, seq_length, 3), empty if there are too few
+                packets.
+        """
+        count = self.count
+        seq_length = self.seq_length
+
+        # Like `sliding_windows`, the newest packet only closes the last sequence.
+        windows = np.empty((max(0, count - seq_length), seq_length, 3))
+        if not len(windows):
+            return windows
+
+        start = (self.head - count) % self.window_size
+        ordered = (self.scaled_sizes[start:] + self.scaled_sizes[:start])[:count]
+        scaled_sizes = np.frombuffer(ordered, dtype=np.float64)
+
+        windows[:, :, 1:] = self.scaled_ports
+        windows[:, :, 0] = np.lib.stride_tricks.sliding_window_view(scaled_sizes[:count - 1], seq_length)
+
+        return windows
+
+
+class FeatureExtractor:
+    """
+    Creates the `FlowFeatures` of new flows for a detector's scaler and sequence length.
+
+    The scaler parameters are read once, so updating a flow never touches NumPy.
+
+    Args:
+        scaler (FeatureScaler): The scaler of the model features (packet size, source port, destination port).
+        seq_length (int): Length of the model input sequences.
+        window_size (int | None, optional): The number of packets kept per flow. Defaults to `seq_length + 1`,
+            which yields one input sequence per window like `FlowTable` windows do.
+
+    Methods:
+        new_flow(source_port, destination_port): Returns the empty features of a new flow.
+        footprint(): Estimates the memory used by the features of one flow.
+
+    Usage:
+    ```python
+    extractor = FeatureExtractor(detector.scaler, detector.seq_length)
+    features = extractor.new_flow(40000, 443)
+    for size in packet_sizes:
+        features.update(size)
+    rating, score = detector.assess_windows(features.sequences())
+    ```
+    """
+
+    def __init__(self, scaler: FeatureScaler, seq_length: int, window_size: int | None = None):
+        self.seq_length = seq_length
+        self.window_size = window_size or seq_length + 1
+
+        self._size_mean, self._source_port_mean, self._destination_port_mean = scaler.mean_.tolist()
+        self._size_scale, self._source_port_scale, self._destination_port_scale = scaler.scale_.tolist()
+
+    def new_flow(self, source_port: int, destination_port: int) -> FlowFeatures:
+        """
+        Returns the empty features of a new flow.
+
+        Args:
+            source_port (int): The source port of the flow.
+            destination_port (int): The destination port of the flow.
+
+        Returns:
+            FlowFeatures: The features, to be updated with every packet of the flow.
+        """
+        return FlowFeatures(
+            self._size_mean,
+            self._size_scale,
+            (
+                (source_port - self._source_port_mean) / self._source_port_scale,
+                (destination_port - self._destination_port_mean) / self._destination_port_scale
+            ),
+            self.window_size,
+            self.seq_length
+        )
+
+    def footprint(self) -> int:
+        """
+        Estimates the memory used by the features of one flow.
+
+        Returns:
+            int: The approximate size of a `FlowFeatures` and the values it references, in bytes.
+        """
+        features = self.new_flow(65535, 65535)
+
+        return (
+                sys.getsizeof(features) + sys.getsizeof(features.scaled_sizes) +
+                sys.getsizeof(features.scaled_ports) + sum(sys.getsizeof(port) for port in features.scaled_ports)
+        )
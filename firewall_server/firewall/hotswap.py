@@ -0,0 +1,355 @@
+import math
+import time
+from queue import Empty, Full, Queue
+from threading import Lock
+from typing import Callable
+
+import numpy as np
+
+from firewall.LSTM import ThreadDetection
+from firewall.batch import PacketBatch
+from thread_management import thread_manager
+
+
+def _model_detector(detector: ThreadDetection) -> ThreadDetection:
+    """
+    Returns the detector running the model under wrappers such as `InferenceScheduler` or `CascadeThreadDetection`.
+    """
+    while not hasattr(detector, "score_windows") and hasattr(detector, "detector"):
+        detector = detector.detector
+
+    return detector
+
+
+def _compatible(detector: ThreadDetection, replacement: ThreadDetection) -> bool:
+    """
+    Tells whether a replacement reads the flow windows prepared for a detector: same length and feature scaling.
+    """
+    if detector.seq_length != replacement.seq_length:
+        return False
+
+    if detector.scaler is None or replacement.scaler is None:
+        return detector.scaler is replacement.scaler
+
+    return (
+        np.array_equal(detector.scaler.mean_, replacement.scaler.mean_) and
+        np.array_equal(detector.scaler.scale_, replacement.scaler.scale_)
+    )
+
+
+class HotSwapDetector(ThreadDetection):
+    """
+    Detector that can be replaced while serving, without dropping connections or a latency spike.
+
+    Every call goes to the current detector. `reload` builds the replacement with `factory` on a background thread,
+    from the current options updated with new ones, e.g. a retrained `model_path` or new thresholds. Before it
+    takes any traffic, the replacement is warmed up on synthetic windows at several batch sizes, so graph tracing
+    and the first slow model calls happen off the serving path; the swap itself is a single reference assignment.
+
+    With a shadow period, the replacement first scores a copy of the live traffic on a background thread for
+    `shadow_seconds`, while the current detector keeps answering. `status` then reports how often both rate a
+    window alike, from their scores and thresholds, and their latencies. Windows are dropped from the shadow queue
+    rather than delaying live traffic when the replacement falls behind.
+
+    After the swap, `on_swap` is called, typically `VerdictCache.invalidate`, and the replaced detector is closed
+    once calls still running on it had `close_delay` seconds to finish.
+
+    Args:
+        factory (Callable[..., ThreadDetection]): Builds a detector from keyword options.
+        options (dict | None, optional): The options of the first detector. Defaults to None (no options).
+        shadow_seconds (float, optional): Default shadow period of `reload`; 0 swaps right after the warm-up.
+            Defaults to 0.
+        warmup_batch_sizes (tuple[int, ...], optional): Batch sizes of the warm-up calls. Defaults to (1, 16, 256).
+        warmup_rounds (int, optional): Warm-up calls per batch size. Defaults to 3.
+        shadow_queue_size (int, optional): Windows waiting for the replacement before new ones are dropped.
+            Defaults to 1024.
+        close_delay (float, optional): Seconds before the replaced detector is closed. Defaults to 5.
+        on_swap (Callable[[], None] | None, optional): Called after every swap. Defaults to None.
+
+    Attributes:
+        detector (ThreadDetection): The current detector.
+        options (dict): The options it was built with.
+        swaps (int): Completed swaps.
+
+    Methods:
+        predict_batch(batch): Rates a packet batch with the current detector.
+        assess_batch(batch): Same as `predict_batch`, also returning the score.
+        assess_windows(windows): Rates model input sequences with the current detector.
+        reload(options, shadow_seconds): Builds, warms up, optionally shadows, and swaps in a replacement.
+        status(): Returns the swap count and the outcome of the last reload.
+        stats(): Returns the statistics of the current detector, with the swap counters.
+        close(): Closes the current detector.
+
+    Usage:
+    ```python
+    detector = HotSwapDetector(lambda **options: LSTMPacketThreadDetection(**options), {"backend": "numpy"})
+    detector.reload({"unsafe_threshold": 0.95}, shadow_seconds=60).result()
+    ```
+    """
+
+    def __init__(
+            self,
+            factory: Callable[..., ThreadDetection],
+            options: dict | None = None,
+            shadow_seconds: float = 0.0,
+            warmup_batch_sizes: tuple[int, ...] = (1, 16, 256),
+            warmup_rounds: int = 3,
+            shadow_queue_size: int = 1024,
+            close_delay: float = 5.0,
+            on_swap: Callable[[], None] | None = None
+    ):
+        self.factory = factory
+        self.options = dict(options or {})
+        self.shadow_seconds = shadow_seconds
+        self.warmup_batch_sizes = warmup_batch_sizes
+        self.warmup_rounds = warmup_rounds
+        self.close_delay = close_delay
+        self.on_swap = on_swap
+
+        self.detector = factory(**self.options)
+        self.swaps = 0
+
+        self._reload_lock = Lock()
+        self._reloading = False
+        self._last_reload: dict = {}
+
+        self._shadow_queue: Queue = Queue(maxsize=shadow_queue_size)
+        self._shadowing = False
+        self._shadow_lock = Lock()
+        self._shadow: dict = {}
+
+    @property
+    def seq_length(self) -> int:
+        return self.detector.seq_length
+
+    @property
+    def scaler(self):
+        return self.detector.scaler
+
+    def _call(self, method: str, payload) -> tuple:
+        """
+        Runs a rating call on the current detector, copying it to the shadow queue during a shadow period.
+        """
+        detector = self.detector
+
+        if not self._shadowing:
+            return getattr(detector, method)(payload)
+
+        started_at = time.perf_counter()
+        result = getattr(detector, method)(payload)
+        elapsed = time.perf_counter() - started_at
+
+        try:
+            self._shadow_queue.put_nowait((method, payload, result[1], elapsed))
+        except Full:
+            with self._shadow_lock:
+                self._shadow["dropped"] += 1
+
+        return result
+
+    def predict_batch(self, batch: PacketBatch):
+        return self._call("assess_batch", batch)[0]
+
+    def assess_batch(self, batch: PacketBatch) -> tuple:
+        return self._call("assess_batch", batch)
+
+    def assess_windows(self, windows: np.ndarray) -> tuple:
+        return self._call("assess_windows", windows)
+
+    def _warm_up(self, detector: ThreadDetection):
+        """
+        Runs the model of a detector on synthetic windows at every warm-up batch size.
+        """
+        model = _model_detector(detector)
+        rng = np.random.default_rng(0)
+
+        for batch_size in self.warmup_batch_sizes:
+            windows = rng.standard_normal((batch_size, detector.seq_length, 3)).astype(np.float32)
+            for _ in range(self.warmup_rounds):
+                if hasattr(model, "score_windows"):
+                    model.score_windows(windows)
+                else:
+                    model.assess_windows(windows)
+
+    def _run_shadow(self, candidate: ThreadDetection, seconds: float):
+        """
+        Scores the live traffic copied to the shadow queue with the candidate for `seconds`.
+        """
+        current, replacement = _model_detector(self.detector), _model_detector(candidate)
+        active_latencies, candidate_latencies = [], []
+        deadline = time.monotonic() + seconds
+
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                method, payload, score, elapsed = self._shadow_queue.get(timeout=min(remaining, 0.1))
+            except Empty:
+                continue
+
+            started_at = time.perf_counter()
+            candidate_score = getattr(candidate, method)(payload)[1]
+            candidate_latencies.append(time.perf_counter() - started_at)
+            active_latencies.append(elapsed)
+
+            # Ratings are compared from the scores, since the detectors rate part of the windows at random.
+            agreed = current.rate(score) == replacement.rate(candidate_score)
+            difference = abs(candidate_score - score)
+
+            with self._shadow_lock:
+                self._shadow["windows"] += 1
+                self._shadow["agreed"] += agreed
+                if not math.isnan(difference):
+                    self._shadow["scored"] += 1
+                    self._shadow["score_difference_sum"] += difference
+
+        self._shadowing = False
+        while not self._shadow_queue.empty():
+            self._shadow_queue.get_nowait()
+
+        with self._shadow_lock:
+            for name, latencies in (("active", active_latencies), ("candidate", candidate_latencies)):
+                self._shadow[f"{name}_p50_latency"] = float(np.percentile(latencies, 50)) if latencies else math.nan
+                self._shadow[f"{name}_p99_latency"] = float(np.percentile(latencies, 99)) if latencies else math.nan
+
+    def _shadow_report(self) -> dict:
+        with self._shadow_lock:
+            shadow = dict(self._shadow)
+
+        if not shadow:
+            return {}
+
+        windows, scored = shadow.pop("windows"), shadow.pop("scored")
+        agreed, difference_sum = shadow.pop("agreed"), shadow.pop("score_difference_sum")
+
+        return {
+            "windows": windows,
+            "agreement": agreed / windows if windows else math.nan,
+            "mean_score_difference": difference_sum / scored if scored else math.nan,
+            **shadow,
+        }
+
+    def reload(self, options: dict | None = None, shadow_seconds: float | None = None):
+        """
+        Builds, warms up, optionally shadows, and swaps in a replacement detector, on a background thread.
+
+        The current detector keeps serving if the replacement cannot be built or has another sequence length, since
+        the flow windows are cut for the current one.
+
+        Args:
+            options (dict | None, optional): Options updating the current ones. Defaults to None (rebuild as is,
+                e.g. to pick up a retrained model file).
+            shadow_seconds (float | None, optional): Shadow period. Defaults to None (`shadow_seconds`).
+
+        Returns:
+            Future: Resolves to the `status` after the swap, or raises why the reload failed.
+
+        Raises:
+            RuntimeError: Raised if a reload is already running.
+        """
+        with self._reload_lock:
+            if self._reloading:
+                raise RuntimeError("A reload is already running")
+            self._reloading = True
+
+        return self._reload(
+            {**self.options, **(options or {})},
+            self.shadow_seconds if shadow_seconds is None else shadow_seconds
+        )
+
+    @thread_manager.run_in_thread(execute_when_called=True)
+    def _reload(self, options: dict, shadow_seconds: float) -> dict:
+        started_at = time.perf_counter()
+        report = {"options": options, "started": time.time()}
+
+        try:
+            candidate = self.factory(**options)
+            report["load_seconds"] = time.perf_counter() - started_at
+
+            try:
+                if not _compatible(self.detector, candidate):
+                    raise ValueError("The replacement must keep the sequence length and feature scaling")
+
+                warmed_at = time.perf_counter()
+                self._warm_up(candidate)
+                report["warmup_seconds"] = time.perf_counter() - warmed_at
+
+                if shadow_seconds > 0:
+                    with self._shadow_lock:
+                        self._shadow = {
+                            "windows": 0, "agreed": 0, "scored": 0, "score_difference_sum": 0.0, "dropped": 0
+                        }
+                    self._shadowing = True
+                    self._run_shadow(candidate, shadow_seconds)
+            except BaseException:
+                self._shadowing = False
+                if hasattr(candidate, "close"):
+                    candidate.close()
+                raise
+
+            report["shadow"] = self._shadow_report() if shadow_seconds > 0 else {}
+
+            replaced, self.detector = self.detector, candidate
+            self.options = options
+            self.swaps += 1
+            report["swapped"] = True
+
+            if self.on_swap is not None:
+                self.on_swap()
+
+            if hasattr(replaced, "close"):
+                self._close_later(replaced)
+        except Exception as e:
+            report["swapped"] = False
+            report["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            report["seconds"] = time.perf_counter() - started_at
+            self._last_reload = report
+            self._reloading = False
+
+        return self.status()
+
+    @thread_manager.run_in_thread(execute_when_called=True)
+    def _close_later(self, detector: ThreadDetection):
+        time.sleep(self.close_delay)
+        detector.close()
+
+    def status(self) -> dict:
+        """
+        Returns the swap count and the outcome of the last reload.
+
+        Returns:
+            dict: Completed swaps, whether a reload is running, the current options and the last reload: its
+                options, whether it swapped or its error, its load, warm-up and total seconds, and its shadow
+                report (windows compared, rating agreement, mean score difference, dropped windows and p50/p99
+                latencies of both detectors). During a shadow period, the report so far.
+        """
+        last_reload = dict(self._last_reload)
+        if self._shadowing:
+            last_reload["shadow"] = self._shadow_report()
+
+        return {
+            "swaps": self.swaps,
+            "reloading": self._reloading,
+            "options": dict(self.options),
+            "last_reload": last_reload,
+        }
+
+    def stats(self) -> dict:
+        """
+        Returns the statistics of the current detector, along with the swap count and the shadow agreement.
+        """
+        stats = self.detector.stats() if hasattr(self.detector, "stats") else {}
+        shadow = self._shadow_report()
+
+        return {
+            **stats,
+            "swaps": self.swaps,
+            "shadow_agreement": shadow.get("agreement", math.nan),
+        }
+
+    def close(self):
+        """
+        Closes the current detector.
+        """
+        if hasattr(self.detector, "close"):
+            self.detector.close()
@@ -0,0 +1,671 @@
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import zipfile
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+
+PRE_TRAINED_MODELS = Path(os.path.dirname(os.path.abspath(__file__)), "pre_trained_models")
+
+PRECISIONS: tuple[str, ...] = ("float32", "float16", "int8")
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    """
+    Applies the logistic function in place, clipping the input so that `exp` cannot overflow.
+    """
+    np.negative(x, out=x)
+    np.clip(x, -88.0, 88.0, out=x)
+    np.exp(x, out=x)
+    x += 1
+    return np.reciprocal(x, out=x)
+
+
+# Activations are applied in place on freshly computed arrays.
+ACTIVATIONS = {
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "sigmoid": _sigmoid,
+    "tanh": lambda x: np.tanh(x, out=x),
+    "linear": lambda x: x,
+}
+
+
+def _lstm(
+        inputs: np.ndarray,
+        kernel: np.ndarray,
+        recurrent_kernel: np.ndarray,
+        bias: np.ndarray,
+        activation: str,
+        recurrent_activation: str,
+        return_sequences: bool,
+        go_backwards: bool = False
+) -> np.ndarray:
+    """
+    Runs a Keras LSTM layer over a batch of sequences.
+
+    The input projection of every time step is computed in a single matrix product; only the recurrent
+    product is evaluated step by step.
+
+    Args:
+        inputs (np.ndarray): Sequences of shape (n, steps, features).
+        kernel (np.ndarray): Input weights of shape (features, 4 * units), gates ordered i, f, c, o.
+        recurrent_kernel (np.ndarray): Recurrent weights of shape (units, 4 * units).
+        bias (np.ndarray): Bias of shape (4 * units,).
+        activation (str): Cell and output activation.
+        recurrent_activation (str): Gate activation.
+        return_sequences (bool): Return the output of every step instead of the last one.
+        go_backwards (bool, optional): Process the sequences in reverse. Outputs are returned in input order.
+
+    Returns:
+        np.ndarray: Outputs of shape (n, steps, units) or (n, units).
+    """
+    count, steps, _ = inputs.shape
+    units = recurrent_kernel.shape[0]
+    activate = ACTIVATIONS[activation]
+    gate = ACTIVATIONS[recurrent_activation]
+
+    projected = inputs @ kernel + bias
+    state = np.zeros((count, units), dtype=inputs.dtype)
+    output = np.zeros((count, units), dtype=inputs.dtype)
+    outputs = np.empty((count, steps, units), dtype=inputs.dtype) if return_sequences else None
+
+    for step in (range(steps - 1, -1, -1) if go_backwards else range(steps)):
+        output, state = _lstm_cell(projected[:, step] + output @ recurrent_kernel, state, activate, gate)
+
+        if return_sequences:
+            outputs[:, step] = output
+
+    return outputs if return_sequences else output
+
+
+def _lstm_cell(z: np.ndarray, state: np.ndarray, activate, gate) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Advances LSTM cells by one step.
+
+    Args:
+        z (np.ndarray): Projected input plus recurrent projection of shape (n, 4 * units), gates ordered i, f, c, o.
+            Overwritten by the gate activations.
+        state (np.ndarray): Cell state of shape (n, units).
+        activate (callable): Cell and output activation, applied in place.
+        gate (callable): Gate activation, applied in place.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The new output and cell state, of shape (n, units).
+    """
+    units = state.shape[1]
+
+    input_gate = gate(z[:, :units])
+    forget_gate = gate(z[:, units:2 * units])
+    candidate = activate(z[:, 2 * units:3 * units])
+    output_gate = gate(z[:, 3 * units:])
+
+    state = forget_gate * state + input_gate * candidate
+
+    return output_gate * activate(state.copy()), state
+
+
+class QuantizedMatrix:
+    """
+    Weight matrix stored in reduced precision and dequantized to float32 on the fly for each matrix product.
+
+    In "float16" the values are stored as half floats. In "int8" every output channel (column) is stored as 8-bit
+    integers with its own float32 scale, `value = int8 * scale[column]`; per-channel scales keep the error of
+    columns with small weights small, whatever the range of the other columns. The scale of a column maps the
+    `clip` quantile of its absolute values to 127, so a calibrated clip below 1 trades the precision of a few
+    outlying weights for the resolution of all the others.
+
+    Args:
+        values (np.ndarray): The stored values, float16 or int8.
+        scale (np.ndarray | None, optional): The per-column scales of int8 values. Defaults to None.
+
+    Attributes:
+        precision (str): "float16" or "int8".
+        shape (tuple[int, ...]): Shape of the matrix.
+        nbytes (int): Bytes used by the values and scales.
+
+    Methods:
+        quantize(matrix, precision, clip): Quantizes a float32 matrix.
+        dequantize(): Returns the matrix in float32.
+    """
+
+    def __init__(self, values: np.ndarray, scale: np.ndarray | None = None):
+        self.values = np.ascontiguousarray(values)
+        self.scale = None if scale is None else np.ascontiguousarray(scale, dtype=np.float32)
+        self.precision = "int8" if self.values.dtype == np.int8 else "float16"
+
+        if self.precision == "int8" and self.scale is None:
+            raise ValueError("int8 values need a scale")
+
+    @classmethod
+    def quantize(cls, matrix: np.ndarray, precision: str, clip: float = 1.0) -> "QuantizedMatrix":
+        """
+        Quantizes a float32 matrix.
+
+        Args:
+            matrix (np.ndarray): The matrix, of shape (inputs, outputs).
+            precision (str): "float16" or "int8".
+            clip (float, optional): Quantile of the absolute values of a column mapped to the largest int8 value,
+                ignored for float16. Defaults to 1 (the largest value).
+
+        Returns:
+            QuantizedMatrix: The quantized matrix.
+
+        Raises:
+            ValueError: Raised if `precision` is not a reduced precision.
+        """
+        if precision == "float16":
+            return cls(matrix.astype(np.float16))
+        if precision != "int8":
+            raise ValueError(f"precision must be float16 or int8, got {precision!r}")
+
+        magnitudes = np.abs(matrix)
+        limits = magnitudes.max(axis=0) if clip >= 1 else np.quantile(magnitudes, clip, axis=0)
+        scale = np.where(limits > 0, limits / 127, 1.0).astype(np.float32)
+
+        return cls(np.clip(np.rint(matrix / scale), -127, 127).astype(np.int8), scale)
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return self.values.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def dequantize(self) -> np.ndarray:
+        """
+        Returns the matrix in float32.
+        """
+        matrix = self.values.astype(np.float32)
+        if self.scale is not None:
+            matrix *= self.scale
+
+        return matrix
+
+
+class NumpyLSTMModel:
+    """
+    NumPy evaluator for the sequential LSTM networks exported by `export_weights`.
+
+    The weights of a `.keras` archive are exported once into a compact `.npz` file, evaluated with vectorized NumPy
+    matrix products: only NumPy is needed at inference time. Exporting needs `h5py`, and verifying the export
+    against the trained Keras model needs Keras.
+
+    Supports `LSTM`, `Bidirectional(LSTM)` with concatenated outputs, `Dense` and `Dropout` (a no-op at inference)
+    layers. `predict` mirrors `keras.Model.predict`, so an instance can replace the Keras model of
+    `LSTMPacketThreadDetection`.
+
+    Weight matrices may be `QuantizedMatrix` instances: they are dequantized layer by layer for each `predict`
+    call, so only the weights of the running layer exist in float32. Biases are always kept in float32.
+
+    Args:
+        layers (list[dict]): Layer descriptions, as stored by `export_weights`.
+        weights (dict[str, np.ndarray | QuantizedMatrix]): Layer weights keyed "<layer index>/<direction>/<name>".
+
+    Attributes:
+        precision (str): "float32", or the precision of the quantized weight matrices.
+        nbytes (int): Bytes used by the weights.
+
+    Methods:
+        load(path): Loads a model exported by `export_weights` or saved by `save`.
+        save(path): Saves the model, keeping quantized weights quantized.
+        quantize(precision, clips): Returns a copy of the model with reduced-precision weight matrices.
+        step(x, state): Advances the network by one time step, carrying the recurrent state of every sequence.
+        predict(x, verbose): Runs the network on a batch of sequences.
+
+    Usage:
+    ```
+    python -m firewall.numpy_lstm export [--keras LSTM.keras] [--output LSTM.npz]
+    python -m firewall.numpy_lstm verify [--keras LSTM.keras] [--weights LSTM.npz] [--samples 4096]
+    ```
+    """
+
+    def __init__(self, layers: list[dict], weights: dict[str, np.ndarray | QuantizedMatrix]):
+        self.layers = layers
+        self.weights = {
+            name: value if isinstance(value, QuantizedMatrix) else np.ascontiguousarray(value, dtype=np.float32)
+            for name, value in weights.items()
+        }
+
+        precisions = {value.precision for value in self.weights.values() if isinstance(value, QuantizedMatrix)}
+        self.precision = precisions.pop() if len(precisions) == 1 else "float32" if not precisions else "mixed"
+
+    @property
+    def nbytes(self) -> int:
+        return sum(value.nbytes for value in self.weights.values())
+
+    @classmethod
+    def load(cls, path: Path | str) -> "NumpyLSTMModel":
+        """
+        Loads a model exported by `export_weights` or saved by `save`.
+
+        Args:
+            path (Path | str): Path to the `.npz` file.
+
+        Returns:
+            NumpyLSTMModel: The model.
+        """
+        with np.load(path, allow_pickle=False) as archive:
+            layers = json.loads(str(archive["layers"]))
+            weights = {
+                name: archive[name] for name in archive.files if name != "layers" and not name.endswith("/scale")
+            }
+
+            for name, value in weights.items():
+                if value.dtype in (np.int8, np.float16):
+                    weights[name] = QuantizedMatrix(value, archive.get(f"{name}/scale"))
+
+        return cls(layers, weights)
+
+    def save(self, path: Path | str):
+        """
+        Saves the model, keeping quantized weights quantized.
+
+        Args:
+            path (Path | str): Path of the `.npz` file to write.
+        """
+        arrays = {}
+        for name, value in self.weights.items():
+            if isinstance(value, QuantizedMatrix):
+                arrays[name] = value.values
+                if value.scale is not None:
+                    arrays[f"{name}/scale"] = value.scale
+            else:
+                arrays[name] = value
+
+        np.savez_compressed(path, layers=np.array(json.dumps(self.layers)), **arrays)
+
+    def quantize(self, precision: str, clips: dict[str, float] | None = None) -> "NumpyLSTMModel":
+        """
+        Returns a copy of the model with reduced-precision weight matrices.
+
+        Args:
+            precision (str): One of `PRECISIONS`; "float32" returns the float32 weights.
+            clips (dict[str, float] | None, optional): The int8 `clip` of some weight matrices, by name, as chosen
+                by `firewall.quantization.calibrate`. Defaults to None (1 for every matrix).
+
+        Returns:
+            NumpyLSTMModel: The quantized model.
+
+        Raises:
+            ValueError: Raised if `precision` is unknown.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {PRECISIONS}")
+
+        clips = clips or {}
+        weights = {}
+        for name, value in self.weights.items():
+            if isinstance(value, QuantizedMatrix):
+                value = value.dequantize()
+            if precision != "float32" and not name.endswith("/bias"):
+                value = QuantizedMatrix.quantize(value, precision, clips.get(name, 1.0))
+            weights[name] = value
+
+        return type(self)(self.layers, weights)
+
+    def _weight(self, name: str) -> np.ndarray:
+        value = self.weights[name]
+
+        return value.dequantize() if isinstance(value, QuantizedMatrix) else value
+
+    def _lstm_layer(self, inputs: np.ndarray, index: int, direction: str, layer: dict, go_backwards: bool = False):
+        prefix = f"{index}/{direction}"
+
+        return _lstm(
+            inputs,
+            self._weight(f"{prefix}/kernel"),
+            self._weight(f"{prefix}/recurrent_kernel"),
+            self.weights[f"{prefix}/bias"],
+            layer["activation"],
+            layer["recurrent_activation"],
+            layer["return_sequences"],
+            go_backwards
+        )
+
+    @property
+    def stream_state_size(self) -> int:
+        """Length of the recurrent state `step` carries per sequence: the (h, c) of every forward LSTM."""
+        return sum(
+            2 * self.weights[f"{index}/forward/recurrent_kernel"].shape[0]
+            for index, layer in enumerate(self.layers) if layer["type"] != "dense"
+        )
+
+    def step(self, x: np.ndarray, state: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Advances the network by one time step on a batch of sequences, carrying their recurrent state.
+
+        Every forward LSTM resumes from the (h, c) state held in `state` and advances by one cell step, and the
+        network output is computed from the new last hidden state, as if the sequence ended with this step. The
+        backward direction of a `Bidirectional` layer would need the steps still to come, so it is evaluated on
+        the current step alone, from a zero state; outputs of such models differ from `predict` on the same
+        sequence, and `firewall.streaming` measures by how much.
+
+        Args:
+            x (np.ndarray): One time step of every sequence, of shape (n, features).
+            state (np.ndarray): The recurrent state of every sequence, of shape (n, `stream_state_size`); zeros
+                start a sequence.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The network outputs of shape (n, outputs), and the new states.
+        """
+        outputs = np.asarray(x, dtype=np.float32)
+        state = np.asarray(state, dtype=np.float32)
+        new_state = np.empty_like(state)
+        offset = 0
+
+        for index, layer in enumerate(self.layers):
+            kind = layer["type"]
+
+            if kind == "dense":
+                outputs = ACTIVATIONS[layer["activation"]](
+                    outputs @ self._weight(f"{index}/forward/kernel") + self.weights[f"{index}/forward/bias"]
+                )
+                continue
+
+            activate = ACTIVATIONS[layer["activation"]]
+            gate = ACTIVATIONS[layer["recurrent_activation"]]
+            recurrent_kernel = self._weight(f"{index}/forward/recurrent_kernel")
+            units = recurrent_kernel.shape[0]
+
+            output, cell = _lstm_cell(
+                outputs @ self._weight(f"{index}/forward/kernel") + self.weights[f"{index}/forward/bias"] +
+                state[:, offset:offset + units] @ recurrent_kernel,
+                state[:, offset + units:offset + 2 * units],
+                activate,
+                gate
+            )
+            new_state[:, offset:offset + units] = output
+            new_state[:, offset + units:offset + 2 * units] = cell
+            offset += 2 * units
+
+            if kind == "bidirectional_lstm":
+                backward, _ = _lstm_cell(
+                    outputs @ self._weight(f"{index}/backward/kernel") + self.weights[f"{index}/backward/bias"],
+                    np.zeros((len(outputs), units), dtype=np.float32),
+                    activate,
+                    gate
+                )
+                output = np.concatenate((output, backward), axis=-1)
+
+            outputs = output
+
+        return outputs, new_state
+
+    def predict(self, x: np.ndarray, verbose: int | str = 0) -> np.ndarray:
+        """
+        Runs the network on a batch of sequences.
+
+        Args:
+            x (np.ndarray): Sequences of shape (n, steps, features).
+            verbose (int | str, optional): Ignored, accepted for compatibility with `keras.Model.predict`.
+
+        Returns:
+            np.ndarray: The network outputs, of shape (n, outputs).
+        """
+        outputs = np.asarray(x, dtype=np.float32)
+
+        if len(outputs) < 1:
+            return np.empty((0, 1), dtype=np.float32)
+
+        for index, layer in enumerate(self.layers):
+            kind = layer["type"]
+
+            if kind == "lstm":
+                outputs = self._lstm_layer(outputs, index, "forward", layer)
+            elif kind == "bidirectional_lstm":
+                outputs = np.concatenate([
+                    self._lstm_layer(outputs, index, "forward", layer),
+                    self._lstm_layer(outputs, index, "backward", layer, go_backwards=True),
+                ], axis=-1)
+            elif kind == "dense":
+                outputs = ACTIVATIONS[layer["activation"]](
+                    outputs @ self._weight(f"{index}/forward/kernel") + self.weights[f"{index}/forward/bias"]
+                )
+
+        return outputs
+
+
+def _read_keras_archive(keras_path: Path | str) -> tuple[dict, dict[str, np.ndarray]]:
+    """
+    Reads the model config and the weight datasets of a `.keras` archive.
+
+    Dataset paths are normalized to "/" separators, since archives saved on Windows use "\\".
+
+    Args:
+        keras_path (Path | str): Path to the `.keras` archive.
+
+    Returns:
+        tuple[dict, dict[str, np.ndarray]]: The model config and the weights keyed by dataset path.
+    """
+    import h5py
+
+    with zipfile.ZipFile(keras_path) as archive:
+        config = json.loads(archive.read("config.json"))
+        weights_file = io.BytesIO(archive.read("model.weights.h5"))
+
+    datasets = {}
+    with h5py.File(weights_file, "r") as weights:
+        weights.visititems(
+            lambda name, item: datasets.__setitem__(name.replace("\\", "/"), item[()])
+            if isinstance(item, h5py.Dataset) else None
+        )
+
+    return config, datasets
+
+
+def _layer_variables(datasets: dict[str, np.ndarray], path: str) -> list[np.ndarray]:
+    """
+    Returns the variables stored under a layer path, in index order.
+    """
+    prefix = f"_layer_checkpoint_dependencies/{path}/vars/"
+    variables = {int(name[len(prefix):]): value for name, value in datasets.items() if name.startswith(prefix)}
+
+    return [variables[index] for index in sorted(variables)]
+
+
+def export_weights(keras_path: Path | str, output_path: Path | str) -> list[dict]:
+    """
+    Exports the weights of a sequential `.keras` LSTM model into an `.npz` file for `NumpyLSTMModel`.
+
+    Args:
+        keras_path (Path | str): Path to the `.keras` archive.
+        output_path (Path | str): Path of the `.npz` file to write.
+
+    Returns:
+        list[dict]: The exported layer descriptions.
+
+    Raises:
+        ValueError: Raised if the model uses a layer or option `NumpyLSTMModel` does not support.
+    """
+    config, datasets = _read_keras_archive(keras_path)
+
+    # The weights file names layers after their class ("lstm", "dense", "dense_2", ...) rather than their
+    # configured name, numbering repeated classes in model order.
+    stored_layers = {
+        path.split("/")[1] for path in datasets if path.startswith("_layer_checkpoint_dependencies/")
+    }
+
+    def take_stored_layer(class_name: str) -> str:
+        snake_name = re.sub(r"([a-z])([A-Z])", r"\1_\2", re.sub(r"(.)([A-Z][a-z]+)", r"\1_\2", class_name)).lower()
+        candidates = sorted(
+            (name for name in stored_layers if re.fullmatch(rf"{snake_name}(_\d+)?", name)),
+            key=lambda name: int(name.rsplit("_", 1)[1]) if name != snake_name else 0
+        )
+        stored_layers.remove(candidates[0])
+
+        return candidates[0]
+
+    def describe_lstm(lstm_config: dict) -> dict:
+        if lstm_config.get("go_backwards") or lstm_config.get("stateful") or not lstm_config.get("use_bias", True):
+            raise ValueError(f"Unsupported LSTM options in layer {lstm_config['name']}")
+
+        return {
+            "activation": lstm_config["activation"],
+            "recurrent_activation": lstm_config["recurrent_activation"],
+            "return_sequences": lstm_config["return_sequences"],
+        }
+
+    layers = []
+    arrays = {}
+
+    for layer in config["config"]["layers"]:
+        class_name = layer["class_name"]
+        layer_config = layer["config"]
+        index = len(layers)
+
+        if class_name in ("InputLayer", "Dropout"):
+            continue
+
+        stored_name = take_stored_layer(class_name)
+
+        if class_name == "LSTM":
+            layers.append({"type": "lstm", **describe_lstm(layer_config)})
+            directions = {"forward": f"{stored_name}/cell"}
+        elif class_name == "Bidirectional":
+            if layer_config.get("merge_mode", "concat") != "concat" or layer_config["layer"]["class_name"] != "LSTM":
+                raise ValueError(f"Unsupported Bidirectional layer {layer_config['name']}")
+
+            layers.append({"type": "bidirectional_lstm", **describe_lstm(layer_config["layer"]["config"])})
+            directions = {
+                "forward": f"{stored_name}/forward_layer/cell",
+                "backward": f"{stored_name}/backward_layer/cell",
+            }
+        elif class_name == "Dense":
+            layers.append({"type": "dense", "activation": layer_config["activation"]})
+            directions = {"forward": stored_name}
+        else:
+            raise ValueError(f"Unsupported layer {class_name}")
+
+        if layers[-1].get("activation") not in ACTIVATIONS:
+            raise ValueError(f"Unsupported activation in layer {layer_config['name']}")
+
+        for direction, path in directions.items():
+            names = ("kernel", "recurrent_kernel", "bias") if class_name != "Dense" else ("kernel", "bias")
+            for name, value in zip(names, _layer_variables(datasets, path), strict=True):
+                arrays[f"{index}/{direction}/{name}"] = value.astype(np.float32)
+
+    np.savez_compressed(output_path, layers=np.array(json.dumps(layers)), **arrays)
+
+    return layers
+
+
+def _keras_3_config(config):
+    """
+    Drops from a Keras 2 model config the layer options Keras 3 no longer accepts.
+    """
+    if isinstance(config, list):
+        return [_keras_3_config(item) for item in config]
+    if not isinstance(config, dict):
+        return config
+
+    config = {key: _keras_3_config(value) for key, value in config.items() if key != "time_major"}
+    if isinstance(config.get("config"), dict) and "batch_input_shape" in config["config"]:
+        batch_shape = config["config"].pop("batch_input_shape")
+        if config.get("class_name") == "InputLayer":
+            config["config"]["batch_shape"] = batch_shape
+
+    return config
+
+
+def _load_keras_model(keras_path: Path | str):
+    """
+    Loads the trained model of a `.keras` archive through Keras, as the reference of `verify`.
+
+    Keras 3 cannot load the archives Keras 2 saved on Windows as they are: their config holds options Keras 3
+    dropped, their dataset paths use "\\" and their weights file numbers repeated layer classes across the whole
+    training session ("dense", "dense_2") where Keras 3 numbers them per model ("dense", "dense_1"). Such archives
+    are loaded from a copy with these fixed; Keras still reads the trained variables into its layers itself, so the
+    mapping of `export_weights` is not involved.
+    """
+    import h5py
+    import keras
+
+    try:
+        return keras.models.load_model(keras_path, compile=False)
+    except ValueError:
+        pass
+
+    with zipfile.ZipFile(keras_path) as archive:
+        files = {name: archive.read(name) for name in archive.namelist()}
+
+    with h5py.File(io.BytesIO(files["model.weights.h5"]), "r") as weights:
+        items = {}
+        weights.visititems(lambda name, item: items.__setitem__(
+            name.replace("\\", "/"), item[()] if isinstance(item, h5py.Dataset) else None
+        ))
+
+    renamed = {}
+    stored_layers = {path.split("/")[1] for path in items if path.startswith("_layer_checkpoint_dependencies/")}
+    for base in {re.fullmatch(r"(.+?)(_\d+)?", name).group(1) for name in stored_layers}:
+        numbered = sorted(
+            (name for name in stored_layers if re.fullmatch(rf"{base}(_\d+)?", name)),
+            key=lambda name: int(name.rsplit("_", 1)[1]) if name != base else 0
+        )
+        renamed.update({name: base if rank == 0 else f"{base}_{rank}" for rank, name in enumerate(numbered)})
+
+    weights_file = io.BytesIO()
+    with h5py.File(weights_file, "w") as weights:
+        for path, value in sorted(items.items()):
+            parts = path.split("/")
+            if parts[0] == "_layer_checkpoint_dependencies" and len(parts) > 1:
+                parts[1] = renamed[parts[1]]
+            if value is None:
+                weights.require_group("/".join(parts))
+            else:
+                weights.create_dataset("/".join(parts), data=value)
+
+    files["config.json"] = json.dumps(_keras_3_config(json.loads(files["config.json"]))).encode("utf-8")
+    files["model.weights.h5"] = weights_file.getvalue()
+
+    with tempfile.TemporaryDirectory() as directory:
+        portable_path = Path(directory, "model.keras")
+        with zipfile.ZipFile(portable_path, "w") as archive:
+            for name, data in files.items():
+                archive.writestr(name, data)
+
+        return keras.models.load_model(portable_path, compile=False)
+
+
+def verify(keras_path: Path | str, weights_path: Path | str, samples: int = 4096, seq_length: int = 10) -> float:
+    """
+    Compares `NumpyLSTMModel` with the trained Keras model on random standardized input sequences.
+
+    Args:
+        keras_path (Path | str): Path to the `.keras` archive.
+        weights_path (Path | str): Path to the exported `.npz` file.
+        samples (int, optional): Number of input sequences. Defaults to 4096.
+        seq_length (int, optional): Length of the input sequences. Defaults to 10.
+
+    Returns:
+        float: The largest absolute difference between the two models' predictions.
+    """
+    model = NumpyLSTMModel.load(weights_path)
+    reference = _load_keras_model(keras_path)
+
+    x = np.random.default_rng(0).standard_normal((samples, seq_length, 3)).astype(np.float32)
+
+    return float(np.max(np.abs(reference.predict(x, verbose=0) - model.predict(x))))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Export or verify the NumPy LSTM weights.")
+    parser.add_argument("command", choices=("export", "verify"))
+    parser.add_argument("--keras", default=PRE_TRAINED_MODELS / "LSTM.keras", help="Path to the .keras model.")
+    parser.add_argument("--weights", "--output", default=PRE_TRAINED_MODELS / "LSTM.npz", help="Path to the .npz file.")
+    parser.add_argument("--samples", type=int, default=4096, help="Input sequences compared by verify.")
+    parser.add_argument("--tolerance", type=float, default=1e-5, help="Largest accepted difference for verify.")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        exported = export_weights(args.keras, args.weights)
+        print(f"Exported {len(exported)} layers to {args.weights}")
+    else:
+        difference = verify(args.keras, args.weights, args.samples)
+        print(f"Largest absolute difference over {args.samples} sequences: {difference:.3g}")
+        sys.exit(0 if difference <= args.tolerance else 1)
@@ -0,0 +1,271 @@
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+from firewall.batch import PacketBatch
+
+# Byte order and timestamp resolution of the classic pcap format, by magic number.
+PCAP_MAGICS: dict[bytes, tuple[str, float]] = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+
+LINKTYPE_ETHERNET: int = 1
+ETHERTYPE_IP: int = 0x0800
+IPPROTO_TCP: int = 6
+
+GLOBAL_HEADER_SIZE: int = 24
+RECORD_HEADER_SIZE: int = 16
+ETHERNET_HEADER_SIZE: int = 14
+MIN_IP_HEADER_SIZE: int = 20
+
+
+class PcapError(Exception):
+    """Raised when a file is not a pcap capture of Ethernet frames."""
+
+    pass
+
+
+def _gather(data: np.ndarray, positions: np.ndarray, dtype: str) -> np.ndarray:
+    """
+    Reads one fixed-size field at every position of a byte array at once.
+
+    Args:
+        data (np.ndarray): The bytes, as uint8.
+        positions (np.ndarray): The offset of the field in every record.
+        dtype (str): The field type, with its byte order, e.g. ">u2".
+
+    Returns:
+        np.ndarray: The field values in native byte order, one per position.
+    """
+    dtype = np.dtype(dtype)
+    raw = data[positions[:, None] + np.arange(dtype.itemsize)]
+
+    return raw.view(dtype).reshape(-1).astype(dtype.newbyteorder("="))
+
+
+class PcapReader:
+    """
+    Memory-mapped reader of classic pcap captures, such as those written by `MainWindow::saveToFile`.
+
+    The file is walked chunk by chunk: the record offsets of a chunk are found first, then the Ethernet, IPv4 and
+    TCP header fields of all its records are read at once with NumPy, and the chunk is returned as a `PacketBatch`.
+    Packets are decoded like `MainWindow::packetHandler` decodes them: only IPv4 frames are kept, the size is the
+    original packet length, and the ports are those of the TCP header, 0 for other protocols.
+
+    Pages already parsed are handed back to the kernel, so a capture of any size is read with the memory of a
+    single chunk.
+
+    Args:
+        path (Path | str): The capture file.
+        chunk_packets (int, optional): Records parsed per chunk. Defaults to 65536.
+
+    Attributes:
+        snaplen (int): The capture length limit of the file.
+        records (int): The records read so far.
+        skipped_records (int): The records read so far that are not IPv4 packets.
+        truncated (bool): Whether the last record of the file was cut short, e.g. by a capture still being written.
+
+    Raises:
+        PcapError: Raised if the file is not a pcap capture of Ethernet frames.
+
+    Methods:
+        batches(): Yields the IPv4 packets of the capture, one `PacketBatch` per chunk.
+        close(): Unmaps the file.
+
+    Usage:
+    ```python
+    with PcapReader("capture.pcap") as reader:
+        for batch in reader.batches():
+            ...
+    ```
+    """
+
+    def __init__(self, path: Path | str, chunk_packets: int = 65536):
+        if chunk_packets < 1:
+            raise ValueError("chunk_packets must be at least 1")
+
+        self.path = Path(path)
+        self.chunk_packets = chunk_packets
+        self.records = 0
+        self.skipped_records = 0
+        self.truncated = False
+
+        with open(self.path, "rb") as file:
+            if os.fstat(file.fileno()).st_size < GLOBAL_HEADER_SIZE:
+                raise PcapError(f"{self.path} is too short to be a pcap capture")
+
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._read_global_header()
+        except PcapError:
+            self._mmap.close()
+            raise
+
+        if hasattr(self._mmap, "madvise"):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+
+        self._data = np.frombuffer(self._mmap, dtype=np.uint8)
+        self._released = 0
+
+    def _read_global_header(self):
+        """
+        Checks the magic number and link type, and sets up the byte order of the record headers.
+        """
+        magic = self._mmap[:4]
+        if magic not in PCAP_MAGICS:
+            raise PcapError(f"{self.path} is not a pcap capture (pcapng is not supported)")
+
+        self._byte_order, self._timestamp_unit = PCAP_MAGICS[magic]
+
+        *_, self.snaplen, link_type = struct.unpack_from(f"{self._byte_order}HHiIII", self._mmap, 4)
+        if link_type & 0xFFFF != LINKTYPE_ETHERNET:
+            raise PcapError(f"{self.path} holds link type {link_type & 0xFFFF}, not Ethernet")
+
+        self._record_length = struct.Struct(f"{self._byte_order}I")
+
+    def __enter__(self) -> "PcapReader":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Unmaps the file.
+        """
+        if self._mmap.closed:
+            return
+
+        # The mapping cannot be closed while an array still exports it.
+        del self._data
+        self._mmap.close()
+
+    def _record_offsets(self, offset: int) -> tuple[np.ndarray, int]:
+        """
+        Walks the record headers of one chunk.
+
+        Args:
+            offset (int): The offset of the first record header of the chunk.
+
+        Returns:
+            tuple: The offsets of the complete records of the chunk, and the offset following them.
+        """
+        end = len(self._mmap)
+        unpack_length = self._record_length.unpack_from
+        mapping = self._mmap
+        offsets = []
+
+        for _ in range(self.chunk_packets):
+            if offset + RECORD_HEADER_SIZE > end:
+                self.truncated = offset != end
+                break
+
+            captured_length = unpack_length(mapping, offset + 8)[0]
+            if offset + RECORD_HEADER_SIZE + captured_length > end:
+                self.truncated = True
+                break
+
+            offsets.append(offset)
+            offset += RECORD_HEADER_SIZE + captured_length
+
+        return np.array(offsets, dtype=np.int64), offset
+
+    def _parse_records(self, offsets: np.ndarray) -> PacketBatch:
+        """
+        Decodes the IPv4 packets of a chunk of records.
+
+        Args:
+            offsets (np.ndarray): The offsets of the record headers.
+
+        Returns:
+            PacketBatch: The IPv4 packets of the records, in capture order.
+        """
+        data = self._data
+        unsigned = f"{self._byte_order}u4"
+
+        captured_lengths = _gather(data, offsets + 8, unsigned)
+
+        # Only read the Ethernet type of frames long enough to hold an Ethernet and an IPv4 header.
+        offsets = offsets[captured_lengths >= ETHERNET_HEADER_SIZE + MIN_IP_HEADER_SIZE]
+        frames = offsets + RECORD_HEADER_SIZE
+        offsets = offsets[_gather(data, frames + 12, ">u2") == ETHERTYPE_IP]
+
+        frames = offsets + RECORD_HEADER_SIZE
+        ip_headers = frames + ETHERNET_HEADER_SIZE
+        ip_header_sizes = (data[ip_headers] & 0x0F).astype(np.int64) * 4
+        captured_lengths = _gather(data, offsets + 8, unsigned).astype(np.int64)
+
+        valid = (ip_header_sizes >= MIN_IP_HEADER_SIZE) & (
+            captured_lengths >= ETHERNET_HEADER_SIZE + ip_header_sizes
+        )
+        offsets, ip_headers, ip_header_sizes, captured_lengths = (
+            offsets[valid], ip_headers[valid], ip_header_sizes[valid], captured_lengths[valid]
+        )
+
+        # Ports are only read from unfragmented TCP segments, or first fragments, whose header was captured.
+        transport_headers = ip_headers + ip_header_sizes
+        tcp = (
+            (data[ip_headers + 9] == IPPROTO_TCP) &
+            (_gather(data, ip_headers + 6, ">u2") & 0x1FFF == 0) &
+            (captured_lengths >= ETHERNET_HEADER_SIZE + ip_header_sizes + 4)
+        )
+        source_port = np.zeros(len(offsets), dtype=np.uint16)
+        destination_port = np.zeros(len(offsets), dtype=np.uint16)
+        source_port[tcp] = _gather(data, transport_headers[tcp], ">u2")
+        destination_port[tcp] = _gather(data, transport_headers[tcp] + 2, ">u2")
+
+        return PacketBatch.from_columns(
+            timestamps=(
+                _gather(data, offsets, unsigned) +
+                _gather(data, offsets + 4, unsigned) * self._timestamp_unit
+            ),
+            sizes=_gather(data, offsets + 12, unsigned),
+            source_ip=_gather(data, ip_headers + 12, ">u4"),
+            destination_ip=_gather(data, ip_headers + 16, ">u4"),
+            source_port=source_port,
+            destination_port=destination_port
+        )
+
+    def _release(self, offset: int):
+        """
+        Drops the parsed pages before `offset` from memory; they are read back from the file if needed again.
+        """
+        if not hasattr(self._mmap, "madvise"):
+            return
+
+        boundary = offset - offset % mmap.PAGESIZE
+        if boundary > self._released:
+            self._mmap.madvise(mmap.MADV_DONTNEED, self._released, boundary - self._released)
+            self._released = boundary
+
+    def batches(self) -> Iterator[PacketBatch]:
+        """
+        Yields the IPv4 packets of the capture, one `PacketBatch` per chunk of records.
+
+        Chunks without IPv4 packets are skipped, so every batch holds at least one packet.
+
+        Yields:
+            PacketBatch: The packets of a chunk, in capture order.
+        """
+        offset = GLOBAL_HEADER_SIZE
+
+        while True:
+            offsets, offset = self._record_offsets(offset)
+            if not len(offsets):
+                return
+
+            batch = self._parse_records(offsets)
+            self.records += len(offsets)
+            self.skipped_records += len(offsets) - len(batch)
+            self._release(offset)
+
+            if len(batch):
+                yield batch
@@ -0,0 +1,270 @@
+"""
+Calibration and accuracy report of the reduced-precision NumPy LSTM.
+
+`NumpyLSTMModel.quantize` stores the weight matrices in float16, or in int8 with one scale per output channel. The
+int8 scales are calibrated on recorded traffic: for every weight matrix in turn, the clipping quantile that keeps
+the model predictions closest to the float32 model on the calibration windows is kept. The report then compares
+the verdicts of every precision with those of the float32 model on held-out windows, along with the weight size
+and inference time, and recommends the fastest precision whose verdicts stay within a tolerance.
+
+The windows are cut from pcap captures like the Brain server cuts live traffic: tumbling windows of
+`seq_length + 1` packets per flow, rated from the model input sequence of their first `seq_length` packets.
+
+Usage:
+    python -m firewall.quantization report capture.pcap [--tolerance 0.001] [--batch-size 1] [--output report.json]
+    python -m firewall.quantization calibrate capture.pcap --precision int8 [--output LSTM.int8.npz]
+"""
+import json
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+
+from firewall.LSTM import LSTMPacketThreadDetection
+from firewall.features import FeatureExtractor, FlowFeatures
+from firewall.numpy_lstm import PRECISIONS, PRE_TRAINED_MODELS, NumpyLSTMModel
+from firewall.pcap import PcapReader
+
+# Clipping quantiles tried for every int8 weight matrix; 1 maps the largest weight of a channel to 127.
+CLIP_CANDIDATES: tuple[float, ...] = (1.0, 0.9999, 0.999, 0.995, 0.99)
+
+
+def capture_sequences(
+        paths: list[Path | str],
+        detector: LSTMPacketThreadDetection,
+        max_windows: int | None = None
+) -> np.ndarray:
+    """
+    Cuts pcap captures into the model input sequences of their flow windows.
+
+    Args:
+        paths (list[Path | str]): The pcap files, in capture order.
+        detector (LSTMPacketThreadDetection): The detector whose scaler and sequence length are used.
+        max_windows (int | None, optional): Stop after this many windows. Defaults to None (every window).
+
+    Returns:
+        np.ndarray: Input sequences of shape (windows, seq_length, 3), in float32.
+    """
+    extractor = FeatureExtractor(detector.scaler, detector.seq_length)
+    flows: dict[tuple, FlowFeatures] = {}
+    sequences = []
+
+    for path in paths:
+        with PcapReader(path) as reader:
+            for batch in reader.batches():
+                columns = batch.columns
+
+                for size, source_ip, destination_ip, source_port, destination_port in zip(
+                        columns["sizes"].tolist(),
+                        columns["source_ip"].tolist(),
+                        columns["destination_ip"].tolist(),
+                        columns["source_port"].tolist(),
+                        columns["destination_port"].tolist()
+                ):
+                    key = (source_ip, destination_ip, source_port, destination_port)
+                    features = flows.get(key)
+                    if features is None:
+                        features = flows[key] = extractor.new_flow(source_port, destination_port)
+
+                    features.update(size)
+                    if features.packets % extractor.window_size == 0:
+                        sequences.append(features.sequences())
+
+                        if max_windows is not None and len(sequences) >= max_windows:
+                            return np.concatenate(sequences).astype(np.float32)
+
+    if not sequences:
+        return np.empty((0, detector.seq_length, 3), dtype=np.float32)
+
+    return np.concatenate(sequences).astype(np.float32)
+
+
+def calibrate(
+        model: NumpyLSTMModel,
+        sequences: np.ndarray,
+        precision: str,
+        candidates: tuple[float, ...] = CLIP_CANDIDATES
+) -> tuple[NumpyLSTMModel, dict[str, float]]:
+    """
+    Quantizes a model, choosing the int8 clipping of every weight matrix on calibration windows.
+
+    The matrices are calibrated one after the other, each keeping the clipping that minimizes the mean absolute
+    difference between the predictions of the quantized and of the float32 model, with the matrices calibrated
+    before it already quantized. float16 has no parameters, so it is only quantized.
+
+    Args:
+        model (NumpyLSTMModel): The float32 model.
+        sequences (np.ndarray): Calibration input sequences of shape (n, seq_length, 3).
+        precision (str): One of `PRECISIONS`.
+        candidates (tuple[float, ...], optional): The clipping quantiles tried. Defaults to `CLIP_CANDIDATES`.
+
+    Returns:
+        tuple[NumpyLSTMModel, dict[str, float]]: The quantized model and the clipping chosen per weight matrix.
+
+    Raises:
+        ValueError: Raised if there are no calibration windows for int8.
+    """
+    if precision != "int8":
+        return model.quantize(precision), {}
+
+    if not len(sequences):
+        raise ValueError("int8 calibration needs at least one window")
+
+    reference = model.predict(sequences).reshape(-1)
+    clips: dict[str, float] = {}
+
+    for name in model.weights:
+        if name.endswith("/bias"):
+            continue
+
+        errors = {}
+        for clip in candidates:
+            candidate = model.quantize(precision, {**clips, name: clip})
+            errors[clip] = float(np.mean(np.abs(candidate.predict(sequences).reshape(-1) - reference)))
+
+        clips[name] = min(errors, key=errors.get)
+
+    return model.quantize(precision, clips), clips
+
+
+def rate(predictions: np.ndarray, flagged_threshold: float, unsafe_threshold: float) -> np.ndarray:
+    """
+    Rates predictions like `LSTMPacketThreadDetection.rate`, without the random demo override.
+    """
+    return (predictions >= flagged_threshold).astype(np.int64) + (predictions >= unsafe_threshold)
+
+
+def compare(
+        reference: NumpyLSTMModel,
+        models: dict[str, NumpyLSTMModel],
+        sequences: np.ndarray,
+        flagged_threshold: float = 0.5,
+        unsafe_threshold: float = 0.9,
+        batch_size: int = 1
+) -> list[dict]:
+    """
+    Compares the predictions and verdicts of models with those of the float32 model.
+
+    Args:
+        reference (NumpyLSTMModel): The float32 model.
+        models (dict[str, NumpyLSTMModel]): The models to compare, by name; include the reference to time it.
+        sequences (np.ndarray): Evaluation input sequences of shape (n, seq_length, 3).
+        flagged_threshold (float, optional): Threshold for flagging traffic as suspicious. Defaults to 0.5.
+        unsafe_threshold (float, optional): Threshold for flagging traffic as unsafe. Defaults to 0.9.
+        batch_size (int, optional): Windows per model call when timing. Defaults to 1, like scoring one flow.
+
+    Returns:
+        list[dict]: Per model: weight bytes, seconds per window, largest and mean absolute prediction error, share
+            of windows whose verdict differs from the float32 verdict and the verdict changes by
+            "<float32 rating>-><rating>".
+    """
+    expected = reference.predict(sequences).reshape(-1)
+    expected_ratings = rate(expected, flagged_threshold, unsafe_threshold)
+    results = []
+
+    for name, model in models.items():
+        started_at = time.perf_counter()
+        predictions = np.concatenate([
+            model.predict(sequences[start:start + batch_size]).reshape(-1)
+            for start in range(0, len(sequences), batch_size)
+        ]) if len(sequences) else np.empty(0, dtype=np.float32)
+        elapsed = time.perf_counter() - started_at
+
+        ratings = rate(predictions, flagged_threshold, unsafe_threshold)
+        changed = ratings != expected_ratings
+        errors = np.abs(predictions - expected)
+
+        results.append({
+            "precision": name,
+            "weight_bytes": model.nbytes,
+            "windows": len(sequences),
+            "seconds_per_window": elapsed / len(sequences) if len(sequences) else float("nan"),
+            "max_abs_error": float(errors.max()) if len(errors) else 0.0,
+            "mean_abs_error": float(errors.mean()) if len(errors) else 0.0,
+            "verdict_mismatch": float(changed.mean()) if len(changed) else 0.0,
+            "verdict_changes": {
+                f"{before}->{after}": int(count)
+                for (before, after), count in zip(*np.unique(
+                    np.column_stack((expected_ratings[changed], ratings[changed])), axis=0, return_counts=True
+                ))
+            },
+        })
+
+    return results
+
+
+def pick_precision(results: list[dict], tolerance: float) -> str:
+    """
+    Returns the fastest precision whose verdicts differ from the float32 verdicts on at most `tolerance` of the
+    windows; float32 itself always qualifies.
+
+    Args:
+        results (list[dict]): The results of `compare`.
+        tolerance (float): The largest accepted share of changed verdicts.
+
+    Returns:
+        str: The precision.
+    """
+    eligible = [
+        result for result in results
+        if result["precision"] == "float32" or result["verdict_mismatch"] <= tolerance
+    ]
+
+    return min(eligible, key=lambda result: result["seconds_per_window"])["precision"] if eligible else "float32"
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Calibrate the reduced-precision LSTM and report its accuracy.")
+    parser.add_argument("command", choices=("report", "calibrate"))
+    parser.add_argument("captures", nargs="+", help="The pcap files of recorded traffic, in capture order.")
+    parser.add_argument("--weights", default=PRE_TRAINED_MODELS / "LSTM.npz", help="The float32 .npz weights.")
+    parser.add_argument("--precision", choices=PRECISIONS, default="int8", help="The precision calibrate writes.")
+    parser.add_argument("--output", default=None, help="The .npz (calibrate) or JSON (report) file to write.")
+    parser.add_argument("--calibration-windows", type=int, default=2048, help="Windows used for calibration.")
+    parser.add_argument("--evaluation-windows", type=int, default=8192, help="Held-out windows of the report.")
+    parser.add_argument("--tolerance", type=float, default=0.001, help="Largest accepted share of changed verdicts.")
+    parser.add_argument("--batch-size", type=int, default=1, help="Windows per model call when timing.")
+    args = parser.parse_args()
+
+    detector = LSTMPacketThreadDetection(model_path=args.weights, backend="numpy")
+    float_model = detector.model
+
+    windows = capture_sequences(
+        args.captures, detector, args.calibration_windows + (args.evaluation_windows if args.command == "report" else 0)
+    )
+    windows = windows[np.random.default_rng(0).permutation(len(windows))]
+    calibration, evaluation = windows[:args.calibration_windows], windows[args.calibration_windows:]
+
+    if args.command == "calibrate":
+        quantized, chosen_clips = calibrate(float_model, calibration, args.precision)
+        output = args.output or PRE_TRAINED_MODELS / f"LSTM.{args.precision}.npz"
+        quantized.save(output)
+        print(f"Calibrated {args.precision} on {len(calibration)} windows, {quantized.nbytes} weight bytes: {output}")
+        print(json.dumps(chosen_clips, indent=2))
+    else:
+        if not len(evaluation):
+            parser.error("the captures hold no windows beyond the calibration windows")
+
+        report = compare(
+            float_model,
+            {precision: calibrate(float_model, calibration, precision)[0] for precision in PRECISIONS},
+            evaluation,
+            detector.flagged_threshold,
+            detector.unsafe_threshold,
+            args.batch_size
+        )
+
+        print(f"{'precision':>9} {'bytes':>8} {'us/window':>10} {'max error':>10} {'mean error':>11} {'mismatch':>9}")
+        for result in report:
+            print(
+                f"{result['precision']:>9} {result['weight_bytes']:>8} {result['seconds_per_window'] * 1e6:>10.1f} "
+                f"{result['max_abs_error']:>10.2e} {result['mean_abs_error']:>11.2e} {result['verdict_mismatch']:>9.3%}"
+            )
+        print(
+            f"Fastest precision within {args.tolerance:.3%} changed verdicts: "
+            f"{pick_precision(report, args.tolerance)}"
+        )
+
+        if args.output:
+            Path(args.output).write_text(json.dumps(report, indent=2))
@@ -0,0 +1,387 @@
+import ipaddress
+from bisect import bisect_right
+from pathlib import Path
+from threading import Lock
+from typing import NamedTuple
+
+ACTIONS: tuple[str, ...] = ("allow", "deny")
+DIRECTIONS: tuple[str, ...] = ("source", "destination")
+
+# Traffic rating given by a matching rule, on the scale of `ThreadDetection.predict`.
+ACTION_VERDICTS: dict[str, int] = {"allow": 0, "deny": 2}
+
+ALL_PORTS: tuple[int, int] = (0, 65535)
+
+
+class RuleError(ValueError):
+    """Raised when a rule cannot be parsed."""
+
+    pass
+
+
+class Rule(NamedTuple):
+    """
+    An allow or deny rule for the traffic of a network.
+
+    Attributes:
+        action (str): "allow" or "deny".
+        direction (str): Whether `network` is matched against the "source" or the "destination" address.
+        network (ipaddress.IPv4Network | ipaddress.IPv6Network): The network the rule applies to.
+        ports (tuple[int, int]): The inclusive range of destination ports the rule applies to.
+    """
+
+    action: str
+    direction: str
+    network: ipaddress.IPv4Network | ipaddress.IPv6Network
+    ports: tuple[int, int] = ALL_PORTS
+
+    @property
+    def verdict(self) -> int:
+        """Traffic rating of the packets the rule matches (0 for allow, 2 for deny)."""
+        return ACTION_VERDICTS[self.action]
+
+    @classmethod
+    def parse(cls, line: str) -> "Rule":
+        """
+        Parses a rule written as `<allow|deny> <source|destination> <network> [<port>|<low>-<high>]`,
+        e.g. `deny source 203.0.113.0/24 22` or `allow destination 2001:db8::/32`.
+
+        Args:
+            line (str): The rule.
+
+        Returns:
+            Rule: The parsed rule.
+
+        Raises:
+            RuleError: Raised if the rule is malformed.
+        """
+        fields = line.split()
+        if len(fields) not in (3, 4):
+            raise RuleError(f"Expected '<action> <direction> <network> [ports]', got {line!r}")
+
+        action, direction, network = fields[:3]
+        if action not in ACTIONS:
+            raise RuleError(f"Action must be one of {ACTIONS}, got {action!r}")
+        if direction not in DIRECTIONS:
+            raise RuleError(f"Direction must be one of {DIRECTIONS}, got {direction!r}")
+
+        try:
+            network = ipaddress.ip_network(network, strict=False)
+        except ValueError as e:
+            raise RuleError(str(e)) from None
+
+        ports = ALL_PORTS
+        if len(fields) == 4:
+            try:
+                low, _, high = fields[3].partition("-")
+                ports = (int(low), int(high or low))
+            except ValueError:
+                raise RuleError(f"Invalid port range {fields[3]!r}") from None
+
+            if not 0 <= ports[0] <= ports[1] <= 65535:
+                raise RuleError(f"Invalid port range {fields[3]!r}")
+
+        return cls(action, direction, network, ports)
+
+
+def parse_rules(text: str) -> list[Rule]:
+    """
+    Parses one rule per line, skipping blank lines and `#` comments.
+
+    Args:
+        text (str): The rules.
+
+    Returns:
+        list[Rule]: The rules, in order.
+
+    Raises:
+        RuleError: Raised with the line number if a rule is malformed.
+    """
+    rules = []
+
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+
+        try:
+            rules.append(Rule.parse(line))
+        except RuleError as e:
+            raise RuleError(f"Line {number}: {e}") from None
+
+    return rules
+
+
+class PortRangeIndex:
+    """
+    Interval index of the port ranges of the rules sharing one network.
+
+    The port space is cut into the elementary intervals delimited by the rule ranges, and every interval stores
+    the rule that wins on it, so a lookup is a single binary search. Deny rules win over allow rules; among rules
+    of the same action, the first one listed wins.
+
+    Args:
+        rules (list[Rule]): The rules of the network, in order.
+
+    Methods:
+        match(port): Returns the rule for a port, or None.
+    """
+
+    __slots__ = ("starts", "rules")
+
+    def __init__(self, rules: list[Rule]):
+        bounds = sorted({port for rule in rules for port in (rule.ports[0], rule.ports[1] + 1)})
+        ranked = sorted(rules, key=lambda rule: rule.action != "deny")
+
+        self.starts = bounds
+        self.rules = [
+            next((rule for rule in ranked if rule.ports[0] <= start <= rule.ports[1]), None)
+            for start in bounds
+        ]
+
+    def match(self, port: int) -> Rule | None:
+        """
+        Returns the rule for a port.
+
+        Args:
+            port (int): The destination port.
+
+        Returns:
+            Rule | None: The winning rule whose range holds the port, None if no range does.
+        """
+        index = bisect_right(self.starts, port) - 1
+
+        return self.rules[index] if index >= 0 else None
+
+
+class PrefixTrie:
+    """
+    Binary trie of network prefixes for longest-prefix matching.
+
+    Every node is a `[zero child, one child, value]` list; a lookup follows the bits of the address, so it costs
+    at most one step per bit of the longest prefix stored.
+
+    Args:
+        bits (int): Address length, 32 for IPv4 and 128 for IPv6.
+
+    Methods:
+        insert(prefix, length, value): Stores a value for a prefix.
+        matches(address): Returns the values of every prefix holding an address, longest first.
+    """
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.depth = 0
+        self.root: list = [None, None, None]
+
+    def insert(self, prefix: int, length: int, value):
+        """
+        Stores a value for a prefix, replacing the previous one.
+
+        Args:
+            prefix (int): The network address.
+            length (int): The prefix length.
+            value: The value.
+        """
+        node = self.root
+
+        for shift in range(self.bits - 1, self.bits - 1 - length, -1):
+            bit = (prefix >> shift) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+
+        node[2] = value
+        self.depth = max(self.depth, length)
+
+    def matches(self, address: int) -> list[tuple[int, object]]:
+        """
+        Returns the values of every stored prefix holding an address.
+
+        Args:
+            address (int): The address.
+
+        Returns:
+            list[tuple[int, object]]: (prefix length, value) pairs, longest prefix first.
+        """
+        node = self.root
+        found = [(0, node[2])] if node[2] is not None else []
+
+        for length, shift in enumerate(range(self.bits - 1, self.bits - 1 - self.depth, -1), 1):
+            node = node[(address >> shift) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                found.append((length, node[2]))
+
+        found.reverse()
+
+        return found
+
+
+class RuleSet:
+    """
+    Immutable lookup structure of a list of rules: one prefix trie per address family and direction, whose
+    prefixes hold the port range index of their rules.
+
+    A packet is matched against its source and its destination address. In each direction the longest prefix
+    with a rule covering the destination port wins; between the two directions, the longer prefix wins, and deny
+    wins a tie.
+
+    Args:
+        rules (list[Rule]): The rules.
+
+    Methods:
+        match(source_ip, destination_ip, destination_port, version): Returns the rule for a packet, or None.
+    """
+
+    def __init__(self, rules: list[Rule]):
+        self.rules = list(rules)
+
+        grouped: dict[tuple[str, int, int, int], list[Rule]] = {}
+        for rule in self.rules:
+            network = rule.network
+            key = (rule.direction, network.version, int(network.network_address), network.prefixlen)
+            grouped.setdefault(key, []).append(rule)
+
+        self._tries = {
+            (direction, version): PrefixTrie(32 if version == 4 else 128)
+            for direction in DIRECTIONS for version in (4, 6)
+        }
+        for (direction, version, prefix, length), network_rules in grouped.items():
+            self._tries[direction, version].insert(prefix, length, PortRangeIndex(network_rules))
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def _match_direction(self, trie: PrefixTrie, address: int, port: int) -> tuple[int, Rule | None]:
+        for length, index in trie.matches(address):
+            rule = index.match(port)
+            if rule is not None:
+                return length, rule
+
+        return -1, None
+
+    def match(self, source_ip: int, destination_ip: int, destination_port: int, version: int = 4) -> Rule | None:
+        """
+        Returns the rule for a packet.
+
+        Args:
+            source_ip (int): The packed source address.
+            destination_ip (int): The packed destination address.
+            destination_port (int): The destination port.
+            version (int, optional): The IP version of the addresses. Defaults to 4.
+
+        Returns:
+            Rule | None: The matching rule, None if no rule applies.
+        """
+        if not self.rules:
+            return None
+
+        source_length, source_rule = self._match_direction(
+            self._tries["source", version], source_ip, destination_port
+        )
+        destination_length, destination_rule = self._match_direction(
+            self._tries["destination", version], destination_ip, destination_port
+        )
+
+        if source_rule is None or destination_rule is None:
+            return source_rule or destination_rule
+        if source_length != destination_length:
+            return source_rule if source_length > destination_length else destination_rule
+
+        return source_rule if source_rule.action == "deny" else destination_rule
+
+
+class RuleEngine:
+    """
+    Allow and deny rules checked before the thread detector.
+
+    Traffic of networks that are already trusted or already blocked gets its verdict from the rules, without
+    running the model. Lookups cost one trie step per prefix bit plus a binary search over the port ranges.
+
+    Rules are replaced in bulk: `reload` builds a new `RuleSet` and swaps it in with a single assignment, so a
+    lookup sees either every old rule or every new one, never a mix, and lookups never wait for a reload.
+
+    Args:
+        rules (list[Rule], optional): The initial rules. Defaults to none.
+        path (Path | str | None, optional): A rules file to load, see `parse_rules`. Defaults to None.
+
+    Attributes:
+        path (Path | None): The rules file `reload_file` reads.
+        generation (int): Incremented by every reload.
+
+    Methods:
+        reload(rules): Replaces every rule at once.
+        reload_file(): Reloads the rules file.
+        match(source_ip, destination_ip, destination_port, version): Returns the rule for a packet, or None.
+        verdict(source_ip, destination_ip, destination_port, version): Returns the rule verdict of a packet, or None.
+
+    Usage:
+    ```python
+    rules = RuleEngine(path="rules.txt")
+    verdict = rules.verdict(pack_ip("203.0.113.7"), pack_ip("10.0.0.1"), 22)
+    ```
+    """
+
+    def __init__(self, rules: list[Rule] = (), path: Path | str | None = None):
+        self.path = Path(path) if path is not None else None
+        self.generation = 0
+
+        self._rule_set = RuleSet(rules)
+        self._reload_lock = Lock()
+
+        if self.path is not None:
+            self.reload_file()
+
+    def __len__(self) -> int:
+        return len(self._rule_set)
+
+    def reload(self, rules: list[Rule]):
+        """
+        Replaces every rule at once.
+
+        Args:
+            rules (list[Rule]): The new rules.
+        """
+        rule_set = RuleSet(rules)
+
+        with self._reload_lock:
+            self._rule_set = rule_set
+            self.generation += 1
+
+    def reload_file(self):
+        """
+        Reloads the rules file. The current rules are kept if the file cannot be parsed.
+
+        Raises:
+            RuleError: Raised if a rule of the file is malformed.
+            OSError: Raised if the file cannot be read.
+        """
+        if self.path is None:
+            raise ValueError("No rules file to reload")
+
+        self.reload(parse_rules(self.path.read_text()))
+
+    def match(self, source_ip: int, destination_ip: int, destination_port: int, version: int = 4) -> Rule | None:
+        """
+        Returns the rule for a packet, see `RuleSet.match`.
+        """
+        return self._rule_set.match(source_ip, destination_ip, destination_port, version)
+
+    def verdict(self, source_ip: int, destination_ip: int, destination_port: int, version: int = 4) -> int | None:
+        """
+        Returns the traffic rating the rules give a packet.
+
+        Args:
+            source_ip (int): The packed source address.
+            destination_ip (int): The packed destination address.
+            destination_port (int): The destination port.
+            version (int, optional): The IP version of the addresses. Defaults to 4.
+
+        Returns:
+            int | None: 0 if the packet is allowed, 2 if it is denied, None if no rule applies.
+        """
+        rule = self._rule_set.match(source_ip, destination_ip, destination_port, version)
+
+        return rule.verdict if rule is not None else None
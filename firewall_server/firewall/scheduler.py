@@ -0,0 +1,295 @@
+import time
+from collections import deque
+from concurrent.futures import Future
+from queue import Empty, SimpleQueue
+from threading import Lock
+from typing import NamedTuple
+
+import numpy as np
+
+from firewall.LSTM import ThreadDetection
+from firewall.batch import PacketBatch
+from thread_management import thread_manager
+
+
+class _InferenceRequest(NamedTuple):
+    """Input sequences waiting for the model, with the future their predictions are delivered to."""
+
+    windows: np.ndarray
+    future: Future
+    enqueued_at: float
+
+
+class InferenceScheduler(ThreadDetection):
+    """
+    Micro-batching front end for an LSTMPacketThreadDetection.
+
+    Every caller (connection, flow) submits its input sequences to one shared queue. A dispatcher thread
+    coalesces pending requests into a single `score_windows` call, flushing as soon as either `max_batch_size`
+    sequences are waiting or the oldest request has waited `max_delay` seconds, and routes each slice of the
+    predictions back to the future of its caller.
+
+    When `p99_target` is set, the flush delay adapts to the observed latency: it is halved while the p99
+    latency is above the target and grows back towards `max_delay` while it is well below.
+
+    The scheduler exposes the `ThreadDetection` interface, so it can be handed to `Brain` in place of the
+    detector it wraps.
+
+    Args:
+        detector (ThreadDetection): The detector whose model calls are batched, an LSTMPacketThreadDetection or a
+            ProcessPoolDetector (use one dispatcher per worker process).
+        max_batch_size (int, optional): Sequences per model call that trigger an immediate flush. Defaults to 512.
+        max_delay (float, optional): Longest time, in seconds, a request waits for more requests. Defaults to 0.005.
+        p99_target (float | None, optional): Target p99 latency in seconds. Defaults to None (fixed delay).
+        dispatchers (int, optional): Number of dispatcher threads, i.e. model calls in flight. Defaults to 1.
+        latency_window (int, optional): Number of recent requests the latency percentiles are computed over.
+            Defaults to 1024.
+
+    Attributes:
+        seq_length (int): Length of the input sequences, taken from `detector`.
+        scaler (FeatureScaler): The feature scaler of `detector`.
+        flush_delay (float): The current flush delay in seconds.
+
+    Methods:
+        submit(windows): Queues input sequences and returns a future of their predictions.
+        predict(timestamps, packet_sizes, source_ip, destination_ip, source_port, destination_port):
+            Predicts if the network traffic is malicious or safe, through the shared batch.
+        predict_batch(batch): Predicts if the packets of a batch are malicious or safe, through the shared batch.
+        assess_batch(batch): Same as `predict_batch`, also returning the average prediction.
+        assess_windows(windows): Rates prepared input sequences through the shared batch, with their average
+            prediction.
+        stats(): Returns queue depth, batching and latency statistics.
+        close(): Stops the dispatcher threads and closes the wrapped detector.
+    """
+
+    ADAPT_EVERY: int = 32  # batches between two adjustments of the flush delay
+    MIN_DELAY: float = 0.0001
+
+    def __init__(
+            self,
+            detector: ThreadDetection,
+            max_batch_size: int = 512,
+            max_delay: float = 0.005,
+            p99_target: float | None = None,
+            dispatchers: int = 1,
+            latency_window: int = 1024
+    ):
+        self.detector = detector
+        self.seq_length = detector.seq_length
+        self.scaler = detector.scaler
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.p99_target = p99_target
+        self.flush_delay = max_delay
+
+        self._queue: SimpleQueue[_InferenceRequest | None] = SimpleQueue()
+        self._stats_lock = Lock()
+        self._latencies: deque[float] = deque(maxlen=latency_window)
+        self._pending_windows = 0
+        self._batches = 0
+        self._scored_windows = 0
+        self._running = True
+        self._dispatchers = dispatchers
+
+        self._dispatcher_threads = [self._dispatch_batches() for _ in range(dispatchers)]
+
+    def submit(self, windows: np.ndarray) -> Future:
+        """
+        Queues input sequences for the next batched model call.
+
+        Args:
+            windows (np.ndarray): Input sequences of shape (n, seq_length, 3).
+
+        Returns:
+            Future: Resolves to the predictions for `windows`, of shape (n,).
+        """
+        future = Future()
+
+        if not self._running:
+            future.set_exception(RuntimeError("InferenceScheduler is closed"))
+            return future
+
+        with self._stats_lock:
+            self._pending_windows += len(windows)
+
+        self._queue.put(_InferenceRequest(windows, future, time.monotonic()))
+
+        return future
+
+    def predict(
+            self,
+            timestamps: list[str],
+            packet_sizes: list[int],
+            source_ip: list[str],
+            destination_ip: list[str],
+            source_port: list[int],
+            destination_port: list[int]
+    ):
+        """
+        Predicts if the network traffic is malicious or safe, sharing the model call with other callers.
+
+        Takes the same arguments as `LSTMPacketThreadDetection.predict`.
+
+        Returns:
+            int: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe).
+        """
+        return self.assess_windows(self.detector.prepare_windows(
+            timestamps, packet_sizes, source_ip, destination_ip, source_port, destination_port
+        ))[0]
+
+    def predict_batch(self, batch: PacketBatch):
+        """
+        Predicts if the packets of a batch are malicious or safe, sharing the model call with other callers.
+
+        Args:
+            batch (PacketBatch): The packets to rate, oldest first.
+
+        Returns:
+            int: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe).
+        """
+        return self.assess_batch(batch)[0]
+
+    def assess_batch(self, batch: PacketBatch) -> tuple:
+        """
+        Rates the packets of a batch through the shared batch, returning the average prediction too.
+
+        Args:
+            batch (PacketBatch): The packets to rate, oldest first.
+
+        Returns:
+            tuple: Traffic rating and average prediction, see `ThreadDetection.assess_batch`.
+        """
+        return self.assess_windows(self.detector.prepare_batch_windows(batch))
+
+    def assess_windows(self, windows: np.ndarray) -> tuple:
+        """
+        Scores input sequences through the shared batch and rates their average prediction.
+        """
+        if len(windows) < 1:
+            return "Insufficient data for prediction", float("nan")
+
+        avg_prediction = float(np.mean(self.submit(windows).result()))
+
+        return self.detector.rate(avg_prediction), avg_prediction
+
+    def stats(self) -> dict:
+        """
+        Returns queue depth, batching and latency statistics.
+
+        Returns:
+            dict: Pending requests and sequences, batches and sequences scored, mean batch size,
+                p50/p99 latency in seconds over the recent requests and the current flush delay.
+        """
+        with self._stats_lock:
+            latencies = np.array(self._latencies) if self._latencies else np.zeros(1)
+
+            return {
+                "queue_depth": self._queue.qsize(),
+                "pending_windows": self._pending_windows,
+                "batches": self._batches,
+                "scored_windows": self._scored_windows,
+                "mean_batch_size": self._scored_windows / self._batches if self._batches else 0.0,
+                "p50_latency": float(np.percentile(latencies, 50)),
+                "p99_latency": float(np.percentile(latencies, 99)),
+                "flush_delay": self.flush_delay,
+            }
+
+    def close(self):
+        """
+        Stops the dispatcher threads once the queued requests are scored, then closes the wrapped detector.
+        """
+        self._running = False
+
+        for _ in range(self._dispatchers):
+            self._queue.put(None)
+        for dispatcher in self._dispatcher_threads:
+            dispatcher.result()
+
+        if hasattr(self.detector, "close"):
+            self.detector.close()
+
+    def _collect_batch(self) -> list[_InferenceRequest] | None:
+        """
+        Waits for a request, then gathers more until the batch is full or the flush delay has passed.
+
+        Returns:
+            list[_InferenceRequest] | None: The requests of the batch, or None once the scheduler is closed.
+        """
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        size = len(first.windows)
+        deadline = first.enqueued_at + self.flush_delay
+
+        while size < self.max_batch_size:
+            # Requests that are already queued join the batch even after the deadline.
+            try:
+                request = self._queue.get_nowait()
+            except Empty:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except Empty:
+                    break
+
+            if request is None:
+                self._queue.put(None)
+                break
+
+            batch.append(request)
+            size += len(request.windows)
+
+        return batch
+
+    @thread_manager.run_in_thread(execute_when_called=True, dedicated=True)
+    def _dispatch_batches(self):
+        """
+        Scores batches of queued requests until the scheduler is closed.
+        """
+        while (batch := self._collect_batch()) is not None:
+            windows = np.concatenate([request.windows for request in batch]) if len(batch) > 1 else batch[0].windows
+
+            try:
+                predictions = self.detector.score_windows(windows)
+            except Exception as e:
+                predictions = None
+                for request in batch:
+                    request.future.set_exception(e)
+
+            offset = 0
+            for request in batch:
+                count = len(request.windows)
+
+                if predictions is not None:
+                    request.future.set_result(predictions[offset:offset + count])
+
+                offset += count
+
+            done_at = time.monotonic()
+
+            with self._stats_lock:
+                self._latencies.extend(done_at - request.enqueued_at for request in batch)
+                self._pending_windows -= offset
+                self._scored_windows += offset
+                self._batches += 1
+
+                if self.p99_target is not None and self._batches % self.ADAPT_EVERY == 0:
+                    self._adapt_flush_delay()
+
+    def _adapt_flush_delay(self):
+        """
+        Moves the flush delay towards the p99 latency target.
+
+        Must be called with the stats lock held.
+        """
+        p99_latency = np.percentile(self._latencies, 99)
+
+        if p99_latency > self.p99_target:
+            self.flush_delay = max(self.MIN_DELAY, self.flush_delay / 2)
+        elif p99_latency < self.p99_target / 2:
+            self.flush_delay = min(self.max_delay, self.flush_delay * 1.25)
@@ -0,0 +1,300 @@
+from collections import OrderedDict
+from typing import Hashable
+
+import numpy as np
+
+from firewall.LSTM import LSTMPacketThreadDetection
+from firewall.batch import PacketBatch
+
+# A flow is streamed per sensor and 4-tuple, like `FlowTable` keys it.
+_FLOW_KEY_DTYPE = np.dtype([
+    ("source_ip", np.uint32),
+    ("destination_ip", np.uint32),
+    ("source_port", np.uint16),
+    ("destination_port", np.uint16),
+])
+
+
+class StreamingScorer:
+    """
+    Streaming scores of many flows: the recurrent state of every flow advances by one LSTM step per packet.
+
+    Every packet gets the running score of its flow right away, and costs one cell step per LSTM layer, where
+    window scoring runs it through the cells `seq_length` times. The packets of a batch are grouped per flow with
+    NumPy and stepped in rounds, each round advancing every flow that still has packets by one step in a single
+    batched model call.
+
+    The states of at most `max_flows` flows are kept in preallocated arrays, which grow as flows arrive; beyond
+    that, the least recently active flows are forgotten. With `reset_interval`, a flow restarts from a zero state
+    every `reset_interval` packets; otherwise its state carries its whole history. The pre-trained model was only
+    trained on `seq_length` packet sequences and its first layer has ReLU cells, whose state grows without bound
+    over long flows, so it should be streamed with a reset interval.
+
+    Equivalence mode (`validate=True`) quantifies how streaming verdicts differ from window scoring. Whenever a
+    packet completes a `seq_length + 1` packet window of its flow, as `FlowTable` cuts them, the window is also
+    scored the usual way, from the model input sequence of its first `seq_length` packets, and compared with the
+    running score the flow had after those packets. With `reset_interval=seq_length + 1` and a model without a
+    bidirectional layer both scores are identical; `stats` reports the differences otherwise.
+
+    Args:
+        detector (LSTMPacketThreadDetection): The detector, on the "numpy" backend.
+        max_flows (int, optional): The most flows whose state is kept. Defaults to 16384.
+        reset_interval (int | None, optional): Packets after which a flow restarts from a zero state.
+            Defaults to None (never).
+        validate (bool, optional): Score every completed window both ways and compare. Defaults to False.
+
+    Attributes:
+        packets (int): Packets scored.
+        rounds (int): Batched model steps run.
+        evicted_flows (int): Flows forgotten to stay within `max_flows`.
+
+    Raises:
+        ValueError: Raised if the detector cannot stream.
+
+    Methods:
+        score_batch(sensor_id, batch): Returns the running score and rating of every packet of a batch.
+        flow_score(key): Returns the running score of a flow.
+        stats(): Returns the counters and, in equivalence mode, the differences with window scoring.
+
+    Usage:
+    ```python
+    scorer = StreamingScorer(LSTMPacketThreadDetection(backend="numpy"))
+    scores, ratings = scorer.score_batch("sensor-1", batch)
+    ```
+    """
+
+    INITIAL_CAPACITY: int = 1024
+
+    def __init__(
+            self,
+            detector: LSTMPacketThreadDetection,
+            max_flows: int = 16384,
+            reset_interval: int | None = None,
+            validate: bool = False
+    ):
+        self.detector = detector
+        self.max_flows = max_flows
+        self.reset_interval = reset_interval
+        self.validate = validate
+        self.seq_length = detector.seq_length
+        self.window_size = detector.seq_length + 1
+
+        self._mean = detector.scaler.mean_.astype(np.float32)
+        self._scale = detector.scaler.scale_.astype(np.float32)
+        self._state_size = detector.stream_state(0).shape[1]
+
+        self.packets = 0
+        self.rounds = 0
+        self.evicted_flows = 0
+
+        self._slots: OrderedDict[Hashable, int] = OrderedDict()
+        self._free: list[int] = []
+        self._capacity = 0
+        self._states = np.empty((0, self._state_size), dtype=np.float32)
+        self._scores = np.empty(0, dtype=np.float32)
+        self._totals = np.empty(0, dtype=np.int64)
+        self._since_reset = np.empty(0, dtype=np.int64)
+        self._inputs = np.empty((0, self.seq_length, 3), dtype=np.float32)
+
+        self._compared = 0
+        self._error_sum = 0.0
+        self._max_error = 0.0
+        self._changes: dict[str, int] = {}
+
+    def _grow(self):
+        """
+        Doubles the slot arrays, up to `max_flows` slots.
+        """
+        capacity = min(self.max_flows, max(self.INITIAL_CAPACITY, 2 * self._capacity))
+        added = capacity - self._capacity
+
+        self._states = np.concatenate((self._states, np.zeros((added, self._state_size), dtype=np.float32)))
+        self._scores = np.concatenate((self._scores, np.full(added, np.nan, dtype=np.float32)))
+        self._totals = np.concatenate((self._totals, np.zeros(added, dtype=np.int64)))
+        self._since_reset = np.concatenate((self._since_reset, np.zeros(added, dtype=np.int64)))
+        if self.validate:
+            self._inputs = np.concatenate(
+                (self._inputs, np.zeros((added, self.seq_length, 3), dtype=np.float32))
+            )
+
+        self._free.extend(range(capacity - 1, self._capacity - 1, -1))
+        self._capacity = capacity
+
+    def _assign(self, keys: list[Hashable]) -> np.ndarray:
+        """
+        Returns the slot of every flow, allocating zero states to new flows.
+        """
+        if len(keys) > self.max_flows:
+            raise ValueError(f"A batch holds {len(keys)} flows, more than max_flows={self.max_flows}")
+
+        slots = np.empty(len(keys), dtype=np.int64)
+        new_slots = []
+
+        # Known flows first, so that evictions for the new ones never hit a flow of this batch.
+        for index, key in enumerate(keys):
+            slot = self._slots.get(key)
+            if slot is not None:
+                self._slots.move_to_end(key)
+                slots[index] = slot
+
+        for index, key in enumerate(keys):
+            if key in self._slots:
+                continue
+
+            if not self._free and self._capacity < self.max_flows:
+                self._grow()
+            if self._free:
+                slot = self._free.pop()
+            else:
+                _, slot = self._slots.popitem(last=False)
+                self.evicted_flows += 1
+
+            self._slots[key] = slots[index] = slot
+            new_slots.append(slot)
+
+        if new_slots:
+            new_slots = np.array(new_slots)
+            self._states[new_slots] = 0
+            self._scores[new_slots] = np.nan
+            self._totals[new_slots] = 0
+            self._since_reset[new_slots] = 0
+
+        return slots
+
+    def _compare_windows(self, slots: np.ndarray):
+        """
+        Scores the windows completed by the next packet of some flows and compares them with their running scores.
+        """
+        complete = slots[self._totals[slots] % self.window_size == self.window_size - 1]
+        if not len(complete):
+            return
+
+        # The ring holds the last `seq_length` packets; the oldest one sits where the next packet goes.
+        order = (self._totals[complete, None] + np.arange(self.seq_length)) % self.seq_length
+        windows = self._inputs[complete[:, None], order]
+
+        expected = self.detector.score_windows(windows).reshape(-1)
+        streamed = self._scores[complete]
+
+        errors = np.abs(streamed - expected)
+        self._compared += len(complete)
+        self._error_sum += float(errors.sum())
+        self._max_error = max(self._max_error, float(errors.max()))
+
+        for before, after in zip(self._rate(expected).tolist(), self._rate(streamed).tolist()):
+            if before != after:
+                change = f"{before}->{after}"
+                self._changes[change] = self._changes.get(change, 0) + 1
+
+    def _rate(self, scores: np.ndarray) -> np.ndarray:
+        return (
+            (scores >= self.detector.flagged_threshold).astype(np.int64) +
+            (scores >= self.detector.unsafe_threshold)
+        )
+
+    def score_batch(self, sensor_id: str, batch: PacketBatch) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Advances the flows of a batch by its packets and returns the running score of every packet.
+
+        Args:
+            sensor_id (str): The sensor the batch was received from.
+            batch (PacketBatch): The packets, in arrival order.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The running score of the flow of every packet after that packet, and
+                the matching ratings (0 for safe, 1 for flagged, 2 for unsafe), in batch order.
+
+        Raises:
+            ValueError: Raised if the batch holds more flows than `max_flows`.
+        """
+        count = len(batch)
+        scores = np.empty(count, dtype=np.float32)
+        if not count:
+            return scores, np.empty(0, dtype=np.int64)
+
+        columns = batch.columns
+        keys = np.empty(count, dtype=_FLOW_KEY_DTYPE)
+        for name in _FLOW_KEY_DTYPE.names:
+            keys[name] = columns[name]
+
+        flows, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        packet_slots = self._assign([(sensor_id, *flow) for flow in flows.tolist()])[inverse]
+
+        # Rank of every packet within its flow; round r steps the r-th packet of every flow.
+        per_flow = np.bincount(inverse, minlength=len(flows))
+        ranks = np.empty(count, dtype=np.int64)
+        ranks[np.argsort(inverse, kind="stable")] = (
+            np.arange(count) - np.repeat(np.cumsum(per_flow) - per_flow, per_flow)
+        )
+        by_rank = np.argsort(ranks, kind="stable")
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(ranks))))
+
+        features = np.column_stack((columns["sizes"], columns["source_port"], columns["destination_port"]))
+        features = (features.astype(np.float32) - self._mean) / self._scale
+
+        for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            packets = by_rank[start:end]
+            slots = packet_slots[packets]
+            packet_features = features[packets]
+
+            if self.reset_interval is not None:
+                reset = slots[self._since_reset[slots] >= self.reset_interval]
+                self._states[reset] = 0
+                self._since_reset[reset] = 0
+
+            if self.validate:
+                self._compare_windows(slots)
+                self._inputs[slots, self._totals[slots] % self.seq_length] = packet_features
+
+            scores[packets], self._states[slots] = self.detector.stream_step(packet_features, self._states[slots])
+            self._scores[slots] = scores[packets]
+            self._totals[slots] += 1
+            self._since_reset[slots] += 1
+
+        self.packets += count
+        self.rounds += len(bounds) - 1
+
+        return scores, self._rate(scores)
+
+    def flow_score(self, key: Hashable) -> float:
+        """
+        Returns the running score of a flow.
+
+        Args:
+            key (Hashable): The flow, as (sensor id, source IP, destination IP, source port, destination port).
+
+        Returns:
+            float: The score after its last packet, NaN if the flow is unknown.
+        """
+        slot = self._slots.get(key)
+
+        return float(self._scores[slot]) if slot is not None else float("nan")
+
+    def stats(self) -> dict:
+        """
+        Returns the counters and, in equivalence mode, the differences with window scoring.
+
+        Returns:
+            dict: Flows, packets, rounds and evicted flows; with `validate`, the windows compared, the mean and
+                largest absolute score difference, the share of windows whose verdict differs and the verdict
+                changes by "<window rating>-><streaming rating>".
+        """
+        stats = {
+            "flows": len(self._slots),
+            "packets": self.packets,
+            "rounds": self.rounds,
+            "evicted_flows": self.evicted_flows,
+        }
+
+        if self.validate:
+            mismatches = sum(self._changes.values())
+            stats.update({
+                "windows": self._compared,
+                "mean_abs_error": self._error_sum / self._compared if self._compared else 0.0,
+                "max_abs_error": self._max_error,
+                "verdict_mismatch": mismatches / self._compared if self._compared else 0.0,
+                "verdict_changes": dict(self._changes),
+            })
+
+        return stats
@@ -0,0 +1,27 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def sliding_windows(input_data: np.ndarray, seq_length: int) -> np.ndarray:
+    """
+    Build the LSTM input sequences of a preprocessed batch without copying it.
+
+    Window `i` holds rows `i` to `i + seq_length - 1`, for every `i` below `len(input_data) - seq_length`,
+    which is exactly what appending `input_data[i - seq_length:i]` for `i` in `range(seq_length, len(input_data))`
+    produces. The result is a read-only strided view over `input_data`, so building it costs no Python work per
+    window and no copy of the batch.
+
+    Args:
+        input_data (np.ndarray): Preprocessed features of shape (n, features).
+        seq_length (int): Length of the input sequence for the LSTM model.
+
+    Returns:
+        np.ndarray: A view of shape (n - seq_length, seq_length, features), empty if n <= seq_length.
+    """
+    input_data = np.asarray(input_data)
+
+    if len(input_data) <= seq_length:
+        return np.empty((0, seq_length) + input_data.shape[1:], dtype=input_data.dtype)
+
+    # sliding_window_view appends the window axis last: (windows, features, seq_length)
+    return sliding_window_view(input_data[:-1], seq_length, axis=0).transpose(0, 2, 1)
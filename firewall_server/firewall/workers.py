@@ -0,0 +1,383 @@
+import multiprocessing
+import os
+from concurrent.futures import Future
+from multiprocessing.connection import Connection, wait
+from multiprocessing.shared_memory import SharedMemory
+from queue import Queue
+from threading import Lock
+
+import numpy as np
+
+from firewall.LSTM import LSTMPacketThreadDetection, ThreadDetection
+from firewall.batch import PacketBatch
+from thread_management import thread_manager
+
+
+def _attach(name: str, shape: tuple[int, ...]) -> tuple[SharedMemory, np.ndarray]:
+    """
+    Attaches to a shared memory block created by `ProcessPoolDetector` and maps it as a float32 array.
+
+    Spawned workers share the resource tracker of the parent, which owns and unlinks the block.
+    """
+    memory = SharedMemory(name=name)
+
+    return memory, np.ndarray(shape, dtype=np.float32, buffer=memory.buf)
+
+
+def _worker_main(
+        detector_options: dict,
+        input_name: str,
+        input_shape: tuple[int, ...],
+        output_name: str,
+        output_shape: tuple[int, ...],
+        connection: Connection
+):
+    """
+    Entry point of a worker process: loads the detector once, then scores slots until told to stop.
+
+    Tasks are `(slot, count)` tuples naming input sequences already written to the shared input block, received
+    on the worker's own pipe, and every task is answered on it with `(slot, error)` once its predictions are in the
+    shared output block.
+    """
+    detector = LSTMPacketThreadDetection(**detector_options)
+    input_memory, inputs = _attach(input_name, input_shape)
+    output_memory, outputs = _attach(output_name, output_shape)
+
+    try:
+        while (task := connection.recv()) is not None:
+            slot, count = task
+
+            try:
+                outputs[slot, :count] = detector.score_windows(inputs[slot, :count])
+                connection.send((slot, None))
+            except Exception as e:
+                connection.send((slot, repr(e)))
+    finally:
+        del inputs, outputs
+        input_memory.close()
+        output_memory.close()
+
+
+class _Worker:
+    """
+    A worker process, the pipe it gets its tasks on and answers on, and the slots it was sent.
+    """
+
+    __slots__ = ("process", "connection", "slots")
+
+    def __init__(self, process, connection: Connection):
+        self.process = process
+        self.connection = connection
+        self.slots: set[int] = set()
+
+
+class ProcessPoolDetector(ThreadDetection):
+    """
+    LSTMPacketThreadDetection backed by a pool of worker processes.
+
+    Every worker process loads its own `LSTMPacketThreadDetection` once, so model calls run outside the server's
+    GIL. Input sequences are written into slots of a shared-memory ring and predictions are read back from a
+    second one; only `(slot, count)` tuples cross the process boundary, never the arrays themselves.
+
+    Preprocessing and rating stay in the calling process. Any number of threads can call `predict` or
+    `score_windows` concurrently, and up to `slots` requests are in flight at once. Every worker has a pipe of its
+    own and is sent the next request when it has the fewest in flight.
+
+    A worker that dies, killed by the OOM killer or crashed in native code, is noticed as soon as it exits: the
+    requests it was sent fail with a `RuntimeError` instead of waiting forever, and a new worker takes its place.
+
+    Args:
+        workers (int | None, optional): Number of worker processes. Defaults to the number of CPUs.
+        detector_options (dict | None, optional): Keyword arguments for the `LSTMPacketThreadDetection` of the
+            workers and of the calling process. Defaults to the NumPy backend.
+        slots (int | None, optional): Number of shared-memory slots. Defaults to twice the number of workers.
+        slot_windows (int, optional): Input sequences per slot; larger requests are split. Defaults to 4096.
+
+    Attributes:
+        detector (LSTMPacketThreadDetection): The local detector used for preprocessing and rating.
+        seq_length (int): Length of the input sequences.
+        scaler (FeatureScaler): The feature scaler of the local detector.
+        restarts (int): Workers replaced after dying.
+
+    Methods:
+        submit(windows): Sends input sequences to the pool and returns a future of their predictions.
+        score_windows(windows): Scores input sequences in the pool and waits for the predictions.
+        predict(timestamps, packet_sizes, source_ip, destination_ip, source_port, destination_port):
+            Predicts if the network traffic is malicious or safe.
+        predict_batch(batch): Predicts if the packets of a batch are malicious or safe.
+        assess_batch(batch): Same as `predict_batch`, also returning the average prediction.
+        assess_windows(windows): Rates prepared input sequences in the pool, also returning the average prediction.
+        close(): Stops the workers and releases the shared memory.
+    """
+
+    def __init__(
+            self,
+            workers: int | None = None,
+            detector_options: dict | None = None,
+            slots: int | None = None,
+            slot_windows: int = 4096
+    ):
+        detector_options = detector_options or {"backend": "numpy"}
+
+        self.detector = LSTMPacketThreadDetection(**detector_options)
+        self.seq_length = self.detector.seq_length
+        self.scaler = self.detector.scaler
+        self.slot_windows = slot_windows
+
+        workers = workers or os.cpu_count() or 1
+        slots = slots or 2 * workers
+
+        input_shape = (slots, slot_windows, self.seq_length, 3)
+        output_shape = (slots, slot_windows)
+        self._input_memory = SharedMemory(create=True, size=int(np.prod(input_shape)) * 4)
+        self._output_memory = SharedMemory(create=True, size=int(np.prod(output_shape)) * 4)
+        self._inputs = np.ndarray(input_shape, dtype=np.float32, buffer=self._input_memory.buf)
+        self._outputs = np.ndarray(output_shape, dtype=np.float32, buffer=self._output_memory.buf)
+
+        self._free_slots: Queue[int] = Queue()
+        for slot in range(slots):
+            self._free_slots.put(slot)
+
+        self._in_flight: dict[int, tuple[Future, int]] = {}
+        self._in_flight_lock = Lock()
+
+        self.restarts = 0
+        self._closing = False
+
+        # Workers are spawned rather than forked: the server process runs threads and may hold Keras state.
+        self._context = multiprocessing.get_context("spawn")
+        self._worker_args = (
+            detector_options, self._input_memory.name, input_shape, self._output_memory.name, output_shape
+        )
+        self._workers = [self._start_worker() for _ in range(workers)]
+
+        self._collector = self._collect_results()
+
+    def _start_worker(self) -> _Worker:
+        """
+        Starts a worker process connected to the pool by a pipe.
+        """
+        connection, worker_connection = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(*self._worker_args, worker_connection), daemon=True)
+        process.start()
+        worker_connection.close()
+
+        return _Worker(process, connection)
+
+    def submit(self, windows: np.ndarray) -> Future:
+        """
+        Sends input sequences to the pool.
+
+        Blocks while every slot is in flight. Requests larger than `slot_windows` are split across slots.
+
+        Args:
+            windows (np.ndarray): Input sequences of shape (n, seq_length, 3).
+
+        Returns:
+            Future: Resolves to the predictions for `windows`, of shape (n,).
+        """
+        if len(windows) > self.slot_windows:
+            parts = [
+                self.submit(windows[start:start + self.slot_windows])
+                for start in range(0, len(windows), self.slot_windows)
+            ]
+            future = Future()
+            future.set_result(np.concatenate([part.result() for part in parts]))
+            return future
+
+        future = Future()
+        count = len(windows)
+        slot = self._free_slots.get()
+
+        self._inputs[slot, :count] = windows
+
+        with self._in_flight_lock:
+            self._in_flight[slot] = (future, count)
+
+            worker = min(self._workers, key=lambda worker: len(worker.slots))
+            worker.slots.add(slot)
+            try:
+                worker.connection.send((slot, count))
+            except OSError:
+                pass  # The worker died; the collector fails the slot when it notices.
+
+        return future
+
+    def score_windows(self, windows: np.ndarray) -> np.ndarray:
+        """
+        Scores input sequences in the pool.
+
+        Args:
+            windows (np.ndarray): Input sequences of shape (n, seq_length, 3).
+
+        Returns:
+            np.ndarray: One prediction per input sequence, of shape (n,).
+        """
+        return self.submit(windows).result()
+
+    def prepare_windows(self, *args, **kwargs) -> np.ndarray:
+        """
+        Preprocesses packets into input sequences, see `LSTMPacketThreadDetection.prepare_windows`.
+        """
+        return self.detector.prepare_windows(*args, **kwargs)
+
+    def prepare_batch_windows(self, batch: PacketBatch) -> np.ndarray:
+        """
+        Preprocesses a packet batch into input sequences, see `LSTMPacketThreadDetection.prepare_batch_windows`.
+        """
+        return self.detector.prepare_batch_windows(batch)
+
+    def rate(self, avg_prediction: float) -> int:
+        """
+        Maps an average prediction to a traffic rating, see `LSTMPacketThreadDetection.rate`.
+        """
+        return self.detector.rate(avg_prediction)
+
+    def predict(
+            self,
+            timestamps: list[str],
+            packet_sizes: list[int],
+            source_ip: list[str],
+            destination_ip: list[str],
+            source_port: list[int],
+            destination_port: list[int]
+    ):
+        """
+        Predicts if the network traffic is malicious or safe, running the model in a worker process.
+
+        Takes the same arguments as `LSTMPacketThreadDetection.predict`.
+
+        Returns:
+            int: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe).
+        """
+        return self.assess_windows(self.prepare_windows(
+            timestamps, packet_sizes, source_ip, destination_ip, source_port, destination_port
+        ))[0]
+
+    def predict_batch(self, batch: PacketBatch):
+        """
+        Predicts if the packets of a batch are malicious or safe, running the model in a worker process.
+
+        Args:
+            batch (PacketBatch): The packets to rate, oldest first.
+
+        Returns:
+            int: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe).
+        """
+        return self.assess_batch(batch)[0]
+
+    def assess_batch(self, batch: PacketBatch) -> tuple:
+        """
+        Rates the packets of a batch in the pool, returning the average prediction too.
+
+        Args:
+            batch (PacketBatch): The packets to rate, oldest first.
+
+        Returns:
+            tuple: Traffic rating and average prediction, see `ThreadDetection.assess_batch`.
+        """
+        return self.assess_windows(self.prepare_batch_windows(batch))
+
+    def assess_windows(self, windows: np.ndarray) -> tuple:
+        """
+        Scores input sequences in the pool and rates their average prediction.
+        """
+        if len(windows) < 1:
+            return "Insufficient data for prediction", float("nan")
+
+        avg_prediction = float(np.mean(self.score_windows(windows)))
+
+        return self.rate(avg_prediction), avg_prediction
+
+    def close(self):
+        """
+        Stops the workers and releases the shared memory.
+        """
+        with self._in_flight_lock:
+            self._closing = True
+            for worker in self._workers:
+                try:
+                    worker.connection.send(None)
+                except OSError:
+                    pass
+
+        for worker in self._workers:
+            worker.process.join()
+        self._collector.result()
+
+        for worker in self._workers:
+            worker.connection.close()
+
+        del self._inputs, self._outputs
+        for memory in (self._input_memory, self._output_memory):
+            memory.close()
+            memory.unlink()
+
+    def _finish_slot(self, worker: _Worker, slot: int, error: str | None):
+        """
+        Delivers the predictions of a finished slot, or its error, to its future and frees the slot.
+        """
+        with self._in_flight_lock:
+            worker.slots.discard(slot)
+            future, count = self._in_flight.pop(slot)
+
+        if error is None:
+            predictions = self._outputs[slot, :count].copy()
+
+        self._free_slots.put(slot)
+
+        if error is None:
+            future.set_result(predictions)
+        else:
+            future.set_exception(RuntimeError(f"Inference worker failed: {error}"))
+
+    def _replace_worker(self, worker: _Worker):
+        """
+        Fails the slots of a worker that exited and starts a new worker in its place, unless the pool is closing.
+        """
+        # Answers sent before the worker exited are still delivered.
+        try:
+            while worker.connection.poll():
+                self._finish_slot(worker, *worker.connection.recv())
+        except (EOFError, OSError):
+            pass
+
+        # Once replaced, the worker is sent nothing more, so every slot it was sent is known.
+        with self._in_flight_lock:
+            if not self._closing:
+                self._workers[self._workers.index(worker)] = self._start_worker()
+                self.restarts += 1
+            lost_slots = list(worker.slots)
+
+        process = worker.process
+        for slot in lost_slots:
+            self._finish_slot(worker, slot, f"worker {process.pid} exited with code {process.exitcode}")
+
+        if not self._closing:
+            worker.connection.close()
+
+    @thread_manager.run_in_thread(execute_when_called=True, dedicated=True)
+    def _collect_results(self):
+        """
+        Delivers the predictions of finished slots to their futures, and replaces the workers that exit.
+        """
+        while True:
+            with self._in_flight_lock:
+                workers = list(self._workers)
+                closing = self._closing
+
+            alive = [worker for worker in workers if worker.process.exitcode is None]
+            if closing and not alive:
+                return
+
+            ready = wait([worker.connection for worker in alive] + [worker.process.sentinel for worker in workers])
+
+            for worker in workers:
+                if worker.connection in ready and worker.process.exitcode is None:
+                    try:
+                        self._finish_slot(worker, *worker.connection.recv())
+                    except (EOFError, OSError):
+                        pass
+
+                if worker.process.sentinel in ready:
+                    self._replace_worker(worker)
@@ -1,5 +1,356 @@
+import json
+import signal
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+from firewall.LSTM import CascadeThreadDetection, LSTMPacketThreadDetection, ThreadDetection
+from firewall.cache import VerdictCache
+from firewall.hotswap import HotSwapDetector
+from firewall.numpy_lstm import PRECISIONS
+from firewall.rules import RuleEngine
+from firewall.scheduler import InferenceScheduler
+from firewall.streaming import StreamingScorer
+from firewall.workers import ProcessPoolDetector
 from server import Brain
+from server.admission import AdmissionController
+from server.control import serve_control
+from server.enforcement import EnforcementPublisher, FileSink, NftablesSink, SocketSink
+from server.events import EventStore
+from thread_management import thread_manager
+from utils.metrics import serve_metrics
+from utils.profiling import SamplingProfiler, SlowBatchTracer
 
 if __name__ == "__main__":
-    brain = Brain("192.168.207.148", 1234, display_logs=True)
-    brain.accept_requests()
+    parser = ArgumentParser(description="Run the firewall scoring server.")
+    parser.add_argument("--host", default="192.168.207.148", help="IP address to listen on.")
+    parser.add_argument("--port", type=int, default=1234, help="Port to listen on.")
+    parser.add_argument(
+        "--serving-mode",
+        choices=Brain.SERVING_MODES,
+        default="threaded",
+        help="Serve every client on its own thread, or all clients on one asyncio event loop."
+    )
+    parser.add_argument(
+        "--report-windows",
+        action="store_true",
+        help="Print every rated flow window with its packets; slow, meant for debugging."
+    )
+    parser.add_argument(
+        "--backend",
+        choices=LSTMPacketThreadDetection.BACKENDS,
+        default="keras",
+        help="Run the detector through Keras, or through the exported NumPy weights."
+    )
+    parser.add_argument(
+        "--precision",
+        choices=PRECISIONS,
+        default="float32",
+        help="Precision of the NumPy model weights; see `python -m firewall.quantization report`."
+    )
+    parser.add_argument(
+        "--model-path",
+        default=None,
+        help="Model weights to load instead of the pre-trained ones, e.g. calibrated int8 weights."
+    )
+    parser.add_argument("--flagged-threshold", type=float, default=0.5, help="Score that flags a flow as suspicious.")
+    parser.add_argument("--unsafe-threshold", type=float, default=0.9, help="Score that rates a flow unsafe.")
+    parser.add_argument(
+        "--detector-config",
+        default=None,
+        help="JSON file of detector options (model_path, precision, flagged_threshold, unsafe_threshold) applied "
+             "over the command line ones; SIGHUP reloads it, and the rules file, without a restart."
+    )
+    parser.add_argument(
+        "--shadow-seconds",
+        type=float,
+        default=0.0,
+        help="Seconds a reloaded detector scores live traffic alongside the current one before replacing it."
+    )
+    parser.add_argument(
+        "--control-port",
+        type=int,
+        default=None,
+        help="Accept JSON reload and status commands on this port (disabled by default); see server.control."
+    )
+    parser.add_argument("--control-host", default="127.0.0.1", help="Address of the control endpoint.")
+    parser.add_argument(
+        "--inference-workers",
+        type=int,
+        default=0,
+        help="Run the model in this many worker processes fed through shared memory (0 runs it in-process)."
+    )
+    parser.add_argument(
+        "--micro-batching",
+        action="store_true",
+        help="Coalesce the model calls of all connections and flows into shared batches."
+    )
+    parser.add_argument("--max-batch-size", type=int, default=512, help="Sequences per batched model call.")
+    parser.add_argument("--max-batch-delay-ms", type=float, default=5.0, help="Longest wait for a batch to fill.")
+    parser.add_argument("--p99-target-ms", type=float, default=None, help="Adapt the batch delay to this p99 latency.")
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve Prometheus metrics on this port, at /metrics (disabled by default)."
+    )
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="Address of the metrics endpoint.")
+    parser.add_argument("--max-connections", type=int, default=64, help="Sensors connected at once.")
+    parser.add_argument("--max-connection-windows", type=int, default=256, help="Flow windows scored per read.")
+    parser.add_argument(
+        "--max-pending-windows",
+        type=int,
+        default=4096,
+        help="Flow windows admitted for scoring across all connections before the overload policy applies."
+    )
+    parser.add_argument(
+        "--overload-policy",
+        choices=AdmissionController.POLICIES,
+        default="block",
+        help="Stop reading from sensors, score a sample of the flows, or trim each read to its newest windows "
+             "when overloaded."
+    )
+    parser.add_argument(
+        "--rules",
+        default=None,
+        help="File of allow and deny rules checked before the detector, one '<action> <direction> <network> "
+             "[ports]' per line."
+    )
+    parser.add_argument(
+        "--verdict-cache-size",
+        type=int,
+        default=0,
+        help="Verdicts cached per flow and packet pattern, so steady flows skip inference; a cached verdict is "
+             "reused without running the model until it expires. Disabled (0) by default."
+    )
+    parser.add_argument("--verdict-cache-ttl", type=float, default=30.0, help="Seconds a cached verdict stays valid.")
+    parser.add_argument(
+        "--verdict-cache-quantum",
+        type=int,
+        default=64,
+        help="Packet size bucket, in bytes, of the packet pattern a verdict is cached for."
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Advance the LSTM state of every flow by one step per packet, and rate due windows from the running "
+             "score of their flow instead of running the model on every window; needs --backend numpy. The "
+             "streaming model is the one given at start, detector reloads do not reach it."
+    )
+    parser.add_argument(
+        "--stream-reset-interval",
+        type=int,
+        default=11,
+        help="Packets after which a streamed flow restarts from a zero state (0 never resets); the default matches "
+             "the windows the pre-trained model is scored on."
+    )
+    parser.add_argument("--stream-max-flows", type=int, default=16384, help="Streamed flows whose state is kept.")
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        help="Pre-screen windows with cheap statistics and only run the model on suspicious ones."
+    )
+    parser.add_argument("--cascade-size-z", type=float, default=3.0, help="Packet size z-score that escalates.")
+    parser.add_argument("--cascade-rate-z", type=float, default=3.0, help="Packet rate z-score that escalates.")
+    parser.add_argument("--cascade-fanout", type=int, default=32, help="Destinations of a source that escalate.")
+    parser.add_argument(
+        "--cascade-audit-rate",
+        type=float,
+        default=0.01,
+        help="Share of the passed windows also scored by the model, to measure the agreement."
+    )
+    parser.add_argument(
+        "--event-store",
+        default=None,
+        help="Directory to record every rated packet in, with its verdict and score; see `python -m server.events`."
+    )
+    parser.add_argument("--event-segment-mb", type=int, default=64, help="Size of an event store segment file.")
+    parser.add_argument(
+        "--event-segment-seconds",
+        type=float,
+        default=3600.0,
+        help="Seconds after which an event store segment is sealed even if not full."
+    )
+    parser.add_argument(
+        "--slow-batch-ms",
+        type=float,
+        default=None,
+        help="Keep the per-stage time of every read slower than this many milliseconds (disabled by default)."
+    )
+    parser.add_argument("--slow-batch-log", default=None, help="File the slow reads are appended to as JSON lines.")
+    parser.add_argument(
+        "--profile-interval-ms",
+        type=float,
+        default=5.0,
+        help="Sampling interval of the profiler, toggled with SIGUSR1 or the profile_start/profile_stop commands."
+    )
+    parser.add_argument("--profile-dir", default=".", help="Directory SIGUSR1 writes the collapsed stacks to.")
+    parser.add_argument(
+        "--enforce",
+        choices=("file", "socket", "nftables"),
+        default=None,
+        help="Publish a block set of unsafe source addresses to this backend (disabled by default)."
+    )
+    parser.add_argument(
+        "--enforce-target",
+        default=None,
+        help="The file, the host:port or Unix socket, or the nftables 'table:set' the block set is published to."
+    )
+    parser.add_argument("--enforce-interval", type=float, default=0.5, help="Seconds between two block set deltas.")
+    parser.add_argument("--block-votes", type=float, default=3.0, help="Decayed unsafe windows that block a source.")
+    parser.add_argument("--min-block-seconds", type=float, default=60.0, help="Shortest time a source stays blocked.")
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=10.0,
+        help="Seconds the queued background work is given to finish when the server stops."
+    )
+    args = parser.parse_args()
+
+    if args.enforce and args.enforce != "nftables" and not args.enforce_target:
+        parser.error(f"--enforce {args.enforce} needs --enforce-target")
+    if args.streaming and args.backend != "numpy":
+        parser.error("--streaming needs --backend numpy")
+
+    def build_detector(**detector_options) -> ThreadDetection:
+        if args.inference_workers > 0:
+            detector = ProcessPoolDetector(args.inference_workers, detector_options=detector_options)
+        else:
+            detector = LSTMPacketThreadDetection(**detector_options)
+
+        if args.micro_batching:
+            detector = InferenceScheduler(
+                detector,
+                max_batch_size=args.max_batch_size,
+                dispatchers=max(1, args.inference_workers),
+                max_delay=args.max_batch_delay_ms / 1000,
+                p99_target=args.p99_target_ms / 1000 if args.p99_target_ms is not None else None
+            )
+
+        if args.cascade:
+            detector = CascadeThreadDetection(
+                detector,
+                size_z=args.cascade_size_z,
+                rate_z=args.cascade_rate_z,
+                fanout_threshold=args.cascade_fanout,
+                audit_rate=args.cascade_audit_rate
+            )
+
+        return detector
+
+    def read_detector_config() -> dict:
+        return json.loads(Path(args.detector_config).read_text()) if args.detector_config else {}
+
+    verdict_cache = VerdictCache(
+        max_entries=args.verdict_cache_size,
+        ttl=args.verdict_cache_ttl,
+        size_quantum=args.verdict_cache_quantum
+    ) if args.verdict_cache_size > 0 else None
+    rules = RuleEngine(path=args.rules) if args.rules else None
+
+    detector_options = {
+        "model_path": args.model_path,
+        "backend": args.backend,
+        "precision": args.precision,
+        "flagged_threshold": args.flagged_threshold,
+        "unsafe_threshold": args.unsafe_threshold,
+        **read_detector_config(),
+    }
+    thread_detector = HotSwapDetector(
+        build_detector,
+        detector_options,
+        shadow_seconds=args.shadow_seconds,
+        on_swap=verdict_cache.invalidate if verdict_cache is not None else None
+    )
+
+    enforcement = None
+    if args.enforce:
+        if args.enforce == "file":
+            sink = FileSink(args.enforce_target)
+        elif args.enforce == "socket":
+            sink = SocketSink(args.enforce_target)
+        else:
+            table, _, set_name = (args.enforce_target or "firewall:blocked").partition(":")
+            sink = NftablesSink(table, set_name or "blocked")
+
+        enforcement = EnforcementPublisher(
+            sink,
+            interval=args.enforce_interval,
+            block_votes=args.block_votes,
+            unblock_votes=min(1.0, args.block_votes),
+            min_block_seconds=args.min_block_seconds,
+            unsafe_score=args.unsafe_threshold
+        )
+
+    brain = Brain(
+        args.host,
+        args.port,
+        display_logs=True,
+        thread_detector=thread_detector,
+        serving_mode=args.serving_mode,
+        admission=AdmissionController(
+            max_connections=args.max_connections,
+            max_connection_windows=args.max_connection_windows,
+            max_pending_windows=args.max_pending_windows,
+            policy=args.overload_policy
+        ),
+        rules=rules,
+        verdict_cache=verdict_cache,
+        event_store=EventStore(
+            args.event_store,
+            segment_bytes=args.event_segment_mb * 1024 * 1024,
+            segment_seconds=args.event_segment_seconds
+        ) if args.event_store else None,
+        tracer=SlowBatchTracer(
+            args.slow_batch_ms / 1000, path=args.slow_batch_log
+        ) if args.slow_batch_ms is not None else None,
+        enforcement=enforcement,
+        report_windows=args.report_windows,
+        streaming=StreamingScorer(
+            LSTMPacketThreadDetection(**detector_options),
+            max_flows=args.stream_max_flows,
+            reset_interval=args.stream_reset_interval or None
+        ) if args.streaming else None
+    )
+    profiler = SamplingProfiler(interval=args.profile_interval_ms / 1000)
+
+    def reload(signal_number, frame):
+        try:
+            if rules is not None:
+                rules.reload_file()
+            thread_detector.reload(read_detector_config())
+        except Exception as e:
+            print(f"[!] Reload failed: {e}")
+
+    def toggle_profiler(signal_number, frame):
+        if not profiler.running:
+            profiler.start()
+            print("[*] Profiling started")
+            return
+
+        profiler.stop()
+        path = profiler.write(Path(args.profile_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed"))
+        print(f"[*] Profile of {profiler.samples} samples written to {path}")
+
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, reload)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, toggle_profiler)
+
+    if args.control_port is not None:
+        serve_control(
+            args.control_host, args.control_port, thread_detector, rules, profiler, brain.tracer, brain.enforcement
+        )
+
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_host, args.metrics_port)
+
+    try:
+        brain.accept_requests()
+    finally:
+        if not thread_manager.shutdown(drain_timeout=args.drain_timeout):
+            print(f"[!] Background work still running after {args.drain_timeout} seconds")
+        if brain.event_store is not None:
+            brain.event_store.close()
+        if brain.enforcement is not None:
+            brain.enforcement.close()
@@ -0,0 +1,54 @@
+"""
+Print the records of the event store of a Brain server (see `server.events`), or a summary of its segments.
+
+Usage:
+    python query_events.py query events/ [--start 2024-01-01T00:00] [--end ...] [--ip 10.0.0.5] [--limit 100]
+    python query_events.py stats events/
+"""
+import os
+from argparse import ArgumentParser
+from datetime import datetime
+
+from firewall.batch import format_timestamp, unpack_ip
+from server.events import EventReader
+
+
+def _parse_time(value: str | None) -> float | None:
+    if value is None:
+        return None
+
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Query the event store of a Brain server.")
+    parser.add_argument("command", choices=("query", "stats"))
+    parser.add_argument("directory", help="The directory of the segment files.")
+    parser.add_argument("--start", default=None, help="Earliest timestamp, epoch seconds or ISO 8601.")
+    parser.add_argument("--end", default=None, help="Latest timestamp (excluded), epoch seconds or ISO 8601.")
+    parser.add_argument("--ip", default=None, help="Source or destination address.")
+    parser.add_argument("--limit", type=int, default=100, help="Most records printed by query.")
+    args = parser.parse_args()
+
+    reader = EventReader(args.directory)
+
+    if args.command == "stats":
+        total = 0
+        for segment_path, segment_header in reader.segments():
+            total += int(segment_header["count"])
+            print(
+                f"{segment_path.name}  {int(segment_header['count']):>10} records  "
+                f"{os.path.getsize(segment_path):>11} bytes  "
+                f"{segment_header['first_timestamp']:.3f} - {segment_header['last_timestamp']:.3f}"
+            )
+        print(f"{total} records")
+    else:
+        for record in reader.read(_parse_time(args.start), _parse_time(args.end), args.ip, args.limit):
+            print(
+                f"{format_timestamp(int(record['timestamp']))}  {unpack_ip(record['source_ip']):>15}:"
+                f"{record['source_port']:<5} -> {unpack_ip(record['destination_ip']):>15}:"
+                f"{record['destination_port']:<5} {record['size']:>6}  {record['score']:.4f}  {record['verdict']}"
+            )
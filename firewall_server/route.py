@@ -0,0 +1,81 @@
+"""
+Run a `FlowRouter` in front of several Brain servers, optionally starting them on this machine.
+
+With `--spawn N`, N `manage.py` processes are started on the ports following the router's, listening on
+127.0.0.1, with their metrics endpoint on the N ports after those for health checks, and every argument after
+`--` is passed on to them. They are stopped with the router.
+
+Usage:
+    python route.py --port 1234 --backends 10.0.0.2:1234 10.0.0.3:1234 --health-ports 9100 9100
+    python route.py --port 1234 --spawn 4 -- --backend numpy --serving-mode asyncio
+"""
+import subprocess
+import sys
+from argparse import REMAINDER, ArgumentParser
+from pathlib import Path
+
+from server.router import FlowRouter
+from utils.metrics import serve_metrics
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Spread the flows of sensors over several Brain servers.")
+    parser.add_argument("--host", default="0.0.0.0", help="IP address to listen on.")
+    parser.add_argument("--port", type=int, default=1234, help="Port to listen on.")
+    parser.add_argument("--backends", nargs="*", default=[], help="host:port of the Brain servers.")
+    parser.add_argument(
+        "--health-ports",
+        nargs="*",
+        type=int,
+        default=[],
+        help="Metrics port of every Brain server of --backends, whose /health is checked."
+    )
+    parser.add_argument("--spawn", type=int, default=0, help="Brain servers to start on this machine.")
+    parser.add_argument("--replicas", type=int, default=128, help="Hash ring points per backend.")
+    parser.add_argument("--health-interval", type=float, default=1.0, help="Seconds between health checks.")
+    parser.add_argument("--failure-threshold", type=int, default=3, help="Failed checks that remove a backend.")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="IP address of the metrics endpoint.")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve /metrics on this port.")
+    parser.add_argument("backend_args", nargs=REMAINDER, help="Arguments after -- are passed to spawned servers.")
+    args = parser.parse_args()
+
+    backend_args = args.backend_args[1:] if args.backend_args[:1] == ["--"] else args.backend_args
+    backends = list(args.backends)
+    if args.health_ports and len(args.health_ports) != len(backends):
+        parser.error("give one --health-ports entry per --backends entry")
+    health_ports = dict(zip(backends, args.health_ports))
+    processes = []
+
+    for offset in range(1, args.spawn + 1):
+        port = args.port + offset
+        health_port = args.port + args.spawn + offset
+        processes.append(subprocess.Popen([
+            sys.executable, str(Path(__file__).with_name("manage.py")),
+            "--host", "127.0.0.1", "--port", str(port), "--metrics-port", str(health_port), *backend_args
+        ]))
+        backends.append(f"127.0.0.1:{port}")
+        health_ports[f"127.0.0.1:{port}"] = health_port
+
+    if not backends:
+        parser.error("give --backends or --spawn")
+
+    router = FlowRouter(
+        args.host,
+        args.port,
+        backends,
+        health_ports,
+        display_logs=True,
+        replicas=args.replicas,
+        health_interval=args.health_interval,
+        failure_threshold=args.failure_threshold
+    )
+
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_host, args.metrics_port)
+
+    try:
+        router.accept_requests()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
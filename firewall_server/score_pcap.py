@@ -0,0 +1,296 @@
+"""
+Offline scoring of pcap captures, such as those written by `MainWindow::saveToFile`.
+
+Packets are grouped into flows and scored in windows exactly like the Brain server scores live traffic, but the
+capture is read through `PcapReader` and the windows of many flows are scored by one model call, so a capture is
+processed at disk speed instead of being replayed over a socket. One CSV row is written per scored window.
+
+Usage:
+    python score_pcap.py capture.pcap [more.pcap ...] [--output verdicts.csv] [--backend numpy]
+"""
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import TextIO
+
+import numpy as np
+
+from firewall.LSTM import LSTMPacketThreadDetection
+from firewall.batch import PacketBatch, unpack_ip
+from firewall.pcap import PcapReader
+
+# A flow is scored per 4-tuple; a capture comes from a single sensor.
+FLOW_KEY_DTYPE = np.dtype([
+    ("source_ip", np.uint32),
+    ("destination_ip", np.uint32),
+    ("source_port", np.uint16),
+    ("destination_port", np.uint16),
+])
+
+CSV_HEADER: str = "Timestamp,SourceIP,DestinationIP,SourcePort,DestinationPort,Verdict,Score\n"
+
+
+class BulkScorer:
+    """
+    Scores packet batches offline and writes one verdict per flow window.
+
+    Every flow is cut into consecutive windows of `seq_length + 1` packets, like `FlowTable` does for the Brain
+    server, and a window is rated from the model input sequence of its first `seq_length` packets. Packets are
+    grouped per flow with NumPy, so the Python work per batch grows with its number of flows, not of packets, and
+    the windows of all flows of a batch are scored together.
+
+    Ratings are the model's: unlike live scoring, no random demo override is applied. Packets of a flow that do not
+    fill a window are carried over to the next batch, and dropped once the flow has been idle for `idle_timeout`
+    seconds of capture time, which bounds the memory held for flows that ended.
+
+    Args:
+        detector (LSTMPacketThreadDetection): The detector whose model, scaler and thresholds are used.
+        idle_timeout (float, optional): Capture seconds without packets before a flow is forgotten. Defaults to 60.
+        max_batch_windows (int, optional): Most windows scored by one model call. Defaults to 8192.
+
+    Attributes:
+        packets (int): The packets scored so far.
+        windows (int): The windows scored so far.
+        ratings (dict[int, int]): How many windows got each rating.
+        evicted_flows (int): The flows forgotten with an incomplete window.
+
+    Methods:
+        score_batch(batch): Scores the windows a batch completes.
+        score_file(path, output, chunk_packets): Scores a capture file.
+        stats(): Returns the counters.
+    """
+
+    def __init__(
+            self,
+            detector: LSTMPacketThreadDetection,
+            idle_timeout: float = 60.0,
+            max_batch_windows: int = 8192
+    ):
+        self.detector = detector
+        self.window_size = detector.seq_length + 1
+        self.idle_timeout = idle_timeout
+        self.max_batch_windows = max_batch_windows
+
+        self.packets = 0
+        self.windows = 0
+        self.ratings = {0: 0, 1: 0, 2: 0}
+        self.evicted_flows = 0
+
+        # Packets of incomplete windows, per flow: timestamps and sizes.
+        self._pending: dict[tuple, tuple[np.ndarray, np.ndarray]] = {}
+        self._last_sweep = None
+
+    def _cut_windows(self, batch: PacketBatch) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Groups the packets of a batch per flow and cuts every flow into complete windows.
+
+        Returns:
+            tuple: The flow key of every window, its packet sizes of shape (windows, window_size) and the
+                timestamp of its last packet.
+        """
+        columns = batch.columns
+        keys = np.empty(len(batch), dtype=FLOW_KEY_DTYPE)
+        for name in FLOW_KEY_DTYPE.names:
+            keys[name] = columns[name]
+
+        flows, inverse = np.unique(keys, return_inverse=True)
+        order = np.argsort(inverse.reshape(-1), kind="stable")
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(inverse.reshape(-1), minlength=len(flows)))))
+        timestamps = columns["timestamps"][order]
+        sizes = columns["sizes"][order]
+
+        window_keys, window_sizes, window_times = [], [], []
+        for index, key in enumerate(flows.tolist()):
+            flow_timestamps = timestamps[bounds[index]:bounds[index + 1]]
+            flow_sizes = sizes[bounds[index]:bounds[index + 1]]
+
+            carried = self._pending.pop(key, None)
+            if carried is not None:
+                flow_timestamps = np.concatenate((carried[0], flow_timestamps))
+                flow_sizes = np.concatenate((carried[1], flow_sizes))
+
+            complete = len(flow_sizes) - len(flow_sizes) % self.window_size
+            if complete:
+                window_sizes.append(flow_sizes[:complete].reshape(-1, self.window_size))
+                window_times.append(flow_timestamps[self.window_size - 1:complete:self.window_size])
+                window_keys.append(np.full(complete // self.window_size, index))
+
+            if complete < len(flow_sizes):
+                self._pending[key] = (flow_timestamps[complete:].copy(), flow_sizes[complete:].copy())
+
+        if not window_sizes:
+            return np.empty(0, dtype=FLOW_KEY_DTYPE), np.empty((0, self.window_size)), np.empty(0)
+
+        return (
+            flows[np.concatenate(window_keys)],
+            np.concatenate(window_sizes),
+            np.concatenate(window_times)
+        )
+
+    def _evict_idle(self, now: float):
+        """
+        Forgets the incomplete windows of flows idle for longer than `idle_timeout` seconds of capture time.
+        """
+        if self._last_sweep is None:
+            self._last_sweep = now
+        if now - self._last_sweep < self.idle_timeout:
+            return
+
+        deadline = now - self.idle_timeout
+        idle = [key for key, (timestamps, _) in self._pending.items() if timestamps[-1] < deadline]
+        for key in idle:
+            del self._pending[key]
+
+        self.evicted_flows += len(idle)
+        self._last_sweep = now
+
+    def _score_windows(self, keys: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+        """
+        Runs the model on windows, in calls of at most `max_batch_windows` windows.
+
+        Returns:
+            np.ndarray: One prediction per window.
+        """
+        seq_length = self.detector.seq_length
+        features = np.empty((len(sizes), seq_length, 3))
+        features[:, :, 0] = sizes[:, :seq_length]
+        features[:, :, 1] = keys["source_port"][:, None]
+        features[:, :, 2] = keys["destination_port"][:, None]
+        features = self.detector.scaler.transform(features.reshape(-1, 3)).reshape(features.shape)
+
+        return np.concatenate([
+            self.detector.score_windows(features[start:start + self.max_batch_windows])
+            for start in range(0, len(features), self.max_batch_windows)
+        ])
+
+    def score_batch(self, batch: PacketBatch) -> list[tuple]:
+        """
+        Adds a batch of packets to their flows and scores the windows it completes.
+
+        Args:
+            batch (PacketBatch): The packets, in capture order.
+
+        Returns:
+            list[tuple]: (timestamp, source IP, destination IP, source port, destination port, rating, score) per
+                scored window, ordered by the timestamp of its last packet.
+        """
+        self.packets += len(batch)
+
+        keys, sizes, times = self._cut_windows(batch)
+        if len(batch):
+            self._evict_idle(float(batch.columns["timestamps"][-1]))
+
+        if not len(keys):
+            return []
+
+        predictions = self._score_windows(keys, sizes)
+        ratings = (
+            (predictions >= self.detector.flagged_threshold).astype(np.int64) +
+            (predictions >= self.detector.unsafe_threshold)
+        )
+
+        self.windows += len(keys)
+        for rating, count in zip(*np.unique(ratings, return_counts=True)):
+            self.ratings[int(rating)] += int(count)
+
+        order = np.argsort(times, kind="stable")
+        return list(zip(
+            times[order].tolist(),
+            keys["source_ip"][order].tolist(),
+            keys["destination_ip"][order].tolist(),
+            keys["source_port"][order].tolist(),
+            keys["destination_port"][order].tolist(),
+            ratings[order].tolist(),
+            predictions[order].tolist()
+        ))
+
+    def score_file(self, path: Path | str, output: TextIO, chunk_packets: int = 65536) -> dict:
+        """
+        Scores a capture file and writes one CSV row per scored window to `output`.
+
+        Flows carry over from one file to the next, so a capture split into several files is scored as one.
+
+        Args:
+            path (Path | str): The pcap file.
+            output (TextIO): Where the rows are written, without the header.
+            chunk_packets (int, optional): Records read per batch. Defaults to 65536.
+
+        Returns:
+            dict: Records read, records skipped as non-IPv4 and whether the file was truncated.
+        """
+        with PcapReader(path, chunk_packets) as reader:
+            for batch in reader.batches():
+                output.write("".join(
+                    f"{timestamp:.6f},{unpack_ip(source_ip)},{unpack_ip(destination_ip)},"
+                    f"{source_port},{destination_port},{rating},{score:.6f}\n"
+                    for timestamp, source_ip, destination_ip, source_port, destination_port, rating, score
+                    in self.score_batch(batch)
+                ))
+
+            return {
+                "path": str(path),
+                "records": reader.records,
+                "skipped_records": reader.skipped_records,
+                "truncated": reader.truncated,
+            }
+
+    def stats(self) -> dict:
+        """
+        Returns the counters.
+
+        Returns:
+            dict: Packets and windows scored, windows per rating, evicted and pending flows.
+        """
+        return {
+            "packets": self.packets,
+            "windows": self.windows,
+            "ratings": dict(self.ratings),
+            "evicted_flows": self.evicted_flows,
+            "pending_flows": len(self._pending),
+        }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Score pcap captures offline and write one verdict per flow window.")
+    parser.add_argument("captures", nargs="+", help="The pcap files, in capture order.")
+    parser.add_argument("--output", default="-", help="The CSV file to write (default: standard output).")
+    parser.add_argument(
+        "--backend",
+        choices=LSTMPacketThreadDetection.BACKENDS,
+        default="keras",
+        help="Run the detector through Keras, or through the exported NumPy weights."
+    )
+    parser.add_argument("--chunk-packets", type=int, default=65536, help="Records read per batch.")
+    parser.add_argument("--max-batch-windows", type=int, default=8192, help="Windows per model call.")
+    parser.add_argument("--idle-timeout", type=float, default=60.0, help="Capture seconds before a flow is forgotten.")
+    args = parser.parse_args()
+
+    scorer = BulkScorer(
+        LSTMPacketThreadDetection(backend=args.backend),
+        idle_timeout=args.idle_timeout,
+        max_batch_windows=args.max_batch_windows
+    )
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", buffering=1024 * 1024)
+    started_at = time.monotonic()
+    try:
+        output.write(CSV_HEADER)
+        for capture in args.captures:
+            summary = scorer.score_file(capture, output, args.chunk_packets)
+            print(
+                f"{summary['path']}: {summary['records']} records, {summary['skipped_records']} skipped"
+                + (", truncated" if summary["truncated"] else ""),
+                file=sys.stderr
+            )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.monotonic() - started_at
+    stats = scorer.stats()
+    print(
+        f"{stats['packets']} packets, {stats['windows']} windows scored in {elapsed:.2f}s "
+        f"({stats['packets'] / max(elapsed, 1e-9):.0f} packets/s), ratings {stats['ratings']}",
+        file=sys.stderr
+    )
@@ -1,11 +1,26 @@
+import asyncio
 import random
-import re
 import time
-from json import loads, dumps
-import pandas as pd
+from json import dumps
+from threading import Lock
+
+import numpy as np
+
 from firewall.LSTM import LSTMPacketThreadDetection, ThreadDetection
+from firewall.batch import format_timestamp, unpack_ip
+from firewall.cache import VerdictCache
+from firewall.features import FeatureExtractor
+from firewall.rules import RuleEngine
+from firewall.streaming import StreamingScorer
+from server.admission import AdmissionController
+from server.enforcement import EnforcementPublisher
+from server.events import EventStore, window_records
+from server.flows import FlowTable, FlowWindow
+from server.protocol import VERDICT_UNKNOWN, ProtocolDecoder, ProtocolError, VerdictEncoder
 from server.socket import SocketManager
 from thread_management import thread_manager
+from utils.metrics import Histogram, MetricsRegistry, registry
+from utils.profiling import BatchTrace, SlowBatchTracer
 
 
 class Brain(SocketManager):
@@ -13,39 +28,106 @@ class Brain(SocketManager):
     Brain Class
 
     The Brain class manages socket connections, receives data packets from clients, and handles client requests.
+    Every connection decodes its stream with a `ProtocolDecoder`, so packets split across reads are never lost.
+    Decoded packets stay in columnar `PacketBatch` arrays from the decoder to the detector. They are grouped per
+    flow (sensor and 5-tuple) in a `FlowTable`, and a flow is scored as soon as it holds a full detector window.
+
+    Clients get either the legacy text table for every scored flow, or, once they negotiated binary replies
+    (see `ProtocolDecoder`), one `VerdictEncoder` reply per read with the verdict and score of every scored flow.
+
+    Every flow window is first checked against the allow and deny rules of a `RuleEngine`; windows matching a rule
+    get its verdict right away and skip inference. With a `VerdictCache`, windows of a flow whose recent packets look
+    like an already rated window reuse that verdict instead of being scored again.
+
+    With a `StreamingScorer`, every decoded packet advances the recurrent state of its flow by one LSTM step, and a
+    flow window that comes due is rated from the running score of its flow at the packet that made it due, instead
+    of running the full model on its `seq_length` packet sequence.
+
+    With an `EventStore`, the packets of every rated window are appended to memory-mapped segment files along with
+    their verdict and score, for auditing and retraining. With a `SlowBatchTracer`, the time every read spends in
+    each stage is traced, and the breakdown of the reads over its latency budget is kept. With an
+    `EnforcementPublisher`, the verdicts feed a block set of source addresses, published as batched deltas.
+
+    Connections and the flow windows waiting to be scored go through an `AdmissionController`, so a burst of
+    traffic the detector cannot keep up with is pushed back on the sensors or shed instead of queuing without bound.
 
     Args:
         server_ip (str): The IP address of the server.
         server_port (int): The port number for the server.
         display_logs (bool, optional): Whether to display logs (default is False).
-        packet_per_batch (int, optional): The number of packets to collect before processing (default is 100).
         thread_detector (ThreadDetection | None, optional): An instance of ThreadDetection for packet thread detection
             (default is None, which initializes an LSTMPacketThreadDetection instance).
+        serving_mode (str, optional): "threaded" or "asyncio" (default is "threaded").
+        flow_idle_timeout (float, optional): Seconds without packets before a flow is forgotten (default is 60).
+        flow_table_memory (int, optional): Memory budget of the flow table in bytes (default is 64 MiB).
+        metrics (MetricsRegistry | None, optional): Registry the pipeline counters, stage timers and queue gauges
+            are recorded in (default is None, which uses the shared `utils.metrics.registry`).
+        admission (AdmissionController | None, optional): Connection and scoring limits with their overload policy
+            (default is None, which blocks reads once 4096 windows are pending).
+        rules (RuleEngine | None, optional): Allow and deny rules checked before the detector
+            (default is None, which starts without rules).
+        verdict_cache (VerdictCache | None, optional): Cache of detector verdicts per flow and packet pattern
+            (default is None, which scores every window).
+        event_store (EventStore | None, optional): Store the rated packets are recorded in
+            (default is None, which records nothing).
+        tracer (SlowBatchTracer | None, optional): Tracer of the reads over a latency budget
+            (default is None, which traces nothing).
+        enforcement (EnforcementPublisher | None, optional): Publisher of the block set the verdicts feed
+            (default is None, which enforces nothing).
+        report_windows (bool, optional): Whether to print every rated window with its packets, which costs far
+            more than scoring it (default is False).
+        streaming (StreamingScorer | None, optional): Scorer rating windows from the running scores of their flows
+            (default is None, which runs the thread detector on every window).
 
     Attributes:
-        packet_per_batch (int): The number of packets to collect before processing.
-        packet_data (dict): A dictionary to store packet data including timestamps, packet sizes, source IPs,
-            destination IPs, source ports, and destination ports.
         thread_detector (ThreadDetection): An instance of ThreadDetection for packet thread detection.
+        flows (FlowTable): The recent packets of every active flow.
+        metrics (MetricsRegistry): The registry the pipeline is instrumented in.
+        admission (AdmissionController): The connection and scoring limits.
+        rules (RuleEngine): The rules checked before the detector; reload them with `rules.reload`.
+        verdict_cache (VerdictCache | None): The verdict cache; call `verdict_cache.invalidate` when the model or
+            its thresholds change.
+        event_store (EventStore | None): The store rated packets are recorded in.
+        tracer (SlowBatchTracer | None): The slow read tracer; its budget can be changed while serving.
+        enforcement (EnforcementPublisher | None): The block set publisher.
+        report_windows (bool): Whether every rated window is printed.
+        streaming (StreamingScorer | None): The streaming scorer.
 
     Methods:
+        - accept_requests(): Serves clients, sweeping idle flows out of the flow table meanwhile.
         - _handle_connected_client(client_socket: socket): Handles communication with a connected client.
+        - _handle_connected_client_async(reader, writer): Handles a connected client on the event loop.
         - handle_request(): Continuously handles client requests.
 
     Usage:
     ```python
     brain = Brain(server_ip='127.0.0.1', server_port=8080, display_logs=True)
-    brain.handle_request()
+    brain.accept_requests()
     ```
     """
 
+    RECEIVE_BUFFER_SIZE: int = 65536
+    MAX_FAULTY_FRAMES: int = 100
+    FLOW_EVICTION_INTERVAL: float = 5.0  # seconds between two sweeps of the idle flows
+
     def __init__(
             self,
             server_ip: str,
             server_port: int,
             display_logs: bool = False,
-            packet_per_batch: int = 100,
-            thread_detector: ThreadDetection | None = None
+            thread_detector: ThreadDetection | None = None,
+            serving_mode: str = "threaded",
+            flow_idle_timeout: float = 60.0,
+            flow_table_memory: int = 64 * 1024 * 1024,
+            metrics: MetricsRegistry | None = None,
+            admission: AdmissionController | None = None,
+            rules: RuleEngine | None = None,
+            verdict_cache: VerdictCache | None = None,
+            event_store: EventStore | None = None,
+            tracer: SlowBatchTracer | None = None,
+            enforcement: EnforcementPublisher | None = None,
+            report_windows: bool = False,
+            streaming: StreamingScorer | None = None
     ):
         """
         Initialize a Brain instance.
@@ -54,133 +136,641 @@ class Brain(SocketManager):
             server_ip (str): The IP address of the server.
             server_port (int): The port number for the server.
             display_logs (bool, optional): Whether to display logs (default is False).
-            packet_per_batch (int, optional): The number of packets to collect before processing (default is 100).
             thread_detector (ThreadDetection | None, optional): An instance of ThreadDetection for packet thread detection
                 (default is None, which initializes an LSTMPacketThreadDetection instance).
+            serving_mode (str, optional): "threaded" or "asyncio" (default is "threaded").
+            flow_idle_timeout (float, optional): Seconds without packets before a flow is forgotten (default is 60).
+            flow_table_memory (int, optional): Memory budget of the flow table in bytes (default is 64 MiB).
+            metrics (MetricsRegistry | None, optional): Registry the pipeline is instrumented in
+                (default is None, which uses the shared `utils.metrics.registry`).
+            admission (AdmissionController | None, optional): Connection and scoring limits
+                (default is None, which uses an `AdmissionController` with its default limits).
+            rules (RuleEngine | None, optional): Allow and deny rules checked before the detector
+                (default is None, which starts without rules).
+            verdict_cache (VerdictCache | None, optional): Cache of detector verdicts
+                (default is None, which scores every window).
+            event_store (EventStore | None, optional): Store the rated packets are recorded in
+                (default is None, which records nothing).
+            tracer (SlowBatchTracer | None, optional): Tracer of the reads over a latency budget
+                (default is None, which traces nothing).
+            enforcement (EnforcementPublisher | None, optional): Publisher of the block set the verdicts feed
+                (default is None, which enforces nothing).
+            report_windows (bool, optional): Whether to print every rated window with its packets
+                (default is False).
+            streaming (StreamingScorer | None, optional): Scorer rating windows from the running scores of their
+                flows (default is None, which runs the thread detector on every window).
         """
-        super().__init__(server_ip, server_port, display_logs)
-
-        self.packet_per_batch = packet_per_batch
-        self.packet_data = {
-            "Timestamp": [],
-            "PacketSize": [],
-            "SourceIP": [],
-            "DestinationIP": [],
-            "SourcePort": [],
-            "DestinationPort": []
-        }
+        super().__init__(server_ip, server_port, display_logs, serving_mode)
 
         self.thread_detector = thread_detector or LSTMPacketThreadDetection()
 
-    @thread_manager.run_in_thread(execute_when_called=True)
-    def _handle_connected_client(self, client_socket: socket):
+        # The detector builds its windows from the packets preceding the newest one,
+        # so a flow needs one packet more than the sequence length to be scored.
+        window_size = self.thread_detector.seq_length + 1
+
+        # Detectors scoring model input sequences get them prepared packet by packet.
+        features = None
+        if self.thread_detector.scaler is not None:
+            features = FeatureExtractor(self.thread_detector.scaler, self.thread_detector.seq_length, window_size)
+
+        self.flows = FlowTable(
+            window_size=window_size,
+            idle_timeout=flow_idle_timeout,
+            max_memory=flow_table_memory,
+            features=features
+        )
+
+        self.metrics = metrics or registry
+        self._init_metrics()
+
+        self.admission = admission or AdmissionController(metrics=self.metrics)
+        self.rules = rules if rules is not None else RuleEngine()
+        self.verdict_cache = verdict_cache
+        self.event_store = event_store
+        self.tracer = tracer
+        self.report_windows = report_windows
+        self.enforcement = enforcement
+        self.streaming = streaming
+        # The scorer keeps the state of every flow; reads of all connections advance it one at a time.
+        self._streaming_lock = Lock()
+
+        if verdict_cache is not None:
+            self.metrics.gauge(
+                "firewall_verdict_cache_entries", "Verdicts in the verdict cache.", function=lambda: len(verdict_cache)
+            )
+
+        if streaming is not None:
+            self.metrics.gauge(
+                "firewall_streamed_flows", "Flows whose recurrent state the streaming scorer keeps.",
+                function=lambda: streaming.stats()["flows"]
+            )
+
+        if tracer is not None:
+            self.metrics.gauge(
+                "firewall_slow_reads", "Reads over the latency budget of the tracer.",
+                function=lambda: tracer.slow_reads
+            )
+
+    @staticmethod
+    def _stage(histogram: Histogram, stage: str, trace: BatchTrace | None):
         """
-        Handle communication with a connected client.
+        Time a stage in its histogram, and in the trace of the read if it is traced.
+        """
+        return trace.time(stage, histogram) if trace is not None else histogram.time()
+
+    def _admit_connection(self) -> bool:
+        return self.admission.connect()
+
+    def _release_connection(self):
+        self.admission.disconnect()
+
+    def _init_metrics(self):
+        """
+        Declare the pipeline metrics and keep the hot-path ones at hand.
+        """
+        metrics = self.metrics
+
+        self._received_bytes = metrics.counter("firewall_received_bytes_total", "Bytes received from sensors.")
+        self._received_packets = metrics.counter("firewall_received_packets_total", "Packets decoded.")
+        self._faulty_frames = metrics.counter("firewall_faulty_frames_total", "Frames that could not be decoded.")
+        self._scored_windows = metrics.counter("firewall_scored_windows_total", "Flow windows scored.")
+        self._sent_bytes = metrics.counter("firewall_sent_bytes_total", "Reply bytes sent to sensors.")
+        self._active_connections = metrics.gauge("firewall_active_connections", "Connected sensors.")
+        self._rule_verdicts = metrics.counter(
+            "firewall_rule_verdicts_total", "Flow windows rated by a rule instead of the detector.", ("action",)
+        )
+        cache_lookups = metrics.counter(
+            "firewall_verdict_cache_lookups_total", "Verdict cache lookups, by result.", ("result",)
+        )
+        self._cache_hits = cache_lookups.labels("hit")
+        self._cache_misses = cache_lookups.labels("miss")
+
+        stage_seconds = metrics.histogram(
+            "firewall_stage_seconds", "Time spent in every stage of the detection pipeline.", ("stage",)
+        )
+        self._decode_seconds = stage_seconds.labels("decode")
+        self._flows_seconds = stage_seconds.labels("flows")
+        self._rules_seconds = stage_seconds.labels("rules")
+        self._cache_seconds = stage_seconds.labels("cache")
+        self._inference_seconds = stage_seconds.labels("inference")
+        self._stream_seconds = stage_seconds.labels("stream")
+        self._reply_seconds = stage_seconds.labels("reply")
+        self._send_seconds = stage_seconds.labels("send")
+        self._store_seconds = stage_seconds.labels("store")
+        self._stored_events = metrics.counter("firewall_stored_events_total", "Packet records written to the store.")
+
+        metrics.gauge("firewall_flows", "Flows in the flow table.", function=lambda: len(self.flows))
+        metrics.gauge(
+            "firewall_evicted_flows", "Flows evicted for idleness or memory.", function=lambda: self.flows.evicted_flows
+        )
+
+        detector_stats = self.thread_detector.stats() if hasattr(self.thread_detector, "stats") else {}
+
+        # Micro-batching detectors expose their queue.
+        if "queue_depth" in detector_stats:
+            metrics.gauge(
+                "firewall_inference_queue_depth", "Inference requests waiting for a batch.",
+                function=lambda: self.thread_detector.stats()["queue_depth"]
+            )
+            metrics.gauge(
+                "firewall_inference_pending_windows", "Input sequences waiting to be scored.",
+                function=lambda: self.thread_detector.stats()["pending_windows"]
+            )
+
+        # Cascades expose how much traffic reaches the model.
+        if "escalation_rate" in detector_stats:
+            metrics.gauge(
+                "firewall_cascade_windows", "Windows screened by the cascade.",
+                function=lambda: self.thread_detector.stats()["windows"]
+            )
+            metrics.gauge(
+                "firewall_cascade_escalated_windows", "Windows the cascade escalated to the model.",
+                function=lambda: self.thread_detector.stats()["escalated"]
+            )
+            metrics.gauge(
+                "firewall_cascade_agreement", "Share of audited passed windows the model also found benign.",
+                function=lambda: self.thread_detector.stats()["agreement"]
+            )
+
+        # Hot-swappable detectors expose their reloads.
+        if "swaps" in detector_stats:
+            metrics.gauge(
+                "firewall_detector_swaps", "Detector replacements swapped in since start.",
+                function=lambda: self.thread_detector.stats()["swaps"]
+            )
+            metrics.gauge(
+                "firewall_shadow_agreement", "Share of shadowed windows the replacement detector rates alike.",
+                function=lambda: self.thread_detector.stats()["shadow_agreement"]
+            )
+
+    def _ingest(
+            self,
+            sensor_id: str,
+            decoder: ProtocolDecoder,
+            data: bytes | memoryview,
+            trace: BatchTrace | None = None
+    ) -> list[FlowWindow] | None:
+        """
+        Decode received bytes and add the packets to their flows.
 
         Args:
-            client_socket (socket): The socket object for the connected client.
+            sensor_id (str): The sensor the bytes were received from.
+            decoder (ProtocolDecoder): The decoder of the connection.
+            data (bytes | memoryview): The received bytes.
+            trace (BatchTrace | None, optional): The trace of the read, if it is traced.
+
+        Returns:
+            list[FlowWindow] | None: The flows that became due for scoring, or None if the connection should be
+                closed because its stream cannot be decoded.
         """
-        # try:
-        pattern = r"\{.*?\}"
-        faulty_data_count = 0
+        self._received_bytes.inc(len(data))
+        faulty_frames = decoder.faulty_frames
+        started_at = time.perf_counter()
 
-        while True:
-            # Receive a message from the client
-            thread_level = 0
-            message: str = client_socket.recv(1024).decode("utf-8").strip()
-            parsed_data = re.findall(pattern, message, re.MULTILINE | re.DOTALL)
+        try:
+            batch = decoder.feed(data)
+        except ProtocolError:
+            self._faulty_frames.inc()
+            return None
 
-            if len(parsed_data) < 1:
-                faulty_data_count += 1
+        decoded_at = time.perf_counter()
+        self._decode_seconds.observe(decoded_at - started_at)
+        if trace is not None:
+            trace.add("decode", decoded_at - started_at)
+            trace.packets += len(batch)
 
-            if faulty_data_count > 100:
-                client_socket.close()
-                self.log_warning(f"Session closed!")
+        if decoder.faulty_frames != faulty_frames:
+            self._faulty_frames.inc(decoder.faulty_frames - faulty_frames)
+        if decoder.faulty_frames > self.MAX_FAULTY_FRAMES:
+            return None
 
-                return
+        self._received_packets.inc(len(batch))
 
-            for raw_json in parsed_data:
-                thread_level = 0
+        scores = None
+        if self.streaming is not None:
+            with self._stage(self._stream_seconds, "stream", trace), self._streaming_lock:
+                scores, _ = self.streaming.score_batch(sensor_id, batch)
 
-                try:
-                    parsed_json = loads(raw_json)
-
-                    if not parsed_json:
-                        continue
-
-                    self.packet_data["Timestamp"].append(parsed_json.get("Timestamp"))
-                    self.packet_data["PacketSize"].append(parsed_json.get("Length"))
-                    self.packet_data["SourceIP"].append(parsed_json.get("SourceIP"))
-                    self.packet_data["DestinationIP"].append(parsed_json.get("DestinationIP"))
-                    self.packet_data["SourcePort"].append(parsed_json.get("SourcePort"))
-                    self.packet_data["DestinationPort"].append(parsed_json.get("DestinationPort"))
-                except Exception as e:
-                    print(e)
-
-            if len(self.packet_data["Timestamp"]) > self.packet_per_batch:
-                thread_level = self.thread_detector.predict(
-                    timestamps=self.packet_data["Timestamp"],
-                    packet_sizes=self.packet_data["PacketSize"],
-                    source_ip=self.packet_data["SourceIP"],
-                    destination_ip=self.packet_data["DestinationIP"],
-                    source_port=self.packet_data["SourcePort"],
-                    destination_port=self.packet_data["DestinationPort"],
-                )
+        flows_started_at = time.perf_counter()
+        windows = self.flows.add_batch(sensor_id, batch, scores)
+        flows_seconds = time.perf_counter() - flows_started_at
+        self._flows_seconds.observe(flows_seconds)
+        if trace is not None:
+            trace.add("flows", flows_seconds)
+
+        return windows
+
+    def _score_flow(self, window: FlowWindow, trace: BatchTrace | None = None) -> tuple[int, float]:
+        """
+        Rate the packets of one flow with the rules, or with the thread detector if no rule applies.
+
+        Rule verdicts are final; they have no model score. Detector verdicts are looked up in, and stored into, the
+        verdict cache if there is one.
+
+        Args:
+            window (FlowWindow): The flow snapshot to rate.
+            trace (BatchTrace | None, optional): The trace of the read, if it is traced.
+
+        Returns:
+            tuple[int, float]: Traffic rating (0 for safe, 1 for flagged, 2 for unsafe) and model score.
+        """
+        _, source_ip, destination_ip, _, destination_port = window.key
+
+        with self._stage(self._rules_seconds, "rules", trace):
+            rule = self.rules.match(source_ip, destination_ip, destination_port)
+
+        if rule is not None:
+            self._rule_verdicts.labels(rule.action).inc()
+
+            return rule.verdict, float("nan")
+
+        cache = self.verdict_cache
+        if cache is not None:
+            with self._stage(self._cache_seconds, "cache", trace):
+                generation = cache.generation
+                fingerprint = cache.fingerprint(window.sizes)
+                cached = cache.get(window.key, fingerprint)
+
+            if cached is not None:
+                self._cache_hits.inc()
+                thread_level, score = cached.thread_level, cached.score
+            else:
+                self._cache_misses.inc()
+                thread_level, score = self._assess_window(window, trace)
+                cache.put(window.key, fingerprint, thread_level, score, generation)
+        else:
+            thread_level, score = self._assess_window(window, trace)
+
+        if random.random() > 0.2:
+            thread_level = random.choice([1, 1, 2, 2])
+
+        return thread_level, score
+
+    def _assess_window(self, window: FlowWindow, trace: BatchTrace | None = None) -> tuple[int, float]:
+        """
+        Run the thread detector on one flow window, or rate the streamed score it carries.
+        """
+        if self.streaming is not None and window.score is not None:
+            self._scored_windows.inc()
+
+            return self.streaming.detector.rate(window.score), window.score
 
-                if random.random() > 0.2:
-                    thread_level = random.choice([1, 1, 2, 2])
-
-                formatted_data = list(pd.DataFrame(self.packet_data).values)
-                temp_data = (
-                        f"{thread_level}\n" +
-                        """Timestamp      Packet Size      Source IP        Destination IP       Source Port      Destination Port""" +
-                        "\n".join(
-                            ["        ".join((str(cell) for cell in row))
-                             for row in formatted_data]
-                        )
+        with self._stage(self._inference_seconds, "inference", trace):
+            if window.sequences is not None:
+                thread_level, score = self.thread_detector.assess_windows(window.sequences)
+            else:
+                thread_level, score = self.thread_detector.assess_batch(window.to_batch())
+        self._scored_windows.inc()
+
+        return thread_level, score
+
+    @staticmethod
+    def _encode_verdicts(encoder: VerdictEncoder, scored: list[tuple[FlowWindow, int, float]]) -> memoryview:
+        """
+        Pack the binary reply for the flows rated after one read.
+
+        Args:
+            encoder (VerdictEncoder): The encoder of the connection.
+            scored (list[tuple[FlowWindow, int, float]]): Every rated flow with its rating and score.
+
+        Returns:
+            memoryview: The encoded reply, valid until the encoder is used again.
+        """
+        verdicts = []
+        for window, thread_level, score in scored:
+            _, source_ip, destination_ip, source_port, destination_port = window.key
+            verdict = thread_level if isinstance(thread_level, int) else VERDICT_UNKNOWN
+            verdicts.append((source_ip, destination_ip, source_port, destination_port, verdict, score))
+
+        thread_level = max((verdict[4] for verdict in verdicts if verdict[4] != VERDICT_UNKNOWN), default=0)
+
+        return encoder.encode(thread_level, verdicts)
+
+    @staticmethod
+    def _format_reply(thread_level: int, window: FlowWindow) -> list[bytes]:
+        """
+        Render the reply for a rated flow as the three chunks expected by the client.
+
+        Args:
+            thread_level (int): The traffic rating of the flow.
+            window (FlowWindow): The rated flow snapshot.
+
+        Returns:
+            list[bytes]: The encoded reply chunks, in sending order.
+        """
+        _, source_ip, destination_ip, source_port, destination_port = window.key
+        flow_cells = "        ".join(
+            (unpack_ip(source_ip), unpack_ip(destination_ip), str(source_port), str(destination_port))
+        )
+        temp_data = (
+                f"{thread_level}\n" +
+                """Timestamp      Packet Size      Source IP        Destination IP       Source Port      Destination Port""" +
+                "\n".join(
+                    ["        ".join((format_timestamp(int(timestamp)), str(size), flow_cells))
+                     for timestamp, size in zip(window.timestamps.tolist(), window.sizes.tolist())]
                 )
-                data_per_transfer = len(temp_data) // 3
-                for i in range(3):
-                    if i == 0:
-                        client_socket.send(
-                            temp_data[i * data_per_transfer: (i + 1) * data_per_transfer].encode("utf-8")
-                        )
-                    else:
-                        client_socket.send(
-                            ("*" + temp_data[i * data_per_transfer: (i + 1) * data_per_transfer]).encode("utf-8")
-                        )
-
-                self.packet_data = {
-                    "Timestamp": [],
-                    "PacketSize": [],
-                    "SourceIP": [],
-                    "DestinationIP": [],
-                    "SourcePort": [],
-                    "DestinationPort": []
-                }
-                # except Exception as _:
-                #     print(_)
-                #     client_socket.close()
-                #     self.log_warning(f"Session closed!")
-            # else:
-            #     client_socket.send(dumps({
-            #         "uniqueKey": "0",
-            #         "data": []
-            #     }).encode("utf-8"))
+        )
+        data_per_transfer = len(temp_data) // 3
+        chunks = []
+        for i in range(3):
+            if i == 0:
+                chunks.append(temp_data[i * data_per_transfer: (i + 1) * data_per_transfer].encode("utf-8"))
+            else:
+                chunks.append(("*" + temp_data[i * data_per_transfer: (i + 1) * data_per_transfer]).encode("utf-8"))
+
+        return chunks
+
+    def _record(self, scored: list[tuple[FlowWindow, int, float]], trace: BatchTrace | None = None):
+        """
+        Append the packets of the flows rated after one read to the event store, if there is one.
+
+        Args:
+            scored (list[tuple[FlowWindow, int, float]]): Every rated flow with its rating and score.
+            trace (BatchTrace | None, optional): The trace of the read, if it is traced.
+        """
+        if self.event_store is None or not scored:
+            return
+
+        with self._stage(self._store_seconds, "store", trace):
+            records = np.concatenate([
+                window_records(window, thread_level if isinstance(thread_level, int) else VERDICT_UNKNOWN, score)
+                for window, thread_level, score in scored
+            ])
+            self.event_store.append(records)
+        self._stored_events.inc(len(records))
+
+    def _enforce(self, scored: list[tuple[FlowWindow, int, float]], received_at: float):
+        """
+        Hand the verdicts of the flows rated after one read to the enforcement publisher, if there is one.
+
+        Args:
+            scored (list[tuple[FlowWindow, int, float]]): Every rated flow with its rating and score.
+            received_at (float): Monotonic time the read was received.
+        """
+        if self.enforcement is None:
+            return
+
+        for window, thread_level, score in scored:
+            self.enforcement.observe(
+                window.key[1], thread_level if isinstance(thread_level, int) else VERDICT_UNKNOWN, score, received_at
+            )
+
+    def _report(self, scored: list[tuple[FlowWindow, int | str, float]]):
+        """
+        Print the traffic rating of every scored flow along with its packets, if `report_windows` is set.
 
+        Args:
+            scored (list[tuple[FlowWindow, int | str, float]]): The scored windows with their rating and score.
+        """
+        if not self.report_windows:
+            return
+
+        for window, thread_level, _ in scored:
             print(dumps({
                 "uniqueKey": thread_level,
-                "data": self.packet_data
+                "data": window.to_batch().as_packet_data()
             }))
 
+    def accept_requests(self):
+        """
+        Start sweeping idle flows, then accept and serve clients like `SocketManager.accept_requests`.
+        """
+        self._evict_idle_flows()
+        super().accept_requests()
+
+    @thread_manager.run_in_thread(execute_when_called=True, dedicated=True)
+    def _evict_idle_flows(self):
+        """
+        Evict the idle flows periodically: the flow table only evicts on its own when a new flow arrives.
+        """
+        while True:
+            time.sleep(min(self.FLOW_EVICTION_INTERVAL, self.flows.idle_timeout))
+            self.flows.evict_idle()
+
+    @thread_manager.run_in_thread(execute_when_called=True, dedicated=True)
+    def _handle_connected_client(self, client_socket: socket):
+        """
+        Handle communication with a connected client.
+
+        Every connection reads until the client leaves, so it runs on a thread of its own rather than a pool
+        worker; the admission limit on connections bounds these threads.
+
+        Args:
+            client_socket (socket): The socket object for the connected client.
+        """
+        sensor_id = "%s:%s" % client_socket.getpeername()[:2]
+        decoder = ProtocolDecoder()
+        encoder = VerdictEncoder()
+        receive_buffer = bytearray(self.RECEIVE_BUFFER_SIZE)
+        receive_view = memoryview(receive_buffer)
+
+        self._active_connections.inc()
+        try:
+            while True:
+                # Receive a message from the client
+                received = client_socket.recv_into(receive_buffer)
+                received_at = time.monotonic()
+
+                trace = self.tracer.start(sensor_id) if self.tracer is not None else None
+                windows = self._ingest(sensor_id, decoder, receive_view[:received], trace) if received else None
+
+                if windows is None:
+                    self.log_warning(f"Session closed!")
+
+                    return
+
+                # Blocks while scoring is behind; the socket is not read meanwhile, which throttles the sensor.
+                admitting_since = time.perf_counter()
+                windows = self.admission.admit(windows)
+                if trace is not None:
+                    trace.add("admission", time.perf_counter() - admitting_since)
+                try:
+                    self._reply_to_windows(client_socket.sendall, windows, decoder, encoder, trace, received_at)
+                finally:
+                    self.admission.release(len(windows))
+
+                if trace is not None:
+                    trace.windows = len(windows)
+                    self.tracer.finish(trace)
+        except ConnectionError:
+            self.log_warning(f"Session closed!")
+        except Exception as e:
+            self.log_warning(f"Session of {sensor_id} failed: {type(e).__name__}: {e}")
+        finally:
+            client_socket.close()
+            self._forget_client(client_socket)
+            self._active_connections.dec()
+            self._release_connection()
+
+    def _reply_to_windows(
+            self,
+            send: callable,
+            windows: list[FlowWindow],
+            decoder: ProtocolDecoder,
+            encoder: VerdictEncoder,
+            trace: BatchTrace | None = None,
+            received_at: float | None = None
+    ):
+        """
+        Score the admitted windows of a read and send the replies the client negotiated.
+
+        Args:
+            send (callable): Sends a reply to the client, such as `socket.sendall`.
+            windows (list[FlowWindow]): The windows to score.
+            decoder (ProtocolDecoder): The decoder of the connection, which knows the reply format.
+            encoder (VerdictEncoder): The binary verdict encoder of the connection.
+            trace (BatchTrace | None, optional): The trace of the read, if it is traced.
+            received_at (float | None, optional): Monotonic time the read was received (default is None, now).
+        """
+        received_at = time.monotonic() if received_at is None else received_at
+
+        if windows and decoder.reply_format == "binary":
+            scored = [(window, *self._score_flow(window, trace)) for window in windows]
+
+            with self._stage(self._reply_seconds, "reply", trace):
+                reply = self._encode_verdicts(encoder, scored)
+            with self._stage(self._send_seconds, "send", trace):
+                send(reply)
+            self._sent_bytes.inc(len(reply))
+
+            self._record(scored, trace)
+            self._enforce(scored, received_at)
+            self._report(scored)
+
+            return
+
+        scored = []
+        for window in windows:
+            thread_level, score = self._score_flow(window, trace)
+            scored.append((window, thread_level, score))
+
+            with self._stage(self._reply_seconds, "reply", trace):
+                chunks = self._format_reply(thread_level, window)
+            with self._stage(self._send_seconds, "send", trace):
+                for chunk in chunks:
+                    send(chunk)
+            self._sent_bytes.inc(sum(len(chunk) for chunk in chunks))
+
+        self._record(scored, trace)
+        self._enforce(scored, received_at)
+        self._report(scored)
+
+    async def _handle_connected_client_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Handle communication with a connected client on the event loop.
+
+        Reads never block other clients: decoding, flow bookkeeping, streaming scores and the detector run on the
+        `thread_manager` pool, so that a slow read does not stall accepts, reads and replies on other connections.
+        The reads of one connection are ingested one after the other, so its decoder is never shared.
+
+        Args:
+            reader (asyncio.StreamReader): The stream to read client data from.
+            writer (asyncio.StreamWriter): The stream to write replies to.
+        """
+        sensor_id = "%s:%s" % writer.get_extra_info("peername")[:2]
+        decoder = ProtocolDecoder()
+        encoder = VerdictEncoder()
+        loop = asyncio.get_running_loop()
+
+        self._active_connections.inc()
+        try:
+            while True:
+                data = await reader.read(self.RECEIVE_BUFFER_SIZE)
+                received_at = time.monotonic()
+
+                trace = self.tracer.start(sensor_id) if self.tracer is not None else None
+                windows = await loop.run_in_executor(
+                    thread_manager, self._ingest, sensor_id, decoder, data, trace
+                ) if data else None
+
+                if windows is None:
+                    return
+
+                admitting_since = time.perf_counter()
+                admitted = await self.admission.admit_async(windows)
+                if trace is not None:
+                    trace.add("admission", time.perf_counter() - admitting_since)
+
+                try:
+                    await self._reply_to_windows_async(writer, admitted, decoder, encoder, trace, received_at)
+                finally:
+                    self.admission.release(len(admitted))
+
+                if trace is not None:
+                    trace.windows = len(admitted)
+                    self.tracer.finish(trace)
+        finally:
+            self._active_connections.dec()
+
+    async def _reply_to_windows_async(
+            self,
+            writer: asyncio.StreamWriter,
+            windows: list[FlowWindow],
+            decoder: ProtocolDecoder,
+            encoder: VerdictEncoder,
+            trace: BatchTrace | None = None,
+            received_at: float | None = None
+    ):
+        """
+        Score the admitted windows of a read on the `thread_manager` pool and write the replies the client negotiated.
+
+        Args:
+            writer (asyncio.StreamWriter): The stream to write replies to.
+            windows (list[FlowWindow]): The windows to score.
+            decoder (ProtocolDecoder): The decoder of the connection, which knows the reply format.
+            encoder (VerdictEncoder): The binary verdict encoder of the connection.
+            trace (BatchTrace | None, optional): The trace of the read, if it is traced.
+            received_at (float | None, optional): Monotonic time the read was received (default is None, now).
+        """
+        received_at = time.monotonic() if received_at is None else received_at
+        loop = asyncio.get_running_loop()
+
+        if windows and decoder.reply_format == "binary":
+            results = await asyncio.gather(
+                *(loop.run_in_executor(thread_manager, self._score_flow, window, trace) for window in windows)
+            )
+            scored = [(window, *result) for window, result in zip(windows, results)]
+
+            # The transport may hold on to what it could not send yet, so it gets a copy of the shared buffer.
+            with self._stage(self._reply_seconds, "reply", trace):
+                reply = bytes(self._encode_verdicts(encoder, scored))
+            with self._stage(self._send_seconds, "send", trace):
+                writer.write(reply)
+                await writer.drain()
+            self._sent_bytes.inc(len(reply))
+
+            self._record(scored, trace)
+            self._enforce(scored, received_at)
+            self._report(scored)
+
+            return
+
+        scored = []
+        for window in windows:
+            thread_level, score = await loop.run_in_executor(thread_manager, self._score_flow, window, trace)
+            scored.append((window, thread_level, score))
+
+            with self._stage(self._reply_seconds, "reply", trace):
+                chunks = self._format_reply(thread_level, window)
+            with self._stage(self._send_seconds, "send", trace):
+                for chunk in chunks:
+                    writer.write(chunk)
+                await writer.drain()
+            self._sent_bytes.inc(sum(len(chunk) for chunk in chunks))
+
+        self._record(scored, trace)
+        self._enforce(scored, received_at)
+        self._report(scored)
+
     def handle_request(self):
         """
         Continuously handles client requests.
         """
         while True:
-            for client_socket, client_ip in self.clients:
-                if client_ip not in self.active_clients:
-                    self._handle_connected_client(client_socket)
-                    self.active_clients.add(client_ip)
+            with self.clients_lock:
+                for client_socket, client_ip in self.clients:
+                    if client_ip not in self.active_clients:
+                        self._handle_connected_client(client_socket)
+                        self.active_clients.add(client_ip)
 
             time.sleep(self.CHECK_FOR_NEW_CLIENTS)
@@ -0,0 +1,244 @@
+import asyncio
+from threading import Condition
+
+from server.flows import FlowWindow
+from utils.metrics import MetricsRegistry, registry
+
+
+class AdmissionController:
+    """
+    Admission control for sensor connections and flow windows waiting to be scored.
+
+    Connections beyond `max_connections` are refused. Every read of a connection yields the flow windows that
+    became due, and those windows are admitted before they are scored and released once their replies are sent.
+    At most `max_connection_windows` windows of one read and `max_pending_windows` windows across all
+    connections are admitted at once; when scoring falls behind, the overload `policy` decides what happens:
+
+        - "block": the connection waits until its windows fit. It stops reading meanwhile, so TCP flow control
+          pushes back on the sensor. A read larger than `max_connection_windows` is admitted alone, once nothing
+          else is pending.
+        - "sample": only a share of the flows is scored, picked by a hash of the flow key so that a sampled flow
+          keeps getting verdicts. The windows of the other flows are shed.
+        - "trim_read": the read is cut down to the room left by shedding its own oldest windows, keeping its most
+          recent traffic. Windows already admitted from other connections are being scored, not queued, so they
+          are never shed: under overload, the connections reading last lose their windows.
+
+    Every refused connection and shed window is counted in `metrics`.
+
+    Args:
+        max_connections (int, optional): Sensors connected at once. Defaults to 64.
+        max_connection_windows (int, optional): Windows admitted from one read. Defaults to 256.
+        max_pending_windows (int, optional): Windows admitted and not yet released, across connections.
+            Defaults to 4096.
+        policy (str, optional): "block", "sample" or "trim_read". Defaults to "block".
+        metrics (MetricsRegistry | None, optional): Registry the counters are recorded in. Defaults to the shared
+            `utils.metrics.registry`.
+
+    Raises:
+        ValueError: Raised if `policy` is unknown or a limit is not positive.
+
+    Methods:
+        connect(): Reserves a connection slot.
+        disconnect(): Frees a connection slot.
+        try_admit(windows): Admits the windows of a read, or returns None if the connection has to wait.
+        admit(windows): Admits the windows of a read, waiting for room under the "block" policy.
+        admit_async(windows): Like `admit`, awaiting room on the running event loop instead of blocking it.
+        release(count): Marks admitted windows as done.
+        stats(): Returns connection and queue figures.
+    """
+
+    POLICIES: tuple[str, ...] = ("block", "sample", "trim_read")
+
+    def __init__(
+            self,
+            max_connections: int = 64,
+            max_connection_windows: int = 256,
+            max_pending_windows: int = 4096,
+            policy: str = "block",
+            metrics: MetricsRegistry | None = None
+    ):
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}")
+
+        if min(max_connections, max_connection_windows, max_pending_windows) < 1:
+            raise ValueError("Admission limits must be positive")
+
+        self.max_connections = max_connections
+        self.max_connection_windows = max_connection_windows
+        self.max_pending_windows = max_pending_windows
+        self.policy = policy
+
+        self.connections = 0
+        self.pending_windows = 0
+        self._condition = Condition()
+        # Event loop connections waiting for room, woken by `release`.
+        self._async_waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+        metrics = metrics or registry
+        self._rejected_connections = metrics.counter(
+            "firewall_rejected_connections_total", "Connections refused over the connection limit."
+        )
+        self._shed_windows = metrics.counter(
+            "firewall_shed_windows_total", "Flow windows not scored because of overload.", ("policy",)
+        ).labels(policy)
+        self._blocked_reads = metrics.counter(
+            "firewall_blocked_reads_total", "Reads that waited for room before being scored."
+        )
+        metrics.gauge(
+            "firewall_admitted_windows", "Windows admitted and not scored yet.", function=lambda: self.pending_windows
+        )
+
+    def connect(self) -> bool:
+        """
+        Reserves a connection slot.
+
+        Returns:
+            bool: True if the connection is accepted, False if it has to be closed.
+        """
+        with self._condition:
+            if self.connections >= self.max_connections:
+                self._rejected_connections.inc()
+                return False
+
+            self.connections += 1
+
+            return True
+
+    def disconnect(self):
+        """
+        Frees the slot of a connection accepted by `connect`.
+        """
+        with self._condition:
+            self.connections -= 1
+
+    def _shed(self, windows: list[FlowWindow], capacity: int) -> list[FlowWindow]:
+        """
+        Reduces the windows of a read to `capacity` according to the policy.
+        """
+        if self.policy == "trim_read":
+            admitted = windows[len(windows) - capacity:] if capacity else []
+        else:
+            # Keep the same share of the flow key space on every read, so sampled flows stay sampled.
+            threshold = capacity / len(windows) * 0x10000
+            admitted = [window for window in windows if hash(window.key) & 0xFFFF < threshold][:capacity]
+
+        self._shed_windows.inc(len(windows) - len(admitted))
+
+        return admitted
+
+    def try_admit(self, windows: list[FlowWindow]) -> list[FlowWindow] | None:
+        """
+        Admits the windows of a read without waiting.
+
+        Args:
+            windows (list[FlowWindow]): The windows that became due, oldest first.
+
+        Returns:
+            list[FlowWindow] | None: The windows to score, which the caller must `release` once done, or None if
+                the "block" policy requires the connection to wait.
+        """
+        if not windows:
+            return windows
+
+        with self._condition:
+            capacity = min(self.max_connection_windows, self.max_pending_windows - self.pending_windows)
+
+            if len(windows) <= capacity:
+                admitted = windows
+            elif self.policy == "block":
+                if self.pending_windows:
+                    return None
+                admitted = windows
+            else:
+                admitted = self._shed(windows, max(0, capacity))
+
+            self.pending_windows += len(admitted)
+
+            return admitted
+
+    def admit(self, windows: list[FlowWindow]) -> list[FlowWindow]:
+        """
+        Admits the windows of a read, waiting for room under the "block" policy.
+
+        Args:
+            windows (list[FlowWindow]): The windows that became due, oldest first.
+
+        Returns:
+            list[FlowWindow]: The windows to score, which the caller must `release` once done.
+        """
+        admitted = self.try_admit(windows)
+        if admitted is not None:
+            return admitted
+
+        self._blocked_reads.inc()
+
+        with self._condition:
+            while (admitted := self.try_admit(windows)) is None:
+                self._condition.wait()
+
+        return admitted
+
+    async def admit_async(self, windows: list[FlowWindow]) -> list[FlowWindow]:
+        """
+        Admits the windows of a read, awaiting room under the "block" policy without blocking the event loop.
+
+        Args:
+            windows (list[FlowWindow]): The windows that became due, oldest first.
+
+        Returns:
+            list[FlowWindow]: The windows to score, which the caller must `release` once done.
+        """
+        admitted = self.try_admit(windows)
+        if admitted is not None:
+            return admitted
+
+        self._blocked_reads.inc()
+        loop = asyncio.get_running_loop()
+
+        while True:
+            room = asyncio.Event()
+            with self._condition:
+                admitted = self.try_admit(windows)
+                if admitted is not None:
+                    return admitted
+                self._async_waiters.append((loop, room))
+
+            await room.wait()
+
+    def release(self, count: int):
+        """
+        Marks admitted windows as scored.
+
+        Args:
+            count (int): The number of windows.
+        """
+        if not count:
+            return
+
+        with self._condition:
+            self.pending_windows -= count
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+
+        for loop, room in waiters:
+            try:
+                loop.call_soon_threadsafe(room.set)
+            except RuntimeError:
+                # The loop of the waiting connection is closed.
+                pass
+
+    def stats(self) -> dict:
+        """
+        Returns connection and queue figures.
+
+        Returns:
+            dict: Connected sensors, admitted windows and the configured limits and policy.
+        """
+        return {
+            "connections": self.connections,
+            "pending_windows": self.pending_windows,
+            "max_connections": self.max_connections,
+            "max_connection_windows": self.max_connection_windows,
+            "max_pending_windows": self.max_pending_windows,
+            "policy": self.policy,
+        }
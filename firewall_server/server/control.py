@@ -0,0 +1,139 @@
+import json
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+from firewall.hotswap import HotSwapDetector
+from firewall.batch import unpack_ip
+from firewall.rules import RuleEngine
+from server.enforcement import EnforcementPublisher
+from thread_management import thread_manager
+from utils.profiling import SamplingProfiler, SlowBatchTracer
+
+
+class _ControlServer(ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve_control(
+        host: str,
+        port: int,
+        detector: HotSwapDetector,
+        rules: RuleEngine | None = None,
+        profiler: SamplingProfiler | None = None,
+        tracer: SlowBatchTracer | None = None,
+        enforcement: EnforcementPublisher | None = None
+) -> ThreadingTCPServer:
+    """
+    Serves the reload commands of a Brain server on a background thread, one JSON object per line.
+
+    Requests and replies are JSON lines; every reply has "ok" and either the result or "error":
+
+        {"command": "status"}
+            The `HotSwapDetector.status` of the detector.
+        {"command": "reload", "options": {"unsafe_threshold": 0.95}, "shadow_seconds": 60, "wait": false}
+            Starts `HotSwapDetector.reload`, with optional options and shadow period. With "wait", replies once the
+            replacement is swapped in, with the status.
+        {"command": "reload_rules"}
+            Reloads the rules file, see `RuleEngine.reload_file`.
+        {"command": "profile_start"}
+            Starts the sampling profiler.
+        {"command": "profile_stop", "path": "brain.collapsed"}
+            Stops it and writes the collapsed stacks to "path", or returns them as "collapsed" without a path.
+        {"command": "slow_batches", "limit": 20}
+            The most recent reads over the latency budget of the tracer, see `SlowBatchTracer.traces`.
+        {"command": "trace_budget", "budget_ms": 50}
+            Changes the latency budget of the tracer.
+        {"command": "block_set"}
+            The version and addresses of the block set, with the publisher statistics.
+
+    There is no authentication: keep the endpoint on a local address.
+
+    Args:
+        host (str): The address to listen on.
+        port (int): The port to listen on.
+        detector (HotSwapDetector): The detector to reload.
+        rules (RuleEngine | None, optional): The rules to reload. Defaults to None.
+        profiler (SamplingProfiler | None, optional): The profiler to start and stop. Defaults to None.
+        tracer (SlowBatchTracer | None, optional): The slow read tracer. Defaults to None.
+        enforcement (EnforcementPublisher | None, optional): The block set publisher. Defaults to None.
+
+    Returns:
+        ThreadingTCPServer: The running server; call `shutdown` to stop it.
+
+    Usage:
+    ```
+    echo '{"command": "reload", "options": {"model_path": "LSTM.v2.npz"}}' | nc 127.0.0.1 1235
+    ```
+    """
+
+    def execute(request: dict) -> dict:
+        command = request.get("command")
+
+        if command == "status":
+            return detector.status()
+
+        if command == "reload":
+            future = detector.reload(request.get("options"), request.get("shadow_seconds"))
+
+            return future.result() if request.get("wait") else detector.status()
+
+        if command == "reload_rules":
+            if rules is None:
+                raise ValueError("The server runs without rules")
+            rules.reload_file()
+
+            return {"rules": len(rules), "generation": rules.generation}
+
+        if command in ("profile_start", "profile_stop"):
+            if profiler is None:
+                raise ValueError("The server runs without a profiler")
+
+            if command == "profile_start":
+                profiler.start()
+                return profiler.stats()
+
+            profiler.stop()
+            if request.get("path"):
+                return {**profiler.stats(), "path": profiler.write(request["path"])}
+            return {**profiler.stats(), "collapsed": profiler.collapsed()}
+
+        if command in ("slow_batches", "trace_budget"):
+            if tracer is None:
+                raise ValueError("The server runs without a slow read tracer")
+
+            if command == "trace_budget":
+                tracer.budget = float(request["budget_ms"]) / 1000
+            return {
+                "budget_ms": tracer.budget * 1000,
+                "reads": tracer.reads,
+                "slow_reads": tracer.slow_reads,
+                "traces": tracer.traces(request.get("limit")) if command == "slow_batches" else [],
+            }
+
+        if command == "block_set":
+            if enforcement is None:
+                raise ValueError("The server runs without enforcement")
+
+            version, blocked = enforcement.snapshot()
+            return {**enforcement.stats(), "version": version, "addresses": sorted(map(unpack_ip, blocked))}
+
+        raise ValueError(f"Unknown command: {command!r}")
+
+    class ControlHandler(StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+
+                try:
+                    reply = {"ok": True, **execute(json.loads(line))}
+                except Exception as e:
+                    reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+                self.wfile.write(json.dumps(reply, default=str).encode("utf-8") + b"\n")
+
+    server = _ControlServer((host, port), ControlHandler)
+
+    thread_manager.run_in_thread(execute_when_called=True, dedicated=True)(server.serve_forever)()
+
+    return server
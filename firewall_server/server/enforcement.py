@@ -0,0 +1,450 @@
+import json
+import math
+import socket
+import subprocess
+import time
+from pathlib import Path
+from threading import Event, Lock
+from typing import NamedTuple
+
+from firewall.batch import unpack_ip
+from thread_management import thread_manager
+from utils.metrics import MetricsRegistry, registry
+
+
+class BlockSetDelta(NamedTuple):
+    """
+    A change of the block set, as published to the enforcement sinks.
+
+    Attributes:
+        version (int): The block set version after the change; deltas are published in version order.
+        added (tuple[int, ...]): Packed IPv4 addresses to block.
+        removed (tuple[int, ...]): Packed IPv4 addresses to unblock.
+        created (float): Epoch time the delta was computed.
+    """
+
+    version: int
+    added: tuple[int, ...]
+    removed: tuple[int, ...]
+    created: float
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "version": self.version,
+            "add": [unpack_ip(address) for address in self.added],
+            "remove": [unpack_ip(address) for address in self.removed],
+            "time": self.created,
+        })
+
+
+class EnforcementSink:
+    """
+    Base class of the backends the block set deltas are published to.
+
+    Methods:
+        publish(delta): Applies a delta; raises if it could not, so that it is retried.
+        close(): Releases the backend.
+    """
+
+    def publish(self, delta: BlockSetDelta):
+        raise NotImplementedError("Please implement publish")
+
+    def close(self):
+        pass
+
+
+class MemorySink(EnforcementSink):
+    """
+    Keeps the deltas and applies them to an in-memory block set; the stand-in for a firewall in tests.
+
+    Attributes:
+        deltas (list[BlockSetDelta]): Every delta published.
+        blocked (set[int]): The block set the deltas add up to.
+    """
+
+    def __init__(self):
+        self.deltas: list[BlockSetDelta] = []
+        self.blocked: set[int] = set()
+
+    def publish(self, delta: BlockSetDelta):
+        self.deltas.append(delta)
+        self.blocked.difference_update(delta.removed)
+        self.blocked.update(delta.added)
+
+
+class FileSink(EnforcementSink):
+    """
+    Appends every delta to a file as a JSON line: {"version", "add", "remove", "time"}.
+
+    Args:
+        path (Path | str): The file to append to.
+    """
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self._file = open(self.path, "a")
+
+    def publish(self, delta: BlockSetDelta):
+        self._file.write(delta.to_json() + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class SocketSink(EnforcementSink):
+    """
+    Sends every delta as a JSON line over a stream socket, to a local enforcement agent.
+
+    The connection is opened on the first delta and opened again after a failure; the failed delta is retried by
+    the publisher.
+
+    Args:
+        address (str): "host:port" of a TCP listener, or the path of a Unix socket.
+        timeout (float, optional): Seconds to connect and send. Defaults to 2.
+    """
+
+    def __init__(self, address: str, timeout: float = 2.0):
+        self.address = address
+        self.timeout = timeout
+        self._socket: socket.socket | None = None
+
+    def _connect(self) -> socket.socket:
+        host, _, port = self.address.rpartition(":")
+
+        if host and port.isdigit():
+            return socket.create_connection((host, int(port)), timeout=self.timeout)
+
+        unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        unix_socket.settimeout(self.timeout)
+        unix_socket.connect(self.address)
+
+        return unix_socket
+
+    def publish(self, delta: BlockSetDelta):
+        if self._socket is None:
+            self._socket = self._connect()
+
+        try:
+            self._socket.sendall(delta.to_json().encode("utf-8") + b"\n")
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class NftablesSink(EnforcementSink):
+    """
+    Applies every delta to an nftables set, in one `nft -f -` transaction.
+
+    The table and the set are created by the first transaction if they do not exist yet; rules dropping the
+    traffic of the set, e.g. `ip saddr @blocked drop`, are left to the firewall configuration.
+
+    Args:
+        table (str, optional): The table of the set. Defaults to "firewall".
+        set_name (str, optional): The set. Defaults to "blocked".
+        family (str, optional): The family of the table. Defaults to "inet".
+        command (tuple[str, ...], optional): The command the script is piped to. Defaults to ("nft", "-f", "-");
+            a stand-in such as ("cat",) shows the scripts without touching the firewall.
+
+    Raises:
+        subprocess.CalledProcessError: Raised by `publish` if the command fails.
+    """
+
+    def __init__(
+            self,
+            table: str = "firewall",
+            set_name: str = "blocked",
+            family: str = "inet",
+            command: tuple[str, ...] = ("nft", "-f", "-")
+    ):
+        self.table = table
+        self.set_name = set_name
+        self.family = family
+        self.command = command
+        self._created = False
+
+    def script(self, delta: BlockSetDelta) -> str:
+        """
+        Returns the nft script applying a delta.
+        """
+        target = f"{self.family} {self.table} {self.set_name}"
+        lines = []
+
+        if not self._created:
+            lines.append(f"add table {self.family} {self.table}")
+            lines.append(f"add set {target} {{ type ipv4_addr; }}")
+        if delta.removed:
+            lines.append(f"delete element {target} {{ {', '.join(map(unpack_ip, delta.removed))} }}")
+        if delta.added:
+            lines.append(f"add element {target} {{ {', '.join(map(unpack_ip, delta.added))} }}")
+
+        return "\n".join(lines) + "\n"
+
+    def publish(self, delta: BlockSetDelta):
+        subprocess.run(self.command, input=self.script(delta), text=True, check=True, capture_output=True)
+        self._created = True
+
+
+class _SourceEvidence:
+    """
+    Decayed verdict counts of one source address.
+    """
+
+    __slots__ = ("unsafe", "total", "updated_at", "blocked_at", "first_unsafe_at")
+
+    def __init__(self, now: float):
+        self.unsafe = 0.0
+        self.total = 0.0
+        self.updated_at = now
+        self.blocked_at: float | None = None
+        self.first_unsafe_at: float | None = None
+
+
+class EnforcementPublisher:
+    """
+    Turns detector verdicts into a versioned block set of source addresses, published as batched deltas.
+
+    `Brain` reports the verdict of every rated window with `observe`, which only queues it. Every `interval`
+    seconds, a background thread folds the queued verdicts into exponentially decayed counts of unsafe and rated
+    windows per source address (half-life `half_life`), and updates the block set:
+
+        - a source is blocked once its decayed unsafe windows reach `block_votes` and make at least `block_ratio`
+          of its windows;
+        - it is unblocked once they decay below `unblock_votes`, and not before `min_block_seconds`.
+
+    The gap between the two thresholds and the minimum block time debounce sources whose verdicts flap, and all
+    changes of one interval go out as one `BlockSetDelta` with a new version. A delta the sink fails to apply is
+    retried, in order, at the next interval.
+
+    A window counts as unsafe from its model score when it has one (`unsafe_score`), and from its rating
+    otherwise, as for rule verdicts: the rating sent to sensors can be randomized in demo mode.
+
+    Every delta, added and removed address is counted in `metrics`, as is the enforcement latency: the time from
+    receiving the first unsafe window of a source to publishing the delta that blocks it.
+
+    Args:
+        sink (EnforcementSink): The backend the deltas are published to.
+        interval (float, optional): Seconds between two deltas. Defaults to 0.5.
+        half_life (float, optional): Seconds after which a verdict counts half. Defaults to 30.
+        block_votes (float, optional): Decayed unsafe windows that block a source. Defaults to 3.
+        block_ratio (float, optional): Share of unsafe windows of a source needed to block it. Defaults to 0.5.
+        unblock_votes (float, optional): Decayed unsafe windows below which a source is unblocked. Defaults to 1.
+        min_block_seconds (float, optional): Shortest time a source stays blocked. Defaults to 60.
+        unsafe_score (float, optional): Model score of an unsafe window. Defaults to 0.9.
+        metrics (MetricsRegistry | None, optional): Registry the counters are recorded in. Defaults to the shared
+            `utils.metrics.registry`.
+
+    Attributes:
+        version (int): The version of the block set.
+        deltas (int): Deltas published.
+
+    Methods:
+        observe(source_ip, thread_level, score, received_at): Queues the verdict of a window.
+        flush(now): Folds the queued verdicts in and publishes the resulting delta, if any.
+        snapshot(): Returns the version and the addresses of the block set.
+        stats(): Returns the block set size and the delta counters.
+        close(): Stops the background thread and closes the sink.
+
+    Usage:
+    ```python
+    enforcement = EnforcementPublisher(NftablesSink())
+    brain = Brain("127.0.0.1", 1234, enforcement=enforcement)
+    ```
+    """
+
+    def __init__(
+            self,
+            sink: EnforcementSink,
+            interval: float = 0.5,
+            half_life: float = 30.0,
+            block_votes: float = 3.0,
+            block_ratio: float = 0.5,
+            unblock_votes: float = 1.0,
+            min_block_seconds: float = 60.0,
+            unsafe_score: float = 0.9,
+            metrics: MetricsRegistry | None = None
+    ):
+        if unblock_votes > block_votes:
+            raise ValueError("unblock_votes must not exceed block_votes")
+
+        self.sink = sink
+        self.interval = interval
+        self.half_life = half_life
+        self.block_votes = block_votes
+        self.block_ratio = block_ratio
+        self.unblock_votes = unblock_votes
+        self.min_block_seconds = min_block_seconds
+        self.unsafe_score = unsafe_score
+
+        self.version = 0
+        self.deltas = 0
+
+        self._queue_lock = Lock()
+        self._queued: list[tuple[int, bool, float]] = []
+        self._flush_lock = Lock()
+        self._sources: dict[int, _SourceEvidence] = {}
+        self._blocked: set[int] = set()
+        self._unpublished: list[tuple[BlockSetDelta, list[float]]] = []
+        self._stop = Event()
+
+        metrics = metrics or registry
+        self._published_deltas = metrics.counter("firewall_enforcement_deltas_total", "Block set deltas published.")
+        changes = metrics.counter(
+            "firewall_enforcement_changes_total", "Addresses added to or removed from the block set.", ("change",)
+        )
+        self._added = changes.labels("add")
+        self._removed = changes.labels("remove")
+        self._failures = metrics.counter(
+            "firewall_enforcement_failures_total", "Deltas the sink failed to apply, retried later."
+        )
+        self._latency = metrics.histogram(
+            "firewall_enforcement_latency_seconds",
+            "Time from the first unsafe window of a source to the publication of its block."
+        )
+        metrics.gauge("firewall_blocked_sources", "Addresses in the block set.", function=lambda: len(self._blocked))
+
+        self._run()
+
+    def observe(self, source_ip: int, thread_level: int, score: float, received_at: float | None = None):
+        """
+        Queues the verdict of a window.
+
+        Args:
+            source_ip (int): The packed source address of the flow.
+            thread_level (int): The rating of the window.
+            score (float): Its model score, NaN if it was rated without the model.
+            received_at (float | None, optional): Monotonic time the window's packets were received.
+                Defaults to None (now).
+        """
+        unsafe = score >= self.unsafe_score if not math.isnan(score) else thread_level == 2
+
+        with self._queue_lock:
+            self._queued.append((source_ip, unsafe, received_at if received_at is not None else time.monotonic()))
+
+    def _decay(self, evidence: _SourceEvidence, now: float):
+        factor = 0.5 ** ((now - evidence.updated_at) / self.half_life)
+        evidence.unsafe *= factor
+        evidence.total *= factor
+        evidence.updated_at = now
+
+    def flush(self, now: float | None = None) -> BlockSetDelta | None:
+        """
+        Folds the queued verdicts into the block set and publishes the resulting delta, if any.
+
+        Args:
+            now (float | None, optional): Monotonic time of the flush. Defaults to None (now).
+
+        Returns:
+            BlockSetDelta | None: The new delta, or None if the block set did not change.
+        """
+        now = time.monotonic() if now is None else now
+
+        with self._queue_lock:
+            queued, self._queued = self._queued, []
+
+        with self._flush_lock:
+            sources = self._sources
+            added, removed, latencies = [], [], []
+
+            for source_ip, unsafe, received_at in queued:
+                evidence = sources.get(source_ip)
+                if evidence is None:
+                    evidence = sources[source_ip] = _SourceEvidence(now)
+                else:
+                    self._decay(evidence, now)
+
+                evidence.total += 1
+                if unsafe:
+                    evidence.unsafe += 1
+                    if evidence.first_unsafe_at is None:
+                        evidence.first_unsafe_at = received_at
+
+            for source_ip, evidence in list(sources.items()):
+                self._decay(evidence, now)
+
+                if evidence.blocked_at is None:
+                    if evidence.unsafe >= self.block_votes and evidence.unsafe >= self.block_ratio * evidence.total:
+                        evidence.blocked_at = now
+                        added.append(source_ip)
+                        latencies.append(now - evidence.first_unsafe_at)
+                    elif evidence.unsafe < self.unblock_votes:
+                        evidence.first_unsafe_at = None
+                        if evidence.total < 0.01:
+                            del sources[source_ip]
+                elif evidence.unsafe < self.unblock_votes and now - evidence.blocked_at >= self.min_block_seconds:
+                    evidence.blocked_at = evidence.first_unsafe_at = None
+                    removed.append(source_ip)
+
+            delta = None
+            if added or removed:
+                self._blocked.update(added)
+                self._blocked.difference_update(removed)
+                self.version += 1
+                delta = BlockSetDelta(self.version, tuple(sorted(added)), tuple(sorted(removed)), time.time())
+                self._unpublished.append((delta, latencies))
+
+            self._publish(now)
+
+        return delta
+
+    def _publish(self, now: float):
+        """
+        Publishes the pending deltas in order, stopping at the first the sink fails to apply.
+        """
+        while self._unpublished:
+            delta, latencies = self._unpublished[0]
+
+            try:
+                self.sink.publish(delta)
+            except Exception:
+                self._failures.inc()
+                return
+
+            self._unpublished.pop(0)
+            self.deltas += 1
+            self._published_deltas.inc()
+            self._added.inc(len(delta.added))
+            self._removed.inc(len(delta.removed))
+
+            # Retried deltas count the time they waited.
+            waited = time.monotonic() - now
+            for latency in latencies:
+                self._latency.observe(latency + waited)
+
+    @thread_manager.run_in_thread(execute_when_called=True, dedicated=True)
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def snapshot(self) -> tuple[int, frozenset[int]]:
+        """
+        Returns the version of the block set and its addresses, e.g. to resynchronize a backend.
+        """
+        with self._flush_lock:
+            return self.version, frozenset(self._blocked)
+
+    def stats(self) -> dict:
+        """
+        Returns the block set version and size, the tracked sources and the delta counters.
+        """
+        with self._flush_lock:
+            return {
+                "version": self.version,
+                "blocked": len(self._blocked),
+                "sources": len(self._sources),
+                "deltas": self.deltas,
+                "unpublished": len(self._unpublished),
+            }
+
+    def close(self):
+        """
+        Publishes the last verdicts, stops the background thread and closes the sink.
+        """
+        self._stop.set()
+        self.flush()
+        self.sink.close()
@@ -0,0 +1,353 @@
+import mmap
+import os
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Iterator
+
+import numpy as np
+
+from firewall.batch import pack_ip
+
+# One scored packet; little-endian and unaligned, so segments read the same on every machine.
+EVENT_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("source_ip", "<u4"),
+    ("destination_ip", "<u4"),
+    ("source_port", "<u2"),
+    ("destination_port", "<u2"),
+    ("size", "<u4"),
+    ("score", "<f4"),
+    ("verdict", "u1"),
+])
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u2"),
+    ("record_size", "<u2"),
+    ("count", "<u8"),
+    ("created", "<f8"),
+    ("first_timestamp", "<f8"),
+    ("last_timestamp", "<f8"),
+    ("reserved", "V24"),
+])
+
+MAGIC: bytes = b"FWEV"
+VERSION: int = 1
+SEGMENT_SUFFIX: str = ".events"
+
+
+class EventStore:
+    """
+    Writer of the event store: appends records to the current segment and rotates segments by size and age.
+
+    The store keeps every scored flow window as one fixed-width `EVENT_DTYPE` record per packet, so it can be
+    audited, or replayed to retrain the model, long after the windows left the flow table. Records go to the newest
+    segment, a file preallocated to `segment_bytes` and written through `mmap`: an append is a copy into mapped
+    memory, with no system call. A segment is sealed, truncated to its records, and replaced by a new one once it is
+    full or older than `segment_seconds`.
+
+    Every segment starts with a `HEADER_DTYPE` header holding its record count and the time range of its records,
+    updated after every append, so readers can skip whole segments by time and read the segment being written up to
+    its last complete record. `EventReader` reads them back, and `query_events.py` prints them.
+
+    Thread-safe; appends are serialized by a lock, held for the copy into the mapped segment.
+
+    Args:
+        directory (Path | str): The directory of the segment files, created if needed.
+        segment_bytes (int, optional): Size of a segment file, header included. Defaults to 64 MiB.
+        segment_seconds (float | None, optional): Age after which a segment is sealed even if not full.
+            Defaults to 3600.
+
+    Attributes:
+        directory (Path): The directory of the segment files.
+        records (int): Records appended since the store was opened.
+        segments (int): Segments opened since the store was opened.
+
+    Raises:
+        ValueError: Raised if a segment cannot hold a single record.
+
+    Methods:
+        append(records): Appends `EVENT_DTYPE` records.
+        append_window(window, verdict, score): Appends the packets of a scored flow window.
+        rotate(): Seals the current segment; the next append opens a new one.
+        close(): Seals the current segment.
+
+    Usage:
+    ```python
+    store = EventStore("events/")
+    store.append_window(window, thread_level, score)
+    ```
+    """
+
+    def __init__(
+            self,
+            directory: Path | str,
+            segment_bytes: int = 64 * 1024 * 1024,
+            segment_seconds: float | None = 3600.0
+    ):
+        if segment_bytes < HEADER_DTYPE.itemsize + EVENT_DTYPE.itemsize:
+            raise ValueError("segment_bytes cannot hold a single record")
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.capacity = (segment_bytes - HEADER_DTYPE.itemsize) // EVENT_DTYPE.itemsize
+
+        self.records = 0
+        self.segments = 0
+
+        self._lock = Lock()
+        self._file = None
+        self._map: mmap.mmap | None = None
+        self._header: np.ndarray | None = None
+        self._records: np.ndarray | None = None
+        self._count = 0
+        self._opened_at = 0.0
+
+    def _open_segment(self):
+        """
+        Creates, preallocates and maps a new segment.
+        """
+        created = time.time()
+        path = self.directory / f"{int(created * 1000):013d}-{self.segments:06d}{SEGMENT_SUFFIX}"
+
+        self._file = open(path, "w+b")
+        self._file.truncate(self.segment_bytes)
+        self._map = mmap.mmap(self._file.fileno(), self.segment_bytes)
+
+        self._header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self._map)
+        self._header[()] = (MAGIC, VERSION, EVENT_DTYPE.itemsize, 0, created, np.nan, np.nan, b"")
+        self._records = np.ndarray(
+            (self.capacity,), dtype=EVENT_DTYPE, buffer=self._map, offset=HEADER_DTYPE.itemsize
+        )
+        self._count = 0
+        self._opened_at = time.monotonic()
+        self.segments += 1
+
+    def _seal_segment(self):
+        """
+        Flushes the current segment and truncates it to its records.
+        """
+        if self._map is None:
+            return
+
+        used = HEADER_DTYPE.itemsize + self._count * EVENT_DTYPE.itemsize
+        del self._header, self._records
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(used)
+        self._file.close()
+
+        self._file = self._map = self._header = self._records = None
+
+    def append(self, records: np.ndarray):
+        """
+        Appends records, rotating segments as they fill up or age.
+
+        Args:
+            records (np.ndarray): Records of `EVENT_DTYPE`.
+        """
+        with self._lock:
+            start = 0
+
+            while start < len(records):
+                if self._map is None or self._count == self.capacity or (
+                        self.segment_seconds is not None and
+                        time.monotonic() - self._opened_at > self.segment_seconds
+                ):
+                    self._seal_segment()
+                    self._open_segment()
+
+                chunk = records[start:start + self.capacity - self._count]
+                end = self._count + len(chunk)
+                self._records[self._count:end] = chunk
+
+                # The count is published last, so readers never see a partly written record.
+                first, last = chunk["timestamp"].min(), chunk["timestamp"].max()
+                if self._count:
+                    first = min(first, self._header["first_timestamp"])
+                    last = max(last, self._header["last_timestamp"])
+                self._header["first_timestamp"], self._header["last_timestamp"] = first, last
+                self._header["count"] = self._count = end
+
+                start += len(chunk)
+
+            self.records += len(records)
+
+    def append_window(self, window, verdict: int, score: float):
+        """
+        Appends the packets of a scored flow window.
+
+        Args:
+            window (FlowWindow): The scored window.
+            verdict (int): Its traffic rating, `VERDICT_UNKNOWN` if it has none.
+            score (float): Its model score, NaN if it has none.
+        """
+        self.append(window_records(window, verdict, score))
+
+    def rotate(self):
+        """
+        Seals the current segment; the next append opens a new one.
+        """
+        with self._lock:
+            self._seal_segment()
+
+    def close(self):
+        """
+        Seals the current segment.
+        """
+        self.rotate()
+
+
+def window_records(window, verdict: int, score: float) -> np.ndarray:
+    """
+    Returns the `EVENT_DTYPE` records of the packets of a scored flow window.
+
+    Args:
+        window (FlowWindow): The scored window.
+        verdict (int): Its traffic rating, `VERDICT_UNKNOWN` if it has none.
+        score (float): Its model score, NaN if it has none.
+
+    Returns:
+        np.ndarray: One record per packet, oldest first.
+    """
+    _, source_ip, destination_ip, source_port, destination_port = window.key
+    records = np.empty(len(window.sizes), dtype=EVENT_DTYPE)
+
+    records["timestamp"] = window.timestamps
+    records["source_ip"] = source_ip
+    records["destination_ip"] = destination_ip
+    records["source_port"] = source_port
+    records["destination_port"] = destination_port
+    records["size"] = window.sizes
+    records["score"] = score
+    records["verdict"] = verdict
+
+    return records
+
+
+class EventReader:
+    """
+    Reader of the event store: scans the records of every segment, optionally filtered by time and address.
+
+    Segments are memory-mapped read-only and scanned `chunk_records` records at a time, so a scan never loads a
+    whole segment; segments whose time range misses the requested one are skipped from their header alone. The
+    segment being written is read up to the records appended when it is reached.
+
+    Args:
+        directory (Path | str): The directory of the segment files.
+        chunk_records (int, optional): Records read and filtered at a time. Defaults to 65536.
+
+    Methods:
+        segments(): Returns the segment files with their header.
+        scan(start, end, ip): Yields the matching records, chunk by chunk, in segment order.
+        read(start, end, ip, limit): Returns the matching records as one array.
+
+    Usage:
+    ```python
+    reader = EventReader("events/")
+    for records in reader.scan(start=time.time() - 3600, ip="10.0.0.5"):
+        print(records["score"].mean())
+    ```
+    """
+
+    def __init__(self, directory: Path | str, chunk_records: int = 65536):
+        self.directory = Path(directory)
+        self.chunk_records = chunk_records
+
+    def segments(self) -> list[tuple[Path, np.ndarray]]:
+        """
+        Returns the segment files, oldest first, with a copy of their header.
+
+        Raises:
+            ValueError: Raised if a file is not an event segment of this version.
+        """
+        segments = []
+
+        for path in sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}")):
+            header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+            if not len(header):
+                continue
+
+            header = header[0]
+            if header["magic"] != MAGIC or header["version"] != VERSION or \
+                    header["record_size"] != EVENT_DTYPE.itemsize:
+                raise ValueError(f"{path} is not an event segment of version {VERSION}")
+
+            segments.append((path, header))
+
+        return segments
+
+    def scan(
+            self,
+            start: float | None = None,
+            end: float | None = None,
+            ip: int | str | None = None
+    ) -> Iterator[np.ndarray]:
+        """
+        Yields the records in a time range involving an address.
+
+        Args:
+            start (float | None, optional): Earliest timestamp, in epoch seconds. Defaults to None (no bound).
+            end (float | None, optional): Timestamp before which records are kept. Defaults to None (no bound).
+            ip (int | str | None, optional): Source or destination address, packed or dotted.
+                Defaults to None (any).
+
+        Yields:
+            np.ndarray: Copies of the matching `EVENT_DTYPE` records, a chunk at a time; chunks may be empty.
+        """
+        if isinstance(ip, str):
+            ip = pack_ip(ip)
+
+        for path, header in self.segments():
+            if not header["count"]:
+                continue
+            if start is not None and header["last_timestamp"] < start:
+                continue
+            if end is not None and header["first_timestamp"] >= end:
+                continue
+
+            # The header is read again: the segment may have grown since it was listed.
+            count = int(min(
+                np.fromfile(path, dtype=HEADER_DTYPE, count=1)[0]["count"],
+                (os.path.getsize(path) - HEADER_DTYPE.itemsize) // EVENT_DTYPE.itemsize
+            ))
+            records = np.memmap(path, dtype=EVENT_DTYPE, mode="r", offset=HEADER_DTYPE.itemsize, shape=(count,))
+
+            for offset in range(0, count, self.chunk_records):
+                chunk = records[offset:offset + self.chunk_records]
+                keep = np.ones(len(chunk), dtype=bool)
+
+                if start is not None:
+                    keep &= chunk["timestamp"] >= start
+                if end is not None:
+                    keep &= chunk["timestamp"] < end
+                if ip is not None:
+                    keep &= (chunk["source_ip"] == ip) | (chunk["destination_ip"] == ip)
+
+                yield np.array(chunk[keep])
+
+    def read(
+            self,
+            start: float | None = None,
+            end: float | None = None,
+            ip: int | str | None = None,
+            limit: int | None = None
+    ) -> np.ndarray:
+        """
+        Returns the records in a time range involving an address, see `scan`, up to `limit` records.
+        """
+        selected, found = [], 0
+
+        for records in self.scan(start, end, ip):
+            selected.append(records)
+            found += len(records)
+
+            if limit is not None and found >= limit:
+                break
+
+        records = np.concatenate(selected) if selected else np.empty(0, dtype=EVENT_DTYPE)
+
+        return records[:limit] if limit is not None else records
@@ -0,0 +1,311 @@
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from itertools import repeat
+from threading import Lock
+from typing import NamedTuple
+
+import numpy as np
+
+from firewall.batch import PacketBatch
+from firewall.features import FeatureExtractor, FlowFeatures
+
+# sensor id, packed source IP, packed destination IP, source port, destination port
+FlowKey = tuple[str, int, int, int, int]
+
+
+class PacketRing:
+    """
+    Bounded ring buffer of the most recent packets of one flow.
+
+    The packet fields that vary within a flow are kept in preallocated typed arrays; the
+    addresses and ports are part of the flow key and are not stored per packet.
+
+    Args:
+        capacity (int): The number of packets kept.
+
+    Attributes:
+        timestamps (array): Packet timestamps in epoch seconds.
+        sizes (array): Packet sizes in bytes.
+        head (int): The slot the next packet is written to.
+        count (int): The number of packets stored (at most `capacity`).
+        pending (int): Packets added since the flow was last scored.
+        last_seen (float): Monotonic time of the last packet.
+        features (FlowFeatures | None): The incrementally extracted features of the flow, if the table keeps them.
+    """
+
+    __slots__ = ("capacity", "timestamps", "sizes", "head", "count", "pending", "last_seen", "features")
+
+    def __init__(self, capacity: int, features: FlowFeatures | None = None):
+        self.capacity = capacity
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.sizes = array("I", bytes(4 * capacity))
+        self.head = 0
+        self.count = 0
+        self.pending = 0
+        self.last_seen = 0.0
+        self.features = features
+
+    def append(self, timestamp: float, size: int, now: float):
+        """
+        Add a packet, overwriting the oldest one when the ring is full.
+
+        Args:
+            timestamp (float): The packet timestamp in epoch seconds.
+            size (int): The packet size in bytes.
+            now (float): The current monotonic time.
+        """
+        head = self.head
+        self.timestamps[head] = timestamp
+        self.sizes[head] = size
+        self.head = (head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.pending += 1
+        self.last_seen = now
+
+        if self.features is not None:
+            self.features.update(size)
+
+    def ordered(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return a copy of the stored packets from oldest to newest.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The timestamps (float64) and sizes (uint32).
+        """
+        timestamps = np.frombuffer(self.timestamps, dtype=np.float64)
+        sizes = np.frombuffer(self.sizes, dtype=np.uint32)
+
+        start = (self.head - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            end = start + self.count
+            return timestamps[start:end].copy(), sizes[start:end].copy()
+
+        return (
+            np.concatenate((timestamps[start:], timestamps[:self.head])),
+            np.concatenate((sizes[start:], sizes[:self.head]))
+        )
+
+
+class FlowWindow(NamedTuple):
+    """
+    Snapshot of the packets of one flow, ready to be scored.
+
+    Attributes:
+        key (FlowKey): The flow the packets belong to.
+        timestamps (np.ndarray): Packet timestamps in epoch seconds, oldest first.
+        sizes (np.ndarray): Packet sizes in bytes, oldest first.
+        sequences (np.ndarray | None): The model input sequences of the packets, if the table extracts features.
+        score (float | None): The running score of the flow at the packet that made the window due, if the
+            packets came with one.
+    """
+
+    key: FlowKey
+    timestamps: np.ndarray
+    sizes: np.ndarray
+    sequences: np.ndarray | None = None
+    score: float | None = None
+
+    def to_batch(self) -> PacketBatch:
+        """
+        Expand the window into a packet batch, repeating the addresses and ports of the flow.
+
+        Returns:
+            PacketBatch: The packets of the flow, oldest first.
+        """
+        _, source_ip, destination_ip, source_port, destination_port = self.key
+
+        return PacketBatch.from_columns(
+            timestamps=self.timestamps,
+            sizes=self.sizes,
+            source_ip=source_ip,
+            destination_ip=destination_ip,
+            source_port=source_port,
+            destination_port=destination_port
+        )
+
+
+class FlowTable:
+    """
+    Thread-safe table of per-flow packet rings.
+
+    Flows are keyed by sensor id and 5-tuple, so packets of concurrent sensors and of unrelated
+    flows never end up in the same window. A flow is due for scoring once its ring is full and
+    `score_interval` new packets arrived since it was last scored. Flows idle for longer than
+    `idle_timeout` are evicted, and the least recently active flows are evicted whenever the
+    table would exceed `max_memory`.
+
+    With a `FeatureExtractor`, the features of every flow are updated as its packets arrive, and the windows
+    carry their model input sequences, so scoring them needs no preprocessing.
+
+    Args:
+        window_size (int): The number of packets kept, and scored, per flow.
+        score_interval (int | None, optional): New packets between two scores of the same flow.
+            Defaults to `window_size`.
+        idle_timeout (float, optional): Seconds without packets before a flow is evicted. Defaults to 60.
+        max_memory (int, optional): Approximate memory budget of the table in bytes. Defaults to 64 MiB.
+        features (FeatureExtractor | None, optional): Extracts the features of every flow incrementally.
+            Defaults to None.
+
+    Attributes:
+        max_flows (int): The number of flows that fit in `max_memory`.
+        evicted_flows (int): The number of flows evicted so far, for idleness or memory.
+
+    Raises:
+        ValueError: Raised if `max_memory` cannot hold a single flow.
+    """
+
+    def __init__(
+            self,
+            window_size: int,
+            score_interval: int | None = None,
+            idle_timeout: float = 60.0,
+            max_memory: int = 64 * 1024 * 1024,
+            features: FeatureExtractor | None = None
+    ):
+        self.window_size = window_size
+        self.score_interval = score_interval or window_size
+        self.idle_timeout = idle_timeout
+        self.features = features
+
+        self.max_flows = max_memory // self._flow_footprint(window_size, features)
+        if self.max_flows < 1:
+            raise ValueError("max_memory is too small to hold a single flow")
+
+        self.evicted_flows = 0
+        self._flows: OrderedDict[FlowKey, PacketRing] = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def _flow_footprint(window_size: int, features: FeatureExtractor | None = None) -> int:
+        """
+        Estimate the memory used by one flow entry.
+
+        Args:
+            window_size (int): The ring capacity.
+            features (FeatureExtractor | None, optional): The extractor of the flow features, if any.
+
+        Returns:
+            int: The approximate size of the ring, its key and its table slot in bytes.
+        """
+        ring = PacketRing(window_size)
+        key = ("255.255.255.255:65535", 0xFFFFFFFF, 0xFFFFFFFF, 65535, 65535)
+
+        return (
+                sys.getsizeof(ring) + sys.getsizeof(ring.timestamps) + sys.getsizeof(ring.sizes) +
+                sys.getsizeof(key) + sum(sys.getsizeof(field) for field in key) +
+                100 +  # table slot and linked-list node of the OrderedDict
+                (features.footprint() if features is not None else 0)
+        )
+
+    def __len__(self) -> int:
+        return len(self._flows)
+
+    def add(self, key: FlowKey, timestamp: float, size: int, score: float | None = None) -> FlowWindow | None:
+        """
+        Add a packet to its flow.
+
+        Args:
+            key (FlowKey): The flow of the packet.
+            timestamp (float): The packet timestamp in epoch seconds.
+            size (int): The packet size in bytes.
+            score (float | None, optional): The running score of the flow after this packet, carried by the
+                window if the packet makes it due. Defaults to None.
+
+        Returns:
+            FlowWindow | None: A snapshot of the flow if it is now due for scoring, otherwise None.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            ring = self._flows.get(key)
+
+            if ring is None:
+                ring = self._flows[key] = PacketRing(
+                    self.window_size,
+                    self.features.new_flow(key[3], key[4]) if self.features is not None else None
+                )
+                ring.append(timestamp, size, now)
+                self._evict(now)
+            else:
+                self._flows.move_to_end(key)
+                ring.append(timestamp, size, now)
+
+            if ring.count < self.window_size or ring.pending < self.score_interval:
+                return None
+
+            ring.pending = 0
+
+            return FlowWindow(
+                key, *ring.ordered(), ring.features.sequences() if ring.features is not None else None, score
+            )
+
+    def add_batch(self, sensor_id: str, batch: PacketBatch, scores: np.ndarray | None = None) -> list[FlowWindow]:
+        """
+        Add every packet of a batch to its flow.
+
+        Args:
+            sensor_id (str): The sensor the batch was received from.
+            batch (PacketBatch): The decoded packets.
+            scores (np.ndarray | None, optional): The running score of the flow of every packet after that packet,
+                e.g. from a `StreamingScorer`; every window gets the score of the packet that made it due.
+                Defaults to None.
+
+        Returns:
+            list[FlowWindow]: The flows that became due for scoring, in the order they did.
+        """
+        columns = batch.columns
+        ready = []
+
+        for timestamp, size, source_ip, destination_ip, source_port, destination_port, score in zip(
+                columns["timestamps"].tolist(),
+                columns["sizes"].tolist(),
+                columns["source_ip"].tolist(),
+                columns["destination_ip"].tolist(),
+                columns["source_port"].tolist(),
+                columns["destination_port"].tolist(),
+                scores.tolist() if scores is not None else repeat(None)
+        ):
+            window = self.add(
+                (sensor_id, source_ip, destination_ip, source_port, destination_port), timestamp, size, score
+            )
+
+            if window is not None:
+                ready.append(window)
+
+        return ready
+
+    def evict_idle(self) -> int:
+        """
+        Evict every flow idle for longer than `idle_timeout`.
+
+        Returns:
+            int: The number of evicted flows.
+        """
+        with self._lock:
+            return self._evict(time.monotonic())
+
+    def _evict(self, now: float) -> int:
+        """
+        Evict idle flows, then the least recently active flows while the table is over budget.
+
+        Must be called with the lock held.
+
+        Args:
+            now (float): The current monotonic time.
+
+        Returns:
+            int: The number of evicted flows.
+        """
+        flows = self._flows
+        deadline = now - self.idle_timeout
+        evicted = 0
+
+        while flows and (len(flows) > self.max_flows or next(iter(flows.values())).last_seen < deadline):
+            flows.popitem(last=False)
+            evicted += 1
+
+        self.evicted_flows += evicted
+
+        return evicted
@@ -0,0 +1,362 @@
+import struct
+from json import loads
+
+from firewall.batch import PacketBatch
+
+HELLO_MAGIC: bytes = b"NGFW"
+VERDICT_MAGIC: bytes = b"NGFV"
+PROTOCOL_VERSION: int = 1
+
+# Hello flag asking for binary verdict replies instead of the text table.
+FLAG_BINARY_REPLY: int = 0x01
+REPLY_FORMATS: tuple[str, ...] = ("text", "binary")
+# Verdict of a flow the detector could not rate.
+VERDICT_UNKNOWN: int = 0xFF
+
+# magic, protocol version, flags
+HELLO = struct.Struct("!4sBB")
+# payload length of a binary frame
+FRAME_HEADER = struct.Struct("!I")
+# timestamp (epoch seconds), length, source IP, destination IP, source port, destination port
+BINARY_RECORD = struct.Struct("!dI4s4sHH")
+# magic, protocol version, threat level, number of verdict records
+VERDICT_HEADER = struct.Struct("!4sBBH")
+# source IP, destination IP, source port, destination port, verdict, score
+VERDICT_RECORD = struct.Struct("!IIHHBf")
+
+_WHITESPACE: bytes = b" \t\r\n"
+
+
+class ProtocolError(Exception):
+    """Raised when a stream can no longer be decoded and the connection should be closed."""
+
+    pass
+
+
+class FrameDecoder:
+    """
+    Base class for incremental decoders of the sensor wire protocol.
+
+    A decoder owns the receive buffer of one connection. Bytes are handed to `feed` exactly
+    as they come off the socket, and every complete record is returned as soon as its last
+    byte arrives, no matter how the stream was split across reads.
+
+    Decoded packets are written into a `PacketBatch` owned by the decoder, which is cleared
+    and reused by every call to `feed`.
+
+    Attributes:
+        batch (PacketBatch): The packets decoded by the last call to `feed`.
+        faulty_frames (int): The number of frames that could not be decoded so far.
+        reply_format (str): The reply format requested by the client, "text" or "binary".
+
+    Methods:
+        feed(data): Add received bytes and return the packets completed by them.
+    """
+
+    def __init__(self):
+        """
+        Initialize a FrameDecoder instance with an empty receive buffer.
+        """
+        self._buffer = bytearray()
+        self.batch = PacketBatch()
+        self.faulty_frames: int = 0
+        self.reply_format: str = "text"
+
+    def feed(self, data: bytes | bytearray | memoryview) -> PacketBatch:
+        """
+        Add received bytes to the buffer and return every packet completed by them.
+
+        Args:
+            data (bytes | bytearray | memoryview): The bytes received from the socket.
+
+        Returns:
+            PacketBatch: The decoded packets, in arrival order. The batch is only valid until the next call.
+        """
+        raise NotImplementedError("Please implement feed")
+
+
+class JSONStreamDecoder(FrameDecoder):
+    """
+    Decoder for newline-terminated JSON packet objects.
+
+    Both compact newline-delimited JSON and the indented output of `QJsonDocument::toJson`
+    are accepted: an object may span several lines, and it is complete once a line closing
+    it has been received. Lines that cannot start a JSON object, and packets with a field of the
+    wrong type or out of range, are counted as faulty frames and skipped. A pending object
+    followed by a line opening another one is counted as faulty too, and decoding resumes
+    at that line.
+
+    A control object such as `{"ReplyFormat": "binary"}` switches the reply format of the
+    connection instead of being decoded as a packet.
+
+    Args:
+        max_record_size (int, optional): The largest pending record, in bytes, before it is
+            discarded as faulty. Defaults to 65536.
+    """
+
+    def __init__(self, max_record_size: int = 65536):
+        super().__init__()
+
+        self.max_record_size = max_record_size
+        self._search_from = 0
+
+    def feed(self, data: bytes | bytearray | memoryview) -> PacketBatch:
+        buffer = self._buffer
+        buffer += data
+
+        batch = self.batch
+        batch.clear()
+        start = 0
+        search_from = self._search_from
+
+        while True:
+            line_start = search_from
+            newline = buffer.find(b"\n", search_from)
+            if newline < 0:
+                break
+            search_from = newline + 1
+
+            first, last = start, newline - 1
+            while first <= last and buffer[first] in _WHITESPACE:
+                first += 1
+            while last >= first and buffer[last] in _WHITESPACE:
+                last -= 1
+
+            if first > last:
+                start = search_from
+                continue
+
+            if first < line_start:
+                # Packet records are flat: a line opening an object while one is pending starts a new record,
+                # so the pending one was truncated or malformed.
+                line_first = line_start
+                while line_first < newline and buffer[line_first] in _WHITESPACE:
+                    line_first += 1
+
+                if line_first < newline and buffer[line_first] == 0x7B:  # "{"
+                    self.faulty_frames += 1
+                    start, first = line_start, line_first
+
+            if buffer[first] != 0x7B:  # "{"
+                self.faulty_frames += 1
+                start = search_from
+                continue
+
+            if buffer[last] != 0x7D:  # "}"
+                continue
+
+            line = buffer[first:last + 1]
+            try:
+                record = loads(line)
+            except ValueError:
+                # Keep reading if the object is nested and not closed yet.
+                if line.count(b"{") > line.count(b"}"):
+                    continue
+
+                self.faulty_frames += 1
+                start = search_from
+                continue
+
+            if isinstance(record, dict) and "ReplyFormat" in record:
+                if record["ReplyFormat"] in REPLY_FORMATS:
+                    self.reply_format = record["ReplyFormat"]
+                else:
+                    self.faulty_frames += 1
+            elif isinstance(record, dict) and record:
+                try:
+                    batch.append_record(record)
+                except ValueError:
+                    self.faulty_frames += 1
+            start = search_from
+
+        if len(buffer) - start > self.max_record_size:
+            self.faulty_frames += 1
+            start = search_from = len(buffer)
+
+        del buffer[:start]
+        self._search_from = search_from - start
+
+        return batch
+
+
+class LengthPrefixedDecoder(FrameDecoder):
+    """
+    Decoder for length-prefixed binary frames.
+
+    Every frame is a 4-byte big-endian payload length followed by one or more fixed-size
+    `BINARY_RECORD` packets. Frames whose length is not a multiple of the record size are
+    counted as faulty and skipped. The packets of a frame are copied into the batch column by
+    column, without unpacking them one by one.
+
+    Args:
+        max_frame_size (int, optional): The largest accepted payload, in bytes. Defaults to 1048576.
+
+    Raises:
+        ProtocolError: Raised by `feed` when a frame announces more than `max_frame_size` bytes,
+            since the stream cannot be resynchronized after that.
+    """
+
+    def __init__(self, max_frame_size: int = 1048576):
+        super().__init__()
+
+        self.max_frame_size = max_frame_size
+
+    def feed(self, data: bytes | bytearray | memoryview) -> PacketBatch:
+        buffer = self._buffer
+        buffer += data
+
+        batch = self.batch
+        batch.clear()
+        start = 0
+        record_size = BINARY_RECORD.size
+
+        with memoryview(buffer) as view:
+            while len(buffer) - start >= FRAME_HEADER.size:
+                (frame_size,) = FRAME_HEADER.unpack_from(buffer, start)
+
+                if frame_size > self.max_frame_size:
+                    raise ProtocolError(f"Frame of {frame_size} bytes exceeds {self.max_frame_size} bytes")
+
+                frame_end = start + FRAME_HEADER.size + frame_size
+                if frame_end > len(buffer):
+                    break
+
+                if frame_size % record_size:
+                    self.faulty_frames += 1
+                else:
+                    batch.extend_binary(view[start + FRAME_HEADER.size:frame_end])
+
+                start = frame_end
+
+        del buffer[:start]
+
+        return batch
+
+
+class ProtocolDecoder(FrameDecoder):
+    """
+    Decoder that negotiates the wire format from the first bytes of a connection.
+
+    Sensors that want the binary format open the stream with a `HELLO` message
+    (`HELLO_MAGIC`, protocol version, flags); the `FLAG_BINARY_REPLY` flag also selects
+    binary verdict replies. Any other stream, such as the JSON sent by the Qt front end, is
+    decoded with `JSONStreamDecoder`.
+
+    Attributes:
+        mode (str | None): "json" or "binary" once negotiated, None before that.
+        flags (int): The flags announced in the hello message (0 for JSON streams).
+
+    Raises:
+        ProtocolError: Raised by `feed` for an unsupported protocol version or an
+            undecodable binary stream.
+    """
+
+    def __init__(self):
+        self._decoder: FrameDecoder | None = None
+
+        super().__init__()
+
+        self.mode: str | None = None
+        self.flags: int = 0
+
+    @property
+    def faulty_frames(self) -> int:
+        return self._decoder.faulty_frames if self._decoder else 0
+
+    @faulty_frames.setter
+    def faulty_frames(self, value: int):
+        if self._decoder:
+            self._decoder.faulty_frames = value
+
+    @property
+    def reply_format(self) -> str:
+        return self._decoder.reply_format if self._decoder else "text"
+
+    @reply_format.setter
+    def reply_format(self, value: str):
+        if self._decoder:
+            self._decoder.reply_format = value
+
+    def feed(self, data: bytes | bytearray | memoryview) -> PacketBatch:
+        if self._decoder is not None:
+            return self._decoder.feed(data)
+
+        self._buffer += data
+        head = bytes(self._buffer[:HELLO.size])
+
+        if HELLO_MAGIC.startswith(head[:len(HELLO_MAGIC)]):
+            if len(head) < HELLO.size:
+                return self.batch
+
+            _, version, self.flags = HELLO.unpack(head)
+            if version != PROTOCOL_VERSION:
+                raise ProtocolError(f"Unsupported protocol version {version}")
+
+            self.mode = "binary"
+            self._decoder = LengthPrefixedDecoder()
+            self._decoder.reply_format = "binary" if self.flags & FLAG_BINARY_REPLY else "text"
+            del self._buffer[:HELLO.size]
+        else:
+            self.mode = "json"
+            self._decoder = JSONStreamDecoder()
+
+        pending, self._buffer = self._buffer, bytearray()
+
+        return self._decoder.feed(pending)
+
+
+class VerdictEncoder:
+    """
+    Encoder for binary verdict replies.
+
+    A reply is a `VERDICT_HEADER` (`VERDICT_MAGIC`, protocol version, overall threat level,
+    record count) followed by one fixed-size `VERDICT_RECORD` per scored flow: its packed
+    addresses and ports, its verdict (0 for safe, 1 for flagged, 2 for unsafe,
+    `VERDICT_UNKNOWN` if it could not be rated) and the model score as a float32.
+
+    Replies are packed into a buffer owned by the encoder and reused for every reply of the
+    connection; it only grows when a reply carries more flows than ever before.
+
+    Args:
+        capacity (int, optional): The number of verdict records preallocated. Defaults to 64.
+
+    Methods:
+        encode(thread_level, verdicts): Pack a reply and return a view of it.
+    """
+
+    MAX_RECORDS: int = 0xFFFF
+
+    def __init__(self, capacity: int = 64):
+        self._buffer = bytearray(VERDICT_HEADER.size + capacity * VERDICT_RECORD.size)
+
+    def encode(self, thread_level: int, verdicts: list[tuple[int, int, int, int, int, float]]) -> memoryview:
+        """
+        Pack a verdict reply.
+
+        Args:
+            thread_level (int): The overall threat level of the reply.
+            verdicts (list[tuple[int, int, int, int, int, float]]): Source IP, destination IP,
+                source port, destination port, verdict and score of every scored flow.
+
+        Returns:
+            memoryview: The encoded reply, valid until the next call.
+
+        Raises:
+            ValueError: Raised if there are more than `MAX_RECORDS` verdicts.
+        """
+        if len(verdicts) > self.MAX_RECORDS:
+            raise ValueError(f"A reply holds at most {self.MAX_RECORDS} verdicts")
+
+        size = VERDICT_HEADER.size + len(verdicts) * VERDICT_RECORD.size
+        if size > len(self._buffer):
+            self._buffer = bytearray(size)
+
+        buffer = self._buffer
+        VERDICT_HEADER.pack_into(buffer, 0, VERDICT_MAGIC, PROTOCOL_VERSION, thread_level, len(verdicts))
+
+        offset = VERDICT_HEADER.size
+        for verdict in verdicts:
+            VERDICT_RECORD.pack_into(buffer, offset, *verdict)
+            offset += VERDICT_RECORD.size
+
+        return memoryview(buffer)[:size]
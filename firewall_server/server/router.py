@@ -0,0 +1,565 @@
+import asyncio
+import hashlib
+
+import numpy as np
+
+from firewall.batch import BINARY_RECORD_DTYPE, PacketBatch, unpack_ip
+from server.protocol import (
+    FLAG_BINARY_REPLY,
+    FRAME_HEADER,
+    HELLO,
+    HELLO_MAGIC,
+    PROTOCOL_VERSION,
+    VERDICT_HEADER,
+    VERDICT_MAGIC,
+    VERDICT_RECORD,
+    VERDICT_UNKNOWN,
+    ProtocolDecoder,
+    ProtocolError
+)
+from server.socket import SocketManager
+from utils.metrics import MetricsRegistry, registry
+
+
+def flow_hashes(
+        source_ip: np.ndarray,
+        destination_ip: np.ndarray,
+        source_port: np.ndarray,
+        destination_port: np.ndarray
+) -> np.ndarray:
+    """
+    Hashes the 5-tuples of packets into 64-bit ring positions, with the SplitMix64 finalizer.
+
+    The protocol is not part of the sensor records, so a flow is identified by its addresses and ports.
+
+    Args:
+        source_ip (np.ndarray): Packed source addresses.
+        destination_ip (np.ndarray): Packed destination addresses.
+        source_port (np.ndarray): Source ports.
+        destination_port (np.ndarray): Destination ports.
+
+    Returns:
+        np.ndarray: One uint64 hash per packet.
+    """
+    with np.errstate(over="ignore"):
+        x = (source_ip.astype(np.uint64) << np.uint64(32)) | destination_ip.astype(np.uint64)
+        x ^= ((source_port.astype(np.uint64) << np.uint64(16)) | destination_port.astype(np.uint64)) * np.uint64(
+            0x9E3779B97F4A7C15
+        )
+        x ^= x >> np.uint64(30)
+        x *= np.uint64(0xBF58476D1CE4E5B9)
+        x ^= x >> np.uint64(27)
+        x *= np.uint64(0x94D049BB133111EB)
+        x ^= x >> np.uint64(31)
+
+    return x
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping flow hashes to backends.
+
+    Every backend owns `replicas` points of the 64-bit ring, placed by hashing its name, and a flow belongs to the
+    backend owning the first point at or after the flow hash. Adding or removing a backend therefore only moves
+    the flows of the ring arcs it gains or loses, about 1/N of them, and every other flow keeps its backend.
+
+    The ring is rebuilt on every change and swapped in with a single assignment, so lookups never see a ring
+    being modified.
+
+    Args:
+        nodes (list[str], optional): The initial backends. Defaults to none.
+        replicas (int, optional): Points per backend; more points spread the flows more evenly. Defaults to 128.
+
+    Methods:
+        add(node): Adds a backend.
+        remove(node): Removes a backend.
+        lookup(hashes): Returns the backend of every flow hash.
+    """
+
+    def __init__(self, nodes: list[str] = (), replicas: int = 128):
+        self.replicas = replicas
+        self._ring: tuple[tuple[str, ...], np.ndarray, np.ndarray] = (
+            (), np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+        )
+
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self.nodes
+
+    @property
+    def nodes(self) -> tuple[str, ...]:
+        """The backends of the ring, sorted."""
+        return self._ring[0]
+
+    def _points(self, node: str) -> list[int]:
+        return [
+            int.from_bytes(hashlib.blake2b(f"{node}#{replica}".encode(), digest_size=8).digest(), "big")
+            for replica in range(self.replicas)
+        ]
+
+    def _rebuild(self, nodes: list[str]):
+        nodes = tuple(sorted(nodes))
+        points = sorted((point, index) for index, node in enumerate(nodes) for point in self._points(node))
+
+        self._ring = (
+            nodes,
+            np.array([point for point, _ in points], dtype=np.uint64),
+            np.array([index for _, index in points], dtype=np.int64)
+        )
+
+    def add(self, node: str):
+        """
+        Adds a backend; only the flows of the ring arcs it takes over move to it.
+
+        Args:
+            node (str): The backend name.
+        """
+        if node not in self.nodes:
+            self._rebuild([*self.nodes, node])
+
+    def remove(self, node: str):
+        """
+        Removes a backend; only its flows move, to the backends owning the following points.
+
+        Args:
+            node (str): The backend name.
+        """
+        if node in self.nodes:
+            self._rebuild([other for other in self.nodes if other != node])
+
+    def lookup(self, hashes: np.ndarray) -> tuple[tuple[str, ...], np.ndarray]:
+        """
+        Returns the backend of every flow hash.
+
+        Args:
+            hashes (np.ndarray): Flow hashes, see `flow_hashes`.
+
+        Returns:
+            tuple[tuple[str, ...], np.ndarray]: The backends of the ring, and the index among them of the backend
+                of every hash (an empty array if the ring is empty).
+        """
+        nodes, points, owners = self._ring
+        if not len(points):
+            return nodes, np.empty(0, dtype=np.int64)
+
+        return nodes, owners[np.searchsorted(points, hashes) % len(points)]
+
+
+class Backend:
+    """
+    A `Brain` server the router forwards flows to, with its health.
+
+    Args:
+        address (str): "host:port" of the backend.
+        health_port (int | None, optional): Port of the backend's metrics endpoint, whose `/health` is checked.
+            Defaults to None.
+
+    Attributes:
+        host (str): The backend host.
+        port (int): The backend port.
+        health_port (int | None): The port of the backend's `/health` endpoint.
+        healthy (bool): Whether the backend is in the hash ring.
+        failures (int): Consecutive failed health checks or connections.
+    """
+
+    def __init__(self, address: str, health_port: int | None = None):
+        host, _, port = address.rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError(f"Backend address must be host:port, got {address!r}")
+
+        self.name = address
+        self.host = host
+        self.port = int(port)
+        self.health_port = health_port
+        self.healthy = True
+        self.failures = 0
+
+
+class FlowRouter(SocketManager):
+    """
+    Front router spreading the flows of sensor connections over several `Brain` backends.
+
+    Sensors connect to the router exactly as they would to a `Brain` server. The packets of every read are decoded,
+    hashed by 5-tuple on a `HashRing` and forwarded to their backend as binary frames, so every packet of a flow
+    reaches the same backend and its windows stay contiguous. Each sensor connection gets its own connection to
+    every backend it sends to; backends key their flows by connection, so flows of different sensors never mix.
+
+    Backends always send binary verdict replies to the router. Sensors that negotiated binary replies get them
+    relayed unchanged; sensors on the legacy text format get one `<rating>` line and one flow line per verdict,
+    since the router does not keep the packets the text table lists.
+
+    Backends with a health port are checked every `health_interval` seconds with a request to the `/health` path
+    of their metrics endpoint. After `failure_threshold` consecutive failures, or a failed forwarding connection, a
+    backend leaves the ring and its flows move to the following backends; it rejoins once a check succeeds. Packets
+    of a backend that fails while they are forwarded are dropped and counted.
+
+    A connection to the sensor port would be served as a sensor session, so backends without a health port are
+    only judged by their forwarding connections while in the ring, and checked with a TCP connect once out of it.
+
+    The router only forwards bytes, so it runs on an asyncio event loop.
+
+    Args:
+        server_ip (str): The IP address to listen on.
+        server_port (int): The port to listen on.
+        backends (list[str]): The "host:port" addresses of the backends.
+        health_ports (dict[str, int] | None, optional): The metrics port of the backends that have one, by address.
+            Defaults to None.
+        display_logs (bool, optional): Whether to display logs. Defaults to False.
+        replicas (int, optional): Ring points per backend. Defaults to 128.
+        health_interval (float, optional): Seconds between two health checks. Defaults to 1.
+        health_timeout (float, optional): Seconds a health check or backend connect may take. Defaults to 1.
+        failure_threshold (int, optional): Consecutive failed checks that take a backend out. Defaults to 3.
+        metrics (MetricsRegistry | None, optional): Registry the counters are recorded in. Defaults to the shared
+            `utils.metrics.registry`.
+
+    Attributes:
+        backends (dict[str, Backend]): The backends by name.
+        ring (HashRing): The healthy backends.
+
+    Methods:
+        add_backend(address, health_port): Adds a backend to the ring.
+        remove_backend(address): Removes a backend from the ring and stops checking it.
+        check_backends(): Health-checks every backend once.
+        stats(): Returns the health of every backend.
+
+    Usage:
+    ```python
+    router = FlowRouter(
+        "0.0.0.0", 1234, ["127.0.0.1:1235", "127.0.0.1:1236"], {"127.0.0.1:1235": 9101, "127.0.0.1:1236": 9102}
+    )
+    router.accept_requests()
+    ```
+    """
+
+    RECEIVE_BUFFER_SIZE: int = 65536
+    MAX_FAULTY_FRAMES: int = 100
+
+    def __init__(
+            self,
+            server_ip: str,
+            server_port: int,
+            backends: list[str],
+            health_ports: dict[str, int] | None = None,
+            display_logs: bool = False,
+            replicas: int = 128,
+            health_interval: float = 1.0,
+            health_timeout: float = 1.0,
+            failure_threshold: int = 3,
+            metrics: MetricsRegistry | None = None
+    ):
+        super().__init__(server_ip, server_port, display_logs, serving_mode="asyncio")
+
+        self.backends: dict[str, Backend] = {}
+        self.ring = HashRing(replicas=replicas)
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.failure_threshold = failure_threshold
+
+        metrics = metrics or registry
+        self._forwarded_packets = metrics.counter(
+            "firewall_router_forwarded_packets_total", "Packets forwarded to a backend.", ("backend",)
+        )
+        self._dropped_packets = metrics.counter(
+            "firewall_router_dropped_packets_total", "Packets dropped because their backend was unavailable."
+        )
+        self._relayed_verdicts = metrics.counter(
+            "firewall_router_relayed_verdicts_total", "Verdicts relayed from the backends to the sensors."
+        )
+        self._ring_changes = metrics.counter(
+            "firewall_router_ring_changes_total", "Backends added to or removed from the hash ring."
+        )
+        metrics.gauge(
+            "firewall_router_healthy_backends", "Backends in the hash ring.", function=lambda: len(self.ring)
+        )
+
+        health_ports = health_ports or {}
+        for address in backends:
+            self.add_backend(address, health_ports.get(address))
+
+    def add_backend(self, address: str, health_port: int | None = None):
+        """
+        Adds a backend to the ring; only the flows of the ring arcs it takes over move to it.
+
+        Args:
+            address (str): "host:port" of the backend.
+            health_port (int | None, optional): Port of the backend's metrics endpoint. Defaults to None.
+        """
+        backend = self.backends.get(address) or Backend(address, health_port)
+        if health_port is not None:
+            backend.health_port = health_port
+        self.backends[address] = backend
+        self._mark_healthy(backend)
+
+    def remove_backend(self, address: str):
+        """
+        Removes a backend from the ring and stops checking it; its flows move to the following backends.
+
+        Args:
+            address (str): "host:port" of the backend.
+        """
+        backend = self.backends.pop(address, None)
+        if backend is not None and backend.name in self.ring:
+            self.ring.remove(backend.name)
+            self._ring_changes.inc()
+            self.log_warning(f"Removed backend {address}")
+
+    def _mark_healthy(self, backend: Backend):
+        backend.failures = 0
+        backend.healthy = True
+
+        if backend.name not in self.ring and backend.name in self.backends:
+            self.ring.add(backend.name)
+            self._ring_changes.inc()
+            self.log_msg(f"Backend {backend.name} joined the ring")
+
+    def _mark_failed(self, backend: Backend, threshold: int | None = None):
+        backend.failures += 1
+
+        if backend.healthy and backend.failures >= (threshold or self.failure_threshold):
+            backend.healthy = False
+            self.ring.remove(backend.name)
+            self._ring_changes.inc()
+            self.log_warning(f"Backend {backend.name} left the ring after {backend.failures} failures")
+
+    async def _request_health(self, backend: Backend) -> bool:
+        """
+        Returns whether the `/health` endpoint of a backend answers with a 200 status.
+        """
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(backend.host, backend.health_port), self.health_timeout
+            )
+            writer.write(f"GET /health HTTP/1.0\r\nHost: {backend.host}\r\n\r\n".encode("ascii"))
+            status = await asyncio.wait_for(reader.readline(), self.health_timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        finally:
+            if writer is not None:
+                writer.close()
+
+        return status.split(b" ")[1:2] == [b"200"]
+
+    async def _check_backend(self, backend: Backend):
+        if backend.health_port is not None:
+            healthy = await self._request_health(backend)
+        elif backend.healthy:
+            return
+        else:
+            # Out of the ring, a connect only reaches the backend once it is back, and joins it right away.
+            try:
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection(backend.host, backend.port), self.health_timeout
+                )
+            except (OSError, asyncio.TimeoutError):
+                healthy = False
+            else:
+                writer.close()
+                healthy = True
+
+        if healthy:
+            self._mark_healthy(backend)
+        else:
+            self._mark_failed(backend)
+
+    async def check_backends(self):
+        """
+        Health-checks every backend once, concurrently.
+        """
+        await asyncio.gather(*(self._check_backend(backend) for backend in list(self.backends.values())))
+
+    async def _health_loop(self):
+        while True:
+            await self.check_backends()
+            await asyncio.sleep(self.health_interval)
+
+    async def _serve_async(self):
+        health = asyncio.create_task(self._health_loop())
+
+        try:
+            await super()._serve_async()
+        finally:
+            health.cancel()
+
+    async def _open_backend(
+            self,
+            backend: Backend,
+            decoder: ProtocolDecoder,
+            sensor: asyncio.StreamWriter
+    ) -> tuple[asyncio.StreamWriter, asyncio.Task] | None:
+        """
+        Opens the connection of a sensor session to a backend and starts relaying its verdicts.
+
+        Returns:
+            tuple | None: The backend writer and the relay task, or None if the backend cannot be reached.
+        """
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(backend.host, backend.port), self.health_timeout
+            )
+        except (OSError, asyncio.TimeoutError):
+            self._mark_failed(backend, threshold=1)
+            return None
+
+        writer.write(HELLO.pack(HELLO_MAGIC, PROTOCOL_VERSION, FLAG_BINARY_REPLY))
+
+        return writer, asyncio.create_task(self._relay_verdicts(reader, decoder, sensor))
+
+    async def _relay_verdicts(
+            self,
+            reader: asyncio.StreamReader,
+            decoder: ProtocolDecoder,
+            sensor: asyncio.StreamWriter
+    ):
+        """
+        Relays the verdict replies of a backend connection to the sensor, one whole reply at a time.
+        """
+        try:
+            while True:
+                header = await reader.readexactly(VERDICT_HEADER.size)
+                magic, _, _, count = VERDICT_HEADER.unpack(header)
+                if magic != VERDICT_MAGIC:
+                    raise ProtocolError(f"Unexpected verdict magic {magic!r}")
+
+                records = await reader.readexactly(count * VERDICT_RECORD.size)
+                self._relayed_verdicts.inc(count)
+
+                if decoder.reply_format == "binary":
+                    sensor.write(header + records)
+                else:
+                    sensor.write(self._format_verdicts(records))
+                await sensor.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ProtocolError):
+            pass
+
+    @staticmethod
+    def _format_verdicts(records: bytes) -> bytes:
+        """
+        Renders binary verdict records as text: a rating line and a flow line per verdict.
+        """
+        lines = []
+        for source_ip, destination_ip, source_port, destination_port, verdict, _ in VERDICT_RECORD.iter_unpack(
+                records
+        ):
+            lines.append(str(verdict) if verdict != VERDICT_UNKNOWN else "Insufficient data for prediction")
+            lines.append("        ".join(
+                (unpack_ip(source_ip), unpack_ip(destination_ip), str(source_port), str(destination_port))
+            ))
+
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    @staticmethod
+    def _encode_frame(batch: PacketBatch, selection: np.ndarray) -> bytes:
+        """
+        Encodes the selected packets of a batch as one binary frame.
+        """
+        columns = batch.columns
+        records = np.empty(len(selection), dtype=BINARY_RECORD_DTYPE)
+        for name in BINARY_RECORD_DTYPE.names:
+            records[name] = columns[name][selection]
+
+        return FRAME_HEADER.pack(records.nbytes) + records.tobytes()
+
+    async def _handle_connected_client_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Forwards the packets of a sensor to their backends until either side disconnects.
+
+        Args:
+            reader (asyncio.StreamReader): The stream to read sensor data from.
+            writer (asyncio.StreamWriter): The stream to relay verdicts to.
+        """
+        decoder = ProtocolDecoder()
+        connections: dict[str, tuple[asyncio.StreamWriter, asyncio.Task]] = {}
+
+        try:
+            while True:
+                data = await reader.read(self.RECEIVE_BUFFER_SIZE)
+                if not data:
+                    return
+
+                try:
+                    batch = decoder.feed(data)
+                except ProtocolError:
+                    return
+                if decoder.faulty_frames > self.MAX_FAULTY_FRAMES:
+                    return
+                if not len(batch):
+                    continue
+
+                columns = batch.columns
+                nodes, owners = self.ring.lookup(flow_hashes(
+                    columns["source_ip"], columns["destination_ip"],
+                    columns["source_port"], columns["destination_port"]
+                ))
+                if not len(owners):
+                    self._dropped_packets.inc(len(batch))
+                    continue
+
+                for index in np.unique(owners).tolist():
+                    await self._forward(
+                        self.backends.get(nodes[index]), batch, np.flatnonzero(owners == index),
+                        decoder, writer, connections
+                    )
+        finally:
+            for backend_writer, relay in connections.values():
+                backend_writer.close()
+                relay.cancel()
+
+    async def _forward(
+            self,
+            backend: Backend | None,
+            batch: PacketBatch,
+            selection: np.ndarray,
+            decoder: ProtocolDecoder,
+            sensor: asyncio.StreamWriter,
+            connections: dict[str, tuple[asyncio.StreamWriter, asyncio.Task]]
+    ):
+        """
+        Forwards the selected packets of a batch to a backend, opening the session's connection to it if needed.
+        """
+        if backend is None:
+            self._dropped_packets.inc(len(selection))
+            return
+
+        connection = connections.get(backend.name)
+        if connection is None or connection[1].done():
+            if connection is not None:
+                connection[0].close()
+            connection = await self._open_backend(backend, decoder, sensor)
+            if connection is None:
+                connections.pop(backend.name, None)
+                self._dropped_packets.inc(len(selection))
+                return
+            connections[backend.name] = connection
+
+        backend_writer = connection[0]
+        try:
+            backend_writer.write(self._encode_frame(batch, selection))
+            # Waiting for a slow backend stops reading the sensor, which pushes back on it.
+            await backend_writer.drain()
+        except ConnectionError:
+            backend_writer.close()
+            connection[1].cancel()
+            del connections[backend.name]
+            self._mark_failed(backend, threshold=1)
+            self._dropped_packets.inc(len(selection))
+            return
+
+        self._forwarded_packets.labels(backend.name).inc(len(selection))
+
+    def stats(self) -> dict:
+        """
+        Returns the health of every backend.
+
+        Returns:
+            dict: Per backend, whether it is in the ring and its consecutive failures.
+        """
+        return {
+            name: {"healthy": backend.healthy, "in_ring": name in self.ring, "failures": backend.failures}
+            for name, backend in self.backends.items()
+        }
@@ -1,4 +1,6 @@
+import asyncio
 import socket
+from threading import Lock
 
 from thread_management import thread_manager
 from utils.logging import LoggerMixIn
@@ -11,13 +13,21 @@ class SocketManager(LoggerMixIn):
     This class provides functionality for creating a server socket, accepting client
     connections, and handling client requests. It also includes basic logging capabilities.
 
+    Two serving modes are available:
+        - "threaded": a background thread accepts connections and `handle_request` hands
+          every client to its own thread (the original behaviour).
+        - "asyncio": a single event loop accepts, reads and replies for every client
+          through `_handle_connected_client_async`, without polling for new clients.
+
     Attributes:
         MAX_CLIENTS (int): The maximum number of clients that the server can handle.
         CHECK_FOR_NEW_CLIENTS (float): The time interval (in seconds) for rechecking
             for new client connections.
+        SERVING_MODES (tuple[str, ...]): The supported serving modes.
 
     Methods:
-        __init__(self, server_ip: str, server_port: int, display_logs: bool = False):
+        __init__(self, server_ip: str, server_port: int, display_logs: bool = False,
+                 serving_mode: str = "threaded"):
             Initialize a SocketManager instance.
 
         _initialize_socket(self):
@@ -26,9 +36,24 @@ class SocketManager(LoggerMixIn):
         _accept_connection(self):
             Accept incoming client connections and log them.
 
+        _admit_connection(self) -> bool:
+            Decide whether a new connection is served. Subclasses can enforce connection limits.
+
+        _release_connection(self):
+            Free what `_admit_connection` reserved once a connection is closed.
+
+        _forget_client(self, client_socket: socket.socket):
+            Drop a closed connection from `clients` and `active_clients`.
+
         handle_request(self):
             Handle client requests. This method should be implemented by subclasses.
 
+        _serve_async(self):
+            Accept and serve every client connection on a single asyncio event loop.
+
+        _handle_connected_client_async(self, reader, writer):
+            Serve one client on the event loop. This method should be implemented by subclasses.
+
         accept_requests(self):
             Start the server socket, accept incoming connections, and handle requests.
 
@@ -36,8 +61,15 @@ class SocketManager(LoggerMixIn):
 
     MAX_CLIENTS: int = 10
     CHECK_FOR_NEW_CLIENTS: float = 0.4  # times in seconds: To recheck for new clients!
-
-    def __init__(self, server_ip: str, server_port: int, display_logs: bool = False):
+    SERVING_MODES: tuple[str, ...] = ("threaded", "asyncio")
+
+    def __init__(
+            self,
+            server_ip: str,
+            server_port: int,
+            display_logs: bool = False,
+            serving_mode: str = "threaded"
+    ):
         """
         Initialize a SocketManager instance.
 
@@ -46,14 +78,24 @@ class SocketManager(LoggerMixIn):
             server_port (int): The port number to bind the server socket to.
             display_logs (bool): A boolean flag indicating whether to display logs.
                 If True, logs will be printed; if False, logs will be suppressed.
+            serving_mode (str): Either "threaded" (one thread per client) or "asyncio"
+                (every client on one event loop).
+
+        Raises:
+            ValueError: Raised if `serving_mode` is not one of `SERVING_MODES`.
         """
         super().__init__(display_logs)
 
+        if serving_mode not in self.SERVING_MODES:
+            raise ValueError(f"serving_mode must be one of {self.SERVING_MODES}")
+
         self.server_ip = server_ip
         self.server_port = server_port
+        self.serving_mode = serving_mode
 
         self.clients: list[(socket.socket, any)] = []
         self.active_clients: set[str] = set()
+        self.clients_lock = Lock()
 
         self.server_socket: socket.socket | None = None
 
@@ -67,17 +109,55 @@ class SocketManager(LoggerMixIn):
 
         self.log_msg(f"Server listening on {self.server_ip}:{self.server_port}")
 
-    @thread_manager.run_in_thread(execute_when_called=True)
+    @thread_manager.run_in_thread(execute_when_called=True, dedicated=True)
     def _accept_connection(self):
         """
         Accept incoming client connections and log them.
         """
         while True:
             client_data: (socket, any) = self.server_socket.accept()
-            self.clients.append(client_data)
+
+            if not self._admit_connection():
+                client_data[0].close()
+                self.log_warning(f"Refused connection from {client_data[1]}")
+                continue
+
+            with self.clients_lock:
+                self.clients.append(client_data)
 
             self.log_msg(f"Accepted connection from {client_data[1]}")
 
+    def _admit_connection(self) -> bool:
+        """
+        Decide whether a new connection is served.
+
+        Every admitted connection is handed back to `_release_connection` once it is closed.
+
+        Returns:
+            bool: True to serve the connection, False to close it right away.
+        """
+        return True
+
+    def _release_connection(self):
+        """
+        Free what `_admit_connection` reserved for a connection that is now closed.
+        """
+        pass
+
+    def _forget_client(self, client_socket: socket.socket):
+        """
+        Drop a closed connection from `clients` and `active_clients`, so they only hold open connections.
+
+        Args:
+            client_socket (socket.socket): The socket of the closed connection.
+        """
+        with self.clients_lock:
+            for client_data in self.clients:
+                if client_data[0] is client_socket:
+                    self.clients.remove(client_data)
+                    self.active_clients.discard(client_data[1])
+                    break
+
     def handle_request(self):
         """
         Handle client requests.
@@ -87,10 +167,74 @@ class SocketManager(LoggerMixIn):
         """
         raise NotImplementedError("Please implement handle_request")
 
+    async def _serve_async(self):
+        """
+        Accept and serve every client connection on a single asyncio event loop.
+
+        New clients are handed to `_handle_connected_client_async` as soon as they are
+        accepted, so there is no polling delay before their first packet is read.
+        """
+        server = await asyncio.start_server(
+            self._on_client_connected,
+            self.server_ip,
+            self.server_port,
+            backlog=self.MAX_CLIENTS
+        )
+
+        self.log_msg(f"Server listening on {self.server_ip}:{self.server_port} (asyncio)")
+
+        async with server:
+            await server.serve_forever()
+
+    async def _on_client_connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Log an accepted client connection and serve it until it disconnects.
+
+        Args:
+            reader (asyncio.StreamReader): The stream to read client data from.
+            writer (asyncio.StreamWriter): The stream to write replies to.
+        """
+        client_ip = writer.get_extra_info("peername")
+
+        if not self._admit_connection():
+            writer.close()
+            self.log_warning(f"Refused connection from {client_ip}")
+            return
+
+        self.log_msg(f"Accepted connection from {client_ip}")
+
+        try:
+            await self._handle_connected_client_async(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            self.log_warning(f"Session of {client_ip} failed: {type(e).__name__}: {e}")
+        finally:
+            writer.close()
+            self._release_connection()
+            self.log_warning(f"Session closed!")
+
+    async def _handle_connected_client_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serve a single client on the event loop.
+
+        This method should be implemented by subclasses that support the "asyncio"
+        serving mode.
+
+        Args:
+            reader (asyncio.StreamReader): The stream to read client data from.
+            writer (asyncio.StreamWriter): The stream to write replies to.
+        """
+        raise NotImplementedError("Please implement _handle_connected_client_async")
+
     def accept_requests(self):
         """
         Start the server socket, accept incoming connections, and handle requests.
         """
+        if self.serving_mode == "asyncio":
+            asyncio.run(self._serve_async())
+            return
+
         self._initialize_socket()
         self._accept_connection()
         self.handle_request()
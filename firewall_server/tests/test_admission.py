@@ -0,0 +1,31 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from server.admission import AdmissionController
+from server.flows import FlowWindow
+from utils.metrics import MetricsRegistry
+
+
+def flow_windows(count: int) -> list[FlowWindow]:
+    return [FlowWindow(("sensor-1", i, 2, i, 80), np.zeros(2), np.zeros(2)) for i in range(count)]
+
+
+def test_blocked_async_read_waits_for_release_and_is_counted():
+    metrics = MetricsRegistry()
+    admission = AdmissionController(max_pending_windows=4, policy="block", metrics=metrics)
+    admission.admit(flow_windows(4))
+
+    async def read():
+        waiting = asyncio.ensure_future(admission.admit_async(flow_windows(3)))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+
+        threading.Timer(0.05, admission.release, (4,)).start()
+
+        return await asyncio.wait_for(waiting, 2)
+
+    assert len(asyncio.run(read())) == 3
+    assert admission.pending_windows == 3
+    assert "firewall_blocked_reads_total 1" in metrics.render()
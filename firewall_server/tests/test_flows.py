@@ -0,0 +1,26 @@
+import numpy as np
+
+from firewall.batch import PacketBatch
+from server.flows import FlowTable
+
+
+def test_windows_carry_the_score_of_the_packet_that_made_them_due():
+    flows = FlowTable(window_size=11)
+    count = 50
+    source_port = np.arange(count) % 2
+    batch = PacketBatch.from_columns(
+        timestamps=np.arange(count, dtype=np.float64),
+        sizes=np.full(count, 100),
+        source_ip=1,
+        destination_ip=2,
+        source_port=source_port,
+        destination_port=80,
+    )
+    scores = np.arange(count, dtype=np.float32) / count
+
+    windows = flows.add_batch("sensor-1", batch, scores)
+
+    # The two flows alternate: their 11th and 22nd packets, at indices 20, 21, 42 and 43, close their windows.
+    assert [window.key[3] for window in windows] == [0, 1, 0, 1]
+    assert [window.score for window in windows] == scores[[20, 21, 42, 43]].tolist()
+    assert flows.add_batch("sensor-1", batch)[0].score is None
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from firewall.numpy_lstm import PRE_TRAINED_MODELS, NumpyLSTMModel, _load_keras_model
+
+pytest.importorskip("keras")
+pytest.importorskip("h5py")
+
+
+@pytest.fixture(scope="module")
+def keras_model():
+    return _load_keras_model(PRE_TRAINED_MODELS / "LSTM.keras")
+
+
+def test_numpy_model_matches_trained_keras_model(keras_model):
+    model = NumpyLSTMModel.load(PRE_TRAINED_MODELS / "LSTM.npz")
+    x = np.random.default_rng(0).standard_normal((1024, 10, 3)).astype(np.float32)
+
+    np.testing.assert_allclose(model.predict(x), keras_model.predict(x, verbose=0), atol=1e-5)
+
+
+def test_wrong_export_mapping_is_detected(keras_model):
+    model = NumpyLSTMModel.load(PRE_TRAINED_MODELS / "LSTM.npz")
+    weights = dict(model.weights)
+    forward, backward = weights["0/forward/kernel"], weights["0/backward/kernel"]
+    weights["0/forward/kernel"], weights["0/backward/kernel"] = backward, forward
+    x = np.random.default_rng(0).standard_normal((256, 10, 3)).astype(np.float32)
+
+    assert np.max(np.abs(NumpyLSTMModel(model.layers, weights).predict(x) - keras_model.predict(x, verbose=0))) > 1e-3
@@ -0,0 +1,39 @@
+import json
+
+from server.protocol import JSONStreamDecoder
+
+
+def packet_records(count: int) -> list[dict]:
+    return [
+        {
+            "Timestamp": 1.7e9 + i,
+            "Length": 60 + i,
+            "SourceIP": "10.0.0.1",
+            "DestinationIP": "10.0.0.2",
+            "SourcePort": 40000,
+            "DestinationPort": 443,
+        }
+        for i in range(count)
+    ]
+
+
+def test_truncated_record_does_not_swallow_the_following_ones():
+    decoder = JSONStreamDecoder()
+    data = b'{"timestamps": [1.0, \n' + b"".join(json.dumps(record).encode() + b"\n" for record in packet_records(50))
+
+    assert len(decoder.feed(data)) == 50
+    assert decoder.faulty_frames == 1
+
+
+def test_truncated_record_before_indented_records():
+    decoder = JSONStreamDecoder()
+    data = b'{\n    "Timestamp": 1.0,\n' + b"".join(
+        json.dumps(record, indent=4).encode() + b"\n" for record in packet_records(5)
+    )
+
+    packets = 0
+    for offset in range(0, len(data), 7):
+        packets += len(decoder.feed(data[offset:offset + 7]))
+
+    assert packets == 5
+    assert decoder.faulty_frames == 1
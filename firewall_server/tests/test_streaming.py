@@ -0,0 +1,59 @@
+import numpy as np
+
+from firewall.LSTM import LSTMPacketThreadDetection
+from firewall.batch import PacketBatch
+from firewall.numpy_lstm import NumpyLSTMModel
+from firewall.streaming import StreamingScorer
+
+
+def unidirectional_model(units: int = 16, seed: int = 0) -> NumpyLSTMModel:
+    rng = np.random.default_rng(seed)
+    lstm = {"activation": "tanh", "recurrent_activation": "sigmoid"}
+    layers = [
+        {"type": "lstm", **lstm, "return_sequences": True},
+        {"type": "lstm", **lstm, "return_sequences": False},
+        {"type": "dense", "activation": "sigmoid"},
+    ]
+    weights = {}
+    for index, inputs in enumerate((3, units)):
+        weights[f"{index}/forward/kernel"] = rng.normal(0, 0.5, (inputs, 4 * units))
+        weights[f"{index}/forward/recurrent_kernel"] = rng.normal(0, 0.5, (units, 4 * units))
+        weights[f"{index}/forward/bias"] = rng.normal(0, 0.1, 4 * units)
+    weights["2/forward/kernel"] = rng.normal(0, 0.5, (units, 1))
+    weights["2/forward/bias"] = np.zeros(1)
+
+    return NumpyLSTMModel(layers, weights)
+
+
+def flow_batches(count: int = 40, flows: int = 7, packets: int = 97, seed: int = 1) -> list[PacketBatch]:
+    rng = np.random.default_rng(seed)
+    total = count * packets
+    flow = rng.integers(0, flows, total)
+    batch = PacketBatch.from_columns(
+        timestamps=np.arange(total, dtype=np.float64),
+        sizes=rng.integers(40, 1500, total),
+        source_ip=0x0A000001 + flow,
+        destination_ip=0x0A0000FE,
+        source_port=40000 + flow,
+        destination_port=443,
+    )
+    columns = batch.columns
+
+    return [
+        PacketBatch.from_columns(**{name: column[start:start + packets] for name, column in columns.items()})
+        for start in range(0, total, packets)
+    ]
+
+
+def test_equivalence_mode_matches_window_scoring():
+    detector = LSTMPacketThreadDetection(backend="numpy")
+    detector.model = unidirectional_model()
+    scorer = StreamingScorer(detector, reset_interval=detector.seq_length + 1, validate=True)
+
+    for batch in flow_batches():
+        scorer.score_batch("sensor-1", batch)
+
+    stats = scorer.stats()
+    assert stats["windows"] > 0
+    assert stats["max_abs_error"] == 0.0
+    assert stats["verdict_mismatch"] == 0.0
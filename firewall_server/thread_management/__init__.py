@@ -1,78 +1,306 @@
-from threading import Thread
+import traceback
+from concurrent.futures import Future, wait
+from queue import Empty, Full, Queue
+from threading import Lock, Semaphore, Thread
+from time import monotonic
+from typing import NamedTuple
+
+
+class _Task(NamedTuple):
+    """A function call waiting for a worker, with the future its outcome is delivered to."""
+
+    func: callable
+    args: tuple
+    kwargs: dict
+    future: Future
+
+
+def _run_task(task: _Task):
+    """
+    Run a task and deliver its result or exception to its future, unless it was cancelled.
+    """
+    if not task.future.set_running_or_notify_cancel():
+        return
+
+    try:
+        task.future.set_result(task.func(*task.args, **task.kwargs))
+    except BaseException as e:
+        task.future.set_exception(e)
+
+
+def _print_exception(future: Future):
+    """
+    Print the traceback of a fire-and-forget task that failed, like an unhandled exception in a thread would.
+    """
+    if not future.cancelled() and future.exception() is not None:
+        traceback.print_exception(future.exception())
 
 
 class ThreadManager:
     """
     A utility class for managing threads in Python applications.
 
-    This class provides a simple way to create and manage threads, allowing
-    you to run functions in separate threads and manage their execution.
+    This class runs functions on a fixed-size pool of reusable worker threads. Calls are queued in a bounded
+    submission queue, every call returns a `Future` carrying its result or exception, and finished calls are
+    forgotten as soon as they complete. Workers are started on demand, up to `max_workers`.
+
+    Functions that never return, such as accept or dispatch loops, would hold a pool worker forever; they are
+    run with `dedicated=True` on a thread of their own instead, which is reaped once the function returns.
+    Dedicated threads are not capped here: each is a server loop started once, or a sensor connection, which
+    the `AdmissionController` connection limit caps. Everything else, such as reloads or the per-window work
+    of the asyncio server, goes through the pool.
+
+    Args:
+        max_workers (int, optional): The maximum number of pool workers, i.e. pooled calls running at once.
+            Defaults to 64.
+        max_queue (int, optional): The maximum number of calls waiting for a worker. Defaults to 1024.
+        submit_timeout (float | None, optional): How long `submit` waits for room in a full queue before raising
+            `queue.Full`. Defaults to None (wait as long as needed).
 
     Attributes:
-        active_threads (list[Thread]): A list of active (running) threads.
-        inactive_threads (list[Thread]): A list of inactive (not yet started) threads.
+        active_threads (list[Thread]): The live worker and dedicated threads.
+        inactive_threads (list[_Task]): Calls deferred by `run_in_thread(execute_when_called=False)`.
 
     Methods:
-        run_in_thread(self, execute_when_called: bool = False) -> callable:
+        submit(func, *args, **kwargs) -> Future:
+            Queue a call for the worker pool.
+
+        run_in_thread(self, execute_when_called: bool = False, dedicated: bool = False) -> callable:
             A decorator function for running a function in a thread.
 
         run_inactive_threads(self):
-            Start all inactive threads in the queue.
+            Submit all deferred calls.
 
-        wait_for_all_active_threads(self):
-            Wait for all active threads to complete their execution.
+        wait_for_all_active_threads(self, timeout: float | None = None):
+            Wait for all submitted calls to complete their execution.
+
+        shutdown(self, drain_timeout: float | None = None, cancel_pending: bool = False) -> bool:
+            Stop accepting calls and stop the workers once the queue is drained.
     """
 
-    def __init__(self):
+    def __init__(self, max_workers: int = 64, max_queue: int = 1024, submit_timeout: float | None = None):
+        """
+        Initialize a ThreadManager instance with an empty pool; workers are started by the first submissions.
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
+        self.max_workers = max_workers
+        self.submit_timeout = submit_timeout
+        self.inactive_threads: list[_Task] = []
+
+        self._tasks: Queue[_Task | None] = Queue(max_queue)
+        self._workers: list[Thread] = []
+        self._dedicated_threads: set[Thread] = set()
+        self._idle_workers = Semaphore(0)
+        self._pending: set[Future] = set()
+        self._lock = Lock()
+        self._shut_down = False
+
+    @property
+    def active_threads(self) -> list[Thread]:
+        with self._lock:
+            return [thread for thread in self._workers + list(self._dedicated_threads) if thread.is_alive()]
+
+    @property
+    def queue_depth(self) -> int:
         """
-        Initialize a ThreadManager instance with empty active and inactive thread lists.
+        The number of calls waiting for a worker.
+        """
+        return self._tasks.qsize()
+
+    def _track(self, future: Future):
+        with self._lock:
+            self._pending.add(future)
+
+        future.add_done_callback(self._forget)
+
+    def _forget(self, future: Future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def submit(self, func: callable, /, *args, **kwargs) -> Future:
         """
-        self.active_threads: list[Thread] = []
-        self.inactive_threads: list[Thread] = []
+        Queue a call for the worker pool.
+
+        Args:
+            func (callable): The function to call.
+            *args: Positional arguments for `func`.
+            **kwargs: Keyword arguments for `func`.
+
+        Returns:
+            Future: Resolves to the return value of the call, or to the exception it raised.
+
+        Raises:
+            RuntimeError: Raised after `shutdown`.
+            queue.Full: Raised if the queue stays full for `submit_timeout` seconds.
+        """
+        future = Future()
+        self._submit_task(_Task(func, args, kwargs, future))
+
+        return future
+
+    def _adjust_workers(self):
+        """
+        Start a worker if none is idle and the pool is not full.
+        """
+        if self._idle_workers.acquire(blocking=False):
+            return
+
+        with self._lock:
+            if len(self._workers) < self.max_workers:
+                worker = Thread(target=self._work, name=f"ThreadManager-{len(self._workers)}", daemon=True)
+                self._workers.append(worker)
+                worker.start()
 
-    def run_in_thread(self, execute_when_called: bool = False) -> callable:
+    def _work(self):
+        """
+        Worker loop: run queued calls until a stop marker is received.
+        """
+        while (task := self._tasks.get()) is not None:
+            _run_task(task)
+            del task
+
+            self._idle_workers.release()
+
+    def _start_dedicated(self, task: _Task):
+        """
+        Run a call on a thread of its own, forgetting the thread once the call returns.
+        """
+        def run():
+            try:
+                _run_task(task)
+            finally:
+                with self._lock:
+                    self._dedicated_threads.discard(thread)
+
+        thread = Thread(target=run, name=getattr(task.func, "__qualname__", None), daemon=True)
+
+        with self._lock:
+            self._dedicated_threads.add(thread)
+
+        thread.start()
+
+    def run_in_thread(self, execute_when_called: bool = False, dedicated: bool = False) -> callable:
         """
         Decorator function for running a function in a thread.
 
+        Calling the decorated function returns a `Future` of its result. Exceptions are also printed, as they
+        would be for a plain thread, since most callers never look at the future.
+
         Args:
-            execute_when_called (bool): If True, the thread starts immediately when
-                the decorated function is called. If False, the thread is added to
-                the inactive_threads list and can be started later.
+            execute_when_called (bool): If True, the call is submitted immediately when the decorated function is
+                called. If False, it is added to the inactive_threads list and can be started later.
+            dedicated (bool): If True, the function runs on a thread of its own instead of a pool worker. Use it for
+                functions that run for the lifetime of the program or of a connection, never for short calls.
 
         Returns:
             callable: The decorator function.
         """
 
         def accept_function(func: callable):
-            def accept_parameters(*args, **kwargs):
-                thread = Thread(target=func, daemon=True, args=args, kwargs=kwargs)
+            def accept_parameters(*args, **kwargs) -> Future:
+                future = Future()
+                future.add_done_callback(_print_exception)
+                task = _Task(func, args, kwargs, future)
 
-                if execute_when_called:
-                    thread.start()
-                    self.active_threads.append(thread)
+                if not execute_when_called:
+                    self.inactive_threads.append(task)
+                elif dedicated:
+                    self._start_dedicated(task)
                 else:
-                    self.inactive_threads.append(thread)
+                    self._submit_task(task)
+
+                return future
 
             return accept_parameters
 
         return accept_function
 
+    def _submit_task(self, task: _Task):
+        """
+        Queue an already built task for the worker pool, see `submit`.
+        """
+        if self._shut_down:
+            raise RuntimeError("ThreadManager is shut down")
+
+        self._track(task.future)
+
+        try:
+            self._tasks.put(task, timeout=self.submit_timeout)
+        except Full:
+            task.future.cancel()
+            raise
+
+        self._adjust_workers()
+
     def run_inactive_threads(self):
         """
-        Start all inactive threads in the queue.
+        Submit all deferred calls to the worker pool.
         """
-        for thread in self.inactive_threads:
-            thread.start()
-            self.inactive_threads.append(thread)
+        inactive_threads, self.inactive_threads = self.inactive_threads, []
 
-        self.inactive_threads = []
+        for task in inactive_threads:
+            self._submit_task(task)
 
-    def wait_for_all_active_threads(self):
+    def wait_for_all_active_threads(self, timeout: float | None = None) -> bool:
         """
-        Wait for all active threads to complete their execution.
+        Wait for all submitted calls to complete their execution.
+
+        Args:
+            timeout (float | None, optional): The longest wait in seconds. Defaults to None (no limit).
+
+        Returns:
+            bool: True if every call completed.
+        """
+        with self._lock:
+            pending = list(self._pending)
+
+        return not wait(pending, timeout).not_done
+
+    def shutdown(self, drain_timeout: float | None = None, cancel_pending: bool = False) -> bool:
+        """
+        Stop accepting calls, let the workers finish the queued ones, then stop them.
+
+        Dedicated threads are not waited for: they are daemon threads stopped by whoever started them.
+
+        Args:
+            drain_timeout (float | None, optional): The longest wait for the queue to drain and the workers to exit,
+                in seconds. Defaults to None (no limit).
+            cancel_pending (bool, optional): Cancel the calls still waiting in the queue instead of running them.
+                Defaults to False.
+
+        Returns:
+            bool: True if every worker exited within `drain_timeout`.
         """
-        for thread in self.active_threads:
-            thread.join()
+        self._shut_down = True
+        deadline = None if drain_timeout is None else monotonic() + drain_timeout
+
+        def remaining() -> float | None:
+            return None if deadline is None else max(0.0, deadline - monotonic())
+
+        if cancel_pending:
+            while True:
+                try:
+                    task = self._tasks.get_nowait()
+                except Empty:
+                    break
+                if task is not None:
+                    task.future.cancel()
+
+        with self._lock:
+            workers = list(self._workers)
+
+        try:
+            for _ in workers:
+                self._tasks.put(None, timeout=remaining())
+        except Full:
+            return False
+
+        for worker in workers:
+            worker.join(remaining())
+
+        return not any(worker.is_alive() for worker in workers)
 
 
 thread_manager = ThreadManager()
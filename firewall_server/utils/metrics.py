@@ -0,0 +1,356 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from typing import Callable
+
+from thread_management import thread_manager
+
+# Latency buckets in seconds, from 50 microseconds to 10 seconds.
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0
+)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base class of the metrics kept by a `MetricsRegistry`.
+
+    A metric declared with label names holds one child per combination of label values, created on first use
+    by `labels`. A metric without labels is its own single child.
+
+    Args:
+        name (str): The Prometheus metric name.
+        documentation (str): The help text.
+        label_names (tuple[str, ...], optional): The label names. Defaults to no labels.
+
+    Methods:
+        labels(*values): Returns the child for the given label values.
+        samples(): Returns the exposition lines of the metric.
+    """
+
+    TYPE: str = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._lock = Lock()
+        self._children: dict[tuple[str, ...], "Metric"] = {}
+
+    def labels(self, *values) -> "Metric":
+        """
+        Returns the child metric for the given label values, creating it on first use.
+
+        Args:
+            *values: One value per label name.
+
+        Returns:
+            Metric: The child, of the same type as this metric.
+        """
+        values = tuple(str(value) for value in values)
+
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes the labels {self.label_names}")
+
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+
+        return child
+
+    def _new_child(self) -> "Metric":
+        return type(self)(self.name, self.documentation)
+
+    def samples(self) -> list[str]:
+        """
+        Returns the exposition lines of the metric, without the HELP and TYPE header.
+        """
+        if not self.label_names:
+            return self._child_samples(())
+
+        lines = []
+        for values, child in list(self._children.items()):
+            lines.extend(child._child_samples(values, self.label_names))
+
+        return lines
+
+    def _child_samples(self, values: tuple[str, ...], names: tuple[str, ...] = ()) -> list[str]:
+        raise NotImplementedError("Please implement _child_samples")
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count, such as packets received.
+    """
+
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()):
+        super().__init__(name, documentation, label_names)
+
+        self.value = 0
+
+    def inc(self, amount: int | float = 1):
+        """
+        Increments the counter.
+
+        Args:
+            amount (int | float, optional): The increment. Defaults to 1.
+        """
+        with self._lock:
+            self.value += amount
+
+    def _child_samples(self, values: tuple[str, ...], names: tuple[str, ...] = ()) -> list[str]:
+        return [f"{self.name}{_format_labels(names, values)} {_format_value(self.value)}"]
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, such as active connections.
+
+    A gauge created with a `function` reads its value from it at scrape time, which costs nothing on the hot path
+    for values the program already tracks (queue depths, table sizes).
+
+    Args:
+        function (Callable[[], float] | None, optional): Returns the current value. Defaults to None.
+    """
+
+    TYPE = "gauge"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            label_names: tuple[str, ...] = (),
+            function: Callable[[], float] | None = None
+    ):
+        super().__init__(name, documentation, label_names)
+
+        self.value = 0
+        self.function = function
+
+    def set(self, value: int | float):
+        self.value = value
+
+    def inc(self, amount: int | float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: int | float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def _child_samples(self, values: tuple[str, ...], names: tuple[str, ...] = ()) -> list[str]:
+        value = self.function() if self.function is not None else self.value
+
+        return [f"{self.name}{_format_labels(names, values)} {_format_value(value)}"]
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, such as stage latencies, in cumulative buckets.
+
+    Args:
+        buckets (tuple[float, ...], optional): Upper bounds of the buckets. Defaults to `DEFAULT_BUCKETS`.
+    """
+
+    TYPE = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            label_names: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, label_names)
+
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float):
+        """
+        Records a value.
+
+        Args:
+            value (float): The observed value.
+        """
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        """
+        Observes the duration of the `with` block, in seconds.
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at)
+
+    def _child_samples(self, values: tuple[str, ...], names: tuple[str, ...] = ()) -> list[str]:
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(names, values, f'le="{_format_value(float(bound))}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+
+        labels = _format_labels(names, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collection of named metrics, rendered together in the Prometheus text format.
+
+    Metrics are created on first request and shared afterwards, so every component can ask the registry for the
+    metrics it updates without coordinating who declares them.
+
+    Methods:
+        counter(name, documentation, label_names): Returns the counter with that name.
+        gauge(name, documentation, label_names, function): Returns the gauge with that name.
+        histogram(name, documentation, label_names, buckets): Returns the histogram with that name.
+        render(): Renders every metric in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._lock = Lock()
+
+    def _get(self, metric_type: type, name: str, *args, **kwargs) -> Metric:
+        metric = self._metrics.get(name)
+
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = metric_type(name, *args, **kwargs)
+
+        if not isinstance(metric, metric_type):
+            raise ValueError(f"{name} is already registered as a {metric.TYPE}")
+
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self._get(Counter, name, documentation, label_names)
+
+    def gauge(
+            self,
+            name: str,
+            documentation: str,
+            label_names: tuple[str, ...] = (),
+            function: Callable[[], float] | None = None
+    ) -> Gauge:
+        gauge = self._get(Gauge, name, documentation, label_names)
+        if function is not None:
+            gauge.function = function
+
+        return gauge
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            label_names: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get(Histogram, name, documentation, label_names, buckets)
+
+    def render(self) -> str:
+        """
+        Renders every metric in the Prometheus text exposition format (version 0.0.4).
+
+        Returns:
+            str: The exposition, one HELP and TYPE header per metric followed by its samples.
+        """
+        lines = []
+
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines.extend(metric.samples())
+
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(host: str, port: int, metrics: MetricsRegistry | None = None) -> ThreadingHTTPServer:
+    """
+    Serves a registry over HTTP, at `/metrics`, on a background thread.
+
+    `/health` answers "ok" with a 200 status while the process serves, so that a `FlowRouter` can check a Brain
+    server without opening a sensor session on it.
+
+    Args:
+        host (str): The address to listen on; keep it local unless the endpoint is firewalled.
+        port (int): The port to listen on.
+        metrics (MetricsRegistry | None, optional): The registry to serve. Defaults to the shared `registry`.
+
+    Returns:
+        ThreadingHTTPServer: The running server; call `shutdown` to stop it.
+    """
+    metrics = metrics or registry
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/health":
+                body, content_type = b"ok\n", "text/plain; charset=utf-8"
+            elif path == "/metrics":
+                body, content_type = metrics.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                self.send_error(404)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+
+    thread_manager.run_in_thread(execute_when_called=True, dedicated=True)(server.serve_forever)()
+
+    return server
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,315 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from pathlib import Path
+
+from thread_management import thread_manager
+from utils.metrics import Histogram
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler of every thread of the process, which can be started and stopped while serving.
+
+    While running, a background thread wakes up every `interval` seconds and records the Python stack of every
+    other thread from `sys._current_frames`. Nothing is hooked into the profiled code, so the overhead is one stack
+    walk per thread per interval, whatever the load. Samples are counted per stack, and `collapsed` renders them in
+    the collapsed-stack format read by flame graph tools (`flamegraph.pl`, speedscope): one line per stack, frames
+    root first separated by ";", then the sample count. Stacks start with the thread name, so the connection,
+    dispatcher and worker threads show up as separate towers.
+
+    The profile is wall-clock: threads waiting on a socket or a queue are sampled too, which shows where requests
+    wait as well as where they compute.
+
+    Args:
+        interval (float, optional): Seconds between two samples. Defaults to 0.005.
+        max_depth (int, optional): Frames kept from the top of a stack. Defaults to 128.
+
+    Attributes:
+        samples (int): Sampling rounds of the current or last run.
+
+    Methods:
+        start(): Starts sampling.
+        stop(): Stops sampling.
+        collapsed(): Returns the samples in collapsed-stack format.
+        write(path): Writes the collapsed stacks to a file.
+        stats(): Returns whether it runs and how much it sampled.
+
+    Usage:
+    ```python
+    profiler = SamplingProfiler()
+    profiler.start()
+    ...
+    profiler.stop()
+    profiler.write("brain.collapsed")  # flamegraph.pl brain.collapsed > brain.svg
+    ```
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 128):
+        self.interval = interval
+        self.max_depth = max_depth
+
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._labels: dict = {}
+        self._started_at = 0.0
+        self._stopped_at = 0.0
+        self._stop = threading.Event()
+        self._sampler = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._sampler is not None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = (
+                f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            )
+
+        return label
+
+    def _sample_stacks(self):
+        """
+        Records the stack of every thread but the sampler until stopped.
+        """
+        own = threading.get_ident()
+
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+
+                frames = []
+                while frame is not None and len(frames) < self.max_depth:
+                    frames.append(self._label(frame.f_code))
+                    frame = frame.f_back
+
+                frames.append(names.get(ident, str(ident)))
+                stacks.append(";".join(reversed(frames)))
+
+            with self._lock:
+                self._stacks.update(stacks)
+                self.samples += 1
+
+    def start(self):
+        """
+        Starts sampling, dropping the samples of the last run.
+
+        Raises:
+            RuntimeError: Raised if the profiler is already running.
+        """
+        with self._lock:
+            if self._sampler is not None:
+                raise RuntimeError("The profiler is already running")
+
+            self._stacks.clear()
+            self.samples = 0
+            self._started_at = time.monotonic()
+            self._stop.clear()
+            self._sampler = thread_manager.run_in_thread(execute_when_called=True, dedicated=True)(
+                self._sample_stacks
+            )()
+
+    def stop(self):
+        """
+        Stops sampling and waits for the sampler to finish; the samples are kept until the next `start`.
+        """
+        sampler = self._sampler
+        if sampler is None:
+            return
+
+        self._stop.set()
+        sampler.result()
+
+        self._stopped_at = time.monotonic()
+        self._sampler = None
+
+    def collapsed(self) -> str:
+        """
+        Returns the samples in collapsed-stack format, most sampled stacks first.
+        """
+        with self._lock:
+            stacks = self._stacks.most_common()
+
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def write(self, path: Path | str) -> Path:
+        """
+        Writes the collapsed stacks to a file.
+
+        Args:
+            path (Path | str): The file to write.
+
+        Returns:
+            Path: The file written.
+        """
+        path = Path(path)
+        path.write_text(self.collapsed())
+
+        return path
+
+    def stats(self) -> dict:
+        """
+        Returns whether the profiler runs, its sampling rounds, distinct stacks and sampled seconds.
+        """
+        with self._lock:
+            return {
+                "running": self.running,
+                "samples": self.samples,
+                "stacks": len(self._stacks),
+                "seconds": (time.monotonic() if self.running else self._stopped_at) - self._started_at
+                if self._started_at else 0.0,
+            }
+
+
+class BatchTrace:
+    """
+    Time spent per pipeline stage handling one read of a sensor, from receiving the bytes to sending the replies.
+
+    Stages timed on several threads, like the windows of a read scored in parallel by the asyncio server, add up.
+
+    Attributes:
+        sensor_id (str): The sensor the read came from.
+        started (float): Epoch time the read was received.
+        packets (int): Packets decoded.
+        windows (int): Flow windows scored.
+        stages (dict[str, float]): Seconds spent per stage.
+    """
+
+    __slots__ = ("sensor_id", "started", "packets", "windows", "stages", "_started_at", "_lock")
+
+    def __init__(self, sensor_id: str):
+        self.sensor_id = sensor_id
+        self.started = time.time()
+        self.packets = 0
+        self.windows = 0
+        self.stages: dict[str, float] = {}
+        self._started_at = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        """
+        Adds time to a stage.
+        """
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def time(self, stage: str, histogram: Histogram | None = None):
+        """
+        Adds the duration of the `with` block to a stage, and observes it in a stage histogram.
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+            self.add(stage, elapsed)
+            if histogram is not None:
+                histogram.observe(elapsed)
+
+    def elapsed(self) -> float:
+        """
+        Returns the seconds since the read was received.
+        """
+        return time.perf_counter() - self._started_at
+
+
+class SlowBatchTracer:
+    """
+    Keeps the stage breakdown of every sensor read that took longer than a latency budget.
+
+    `Brain` starts a `BatchTrace` per read and finishes it once the replies are sent. Reads within `budget` are
+    dropped; slower ones are kept, the `max_traces` most recent in memory, and appended as JSON lines to `path` if
+    given, with their total time, their time per stage (decode, flows, rules, cache, inference, reply, send,
+    store, and admission when reads were held back) and the time outside the timed stages.
+
+    Args:
+        budget (float): Latency budget of a read, in seconds.
+        max_traces (int, optional): Slow reads kept in memory. Defaults to 256.
+        path (Path | str | None, optional): File the slow reads are appended to. Defaults to None.
+
+    Attributes:
+        budget (float): The latency budget; it can be changed while serving.
+        reads (int): Reads traced.
+        slow_reads (int): Reads over the budget.
+
+    Methods:
+        start(sensor_id): Returns a new trace for a read.
+        finish(trace): Keeps the trace if the read was over budget.
+        traces(limit): Returns the most recent slow reads.
+
+    Usage:
+    ```python
+    brain = Brain("127.0.0.1", 1234, tracer=SlowBatchTracer(budget=0.05, path="slow_batches.jsonl"))
+    ```
+    """
+
+    def __init__(self, budget: float, max_traces: int = 256, path: Path | str | None = None):
+        self.budget = budget
+        self.path = Path(path) if path is not None else None
+
+        self.reads = 0
+        self.slow_reads = 0
+
+        self._traces: deque[dict] = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+
+    def start(self, sensor_id: str) -> BatchTrace:
+        return BatchTrace(sensor_id)
+
+    def finish(self, trace: BatchTrace) -> dict | None:
+        """
+        Keeps the trace of a read if it took longer than the budget.
+
+        Args:
+            trace (BatchTrace): The trace of the read, once its replies are sent.
+
+        Returns:
+            dict | None: The slow read record, or None if the read was within budget.
+        """
+        total = trace.elapsed()
+
+        with self._lock:
+            self.reads += 1
+            if total <= self.budget:
+                return None
+            self.slow_reads += 1
+
+        stages = dict(trace.stages)
+        record = {
+            "started": trace.started,
+            "sensor": trace.sensor_id,
+            "packets": trace.packets,
+            "windows": trace.windows,
+            "total_seconds": total,
+            "stages": stages,
+            "other_seconds": max(0.0, total - sum(stages.values())),
+        }
+
+        with self._lock:
+            self._traces.append(record)
+            if self.path is not None:
+                with open(self.path, "a") as file:
+                    file.write(json.dumps(record) + "\n")
+
+        return record
+
+    def traces(self, limit: int | None = None) -> list[dict]:
+        """
+        Returns the most recent slow reads, oldest first.
+        """
+        with self._lock:
+            traces = list(self._traces)
+
+        return traces[-limit:] if limit else traces